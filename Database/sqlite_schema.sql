@@ -0,0 +1,75 @@
+-- SQLite version of database_setup.sql, used by the API's sqlite backend
+-- (api/db.py) and by the ETL loader (etl/load_db.py).
+--
+-- Table and column names follow database_setup.sql. Differences:
+--   * parties are known by name only (SMS bodies carry no phone number),
+--     so USERS.Full_name is the unique key and Phone_number is optional
+--   * TRANSACTIONS.Transaction_id is the API id, Type is the
+--     transaction_type and Payload keeps the full JSON record, so fields
+--     the schema does not model survive a round trip
+--   * Sender_id / Receiver_id / Category_id may be NULL when the SMS did
+--     not name the party or the record has no category
+-- Every statement is idempotent, so the script is run on every open.
+
+CREATE TABLE IF NOT EXISTS USERS (
+    User_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Phone_number TEXT UNIQUE,
+    Full_name TEXT UNIQUE NOT NULL,
+    Email TEXT,
+    Registration_date TEXT,
+    Status TEXT DEFAULT 'ACTIVE',
+    Created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    Updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS CATEGORIES (
+    Category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Category_name TEXT UNIQUE NOT NULL,
+    Description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS FEE_transaction_typeS (
+    fee_transaction_type_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_type_name TEXT,
+    fee_percentage REAL DEFAULT 0.21,
+    fixed_amount REAL,
+    min_fee REAL,
+    max_fee REAL,
+    is_active INTEGER DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS TRANSACTIONS (
+    Transaction_id INTEGER PRIMARY KEY,
+    Sender_id INTEGER REFERENCES USERS(User_id),
+    Receiver_id INTEGER REFERENCES USERS(User_id),
+    Category_id INTEGER REFERENCES CATEGORIES(Category_id),
+    Type TEXT,
+    Amount NUMERIC,
+    Transaction_transaction_type TEXT,  -- the timestamp, as in database_setup.sql
+    Transaction_status TEXT DEFAULT 'COMPLETED',
+    Payload TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS TRANSACTION_FEES (
+    transaction_fee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id INTEGER NOT NULL REFERENCES TRANSACTIONS(Transaction_id) ON DELETE CASCADE,
+    fee_transaction_type_id INTEGER NOT NULL REFERENCES FEE_transaction_typeS(fee_transaction_type_id),
+    fee_amount REAL,
+    applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_sender ON TRANSACTIONS(Sender_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_receiver ON TRANSACTIONS(Receiver_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON TRANSACTIONS(Category_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON TRANSACTIONS(Transaction_transaction_type);
+CREATE INDEX IF NOT EXISTS idx_transaction_fees_transaction ON TRANSACTION_FEES(transaction_id);
+
+INSERT OR IGNORE INTO CATEGORIES (Category_name, Description) VALUES
+('Transfer', 'Money transfer between users'),
+('Payment', 'Payment for goods or services'),
+('Withdrawal', 'Cash withdrawal from account'),
+('Deposit', 'Money deposit into account'),
+('Utility Bill', 'Utility bill payments'),
+('Airtime', 'Mobile airtime purchase'),
+('School Fees', 'School fee payments'),
+('Donation', 'Charitable donations');
@@ -1,272 +1,1157 @@
+import argparse
+import base64
+import http.client
 import json
+import math
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, urlencode, urlparse
 
 from auth import check_auth
 from pathlib import Path
-from indexer import TransactionIndex, TransactionManager
+from db import BACKENDS, TransactionStore
+from indexer import to_epoch
+from rollups import Rollups
+from metrics import NO_PHASE, Metrics, PhaseTimer, Profiler, TimedWriter, endpoint_label
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_FILE = BASE_DIR / "api_ready_transactions.json"
+DB_FILE = BASE_DIR / "transactions.db"
 
 
-def load_transactions():
-    """Load the transactions from the json file."""
-    if not DATA_FILE.exists():
-        raise FileNotFoundError(f"{DATA_FILE} not found")
-    with open(DATA_FILE, "r", encoding="utf-8") as file:
-        TRANSACTIONS = json.load(file)
-    return TRANSACTIONS
+def project(transaction, fields):
+    """Keep only the requested fields of a transaction (fields=id,amount,...)."""
+    return {field: transaction[field] for field in fields if field in transaction}
+
+
+def is_finite_number(value):
+    """True for an int or a float that is neither a bool, NaN nor infinite."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return isinstance(value, int) or math.isfinite(value)
+
+
+def encode_cursor(order, key):
+    """Opaque keyset cursor: the sort key of the last row of a page."""
+    raw = json.dumps([order, key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Returns (order, key); raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        order, key = json.loads(raw)
+    except (ValueError, TypeError) as error:
+        raise ValueError("malformed cursor") from error
+    if order in ("timestamp", "relevance"):
+        # the epoch is null for a record without a time (ordered last)
+        if not (isinstance(key, list) and len(key) == 2 and isinstance(key[1], int)
+                and (isinstance(key[0], (int, float)) or (key[0] is None and order == "timestamp"))):
+            raise ValueError("malformed cursor")
+        key = tuple(key)
+    elif not isinstance(key, int):
+        raise ValueError("malformed cursor")
+    return order, key
+
+
+# Content-codings offered, in order of preference, with the zlib wbits
+# that produce them (HTTP "deflate" is the zlib format, RFC 9110)
+CONTENT_CODINGS = {"gzip": 31, "deflate": 15}
+COMPRESSION_LEVEL = 6
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the content-coding for an Accept-Encoding header: the
+    CONTENT_CODINGS entry with the highest q-value (gzip on ties), or None
+    for identity (no header, nothing acceptable, or identity preferred).
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for name in CONTENT_CODINGS:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    if best is not None and weights.get("identity", 0.0) > best_weight:
+        return None
+    return best
+
+
+def compressor(encoding):
+    """A zlib compressor producing the given content-coding."""
+    return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, CONTENT_CODINGS[encoding])
+
+
+def cache_key(path, query_params, encoding=None):
+    """
+    Normalized cache key: the path plus the query parameters sorted by
+    name, and the negotiated content-coding (each coding is cached apart).
+    """
+    key = path + "?" + urlencode(sorted(query_params.items()), doseq=True)
+    return key if encoding is None else key + "#" + encoding
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized (possibly compressed) GET response bodies,
+    bounded in entries and bytes.
+
+    All entries belong to one dataset version (TransactionStore.version).
+    The first get or put at a newer version empties the cache, so a write
+    invalidates every cached response in O(1) and a stale body is never
+    served. Thread-safe.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # one response may take at most a quarter of the byte budget
+        self.max_entry_bytes = max_bytes // 4
+        self.version = -1
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _advance(self, version):
+        """Drop everything if `version` is newer (called under the lock)."""
+        if version > self.version:
+            self._entries.clear()
+            self.size = 0
+            self.version = version
+
+    def get(self, key, version):
+        """(body, content-coding or None) cached for key at this version, or None."""
+        with self._lock:
+            self._advance(version)
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, body, encoding=None):
+        """Cache a body computed at `version`; evicts least recently used entries."""
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._advance(version)
+            if version != self.version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (body, encoding)
+            self.size += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
 
-    
 class resourceHandler(BaseHTTPRequestHandler):
     """ handles the http requests for our transaction resource. """
     
-    # DSA: Maintain transaction index for O(1) lookups
-    index = None  # Initialized at server startup
+    # DSA: Resident store (transactions + index) loaded once at startup
+    store = TransactionStore(DATA_FILE)
+
+    # Serialized GET responses, invalidated by the store's version
+    cache = ResponseCache()
+    # (key, version, etag) while answering a cacheable GET, else None
+    cache_slot = None
+
+    # Request metrics for GET /metrics (None: disabled) and the sampling
+    # profiler (off until configured)
+    metrics = Metrics()
+    profiler = Profiler()
+    # counters of the other processes of --processes (None: single process)
+    metrics_exchange = None
+    # {phase: seconds} of the request being handled, None when not measured
+    timings = None
+    status_code = None
+    request_started = None
+
+    # HTTP/1.1 so list responses can use chunked transfer encoding; every
+    # other response carries a Content-Length
+    protocol_version = "HTTP/1.1"
+
+    # (host, port) of the writer process that mutations are passed to, in
+    # the reader processes of --processes (None: this process writes)
+    writer_address = None
+    FORWARDED_HEADERS = ("Authorization", "Content-Type", "Accept-Encoding")
+    RELAYED_HEADERS = ("Content-Type", "Content-Encoding", "Vary")
+
+    # bytes of serialized JSON buffered before each streamed chunk is sent
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    # largest request body accepted (--max-body-mb); a batch of thousands
+    # of transactions takes a few MiB
+    max_body_bytes = 64 * 1024 * 1024
+
+    # smaller JSON bodies go out uncompressed: the saving would not pay for
+    # the gzip framing and the CPU time
+    COMPRESS_MIN_BYTES = 1024
+
+    # -- instrumentation -----------------------------------------------------
+
+    def setup(self):
+        super().setup()
+        if self.metrics is not None:
+            self.wfile = TimedWriter(self.wfile, self)
 
-    def send_json(self, http_code, status="success", data=None, message=""):
+    def handle_one_request(self):
+        """Handle one request, recording its latency, status and phase times."""
+        profile = self.profiler.start()
+        self.timings = {} if self.metrics is not None else None
+        self.status_code = self.request_started = self.cache_slot = None
+        try:
+            super().handle_one_request()
+        finally:
+            if profile is not None:
+                self.profiler.stop(profile)
+            if self.timings is not None and self.request_started is not None and self.status_code is not None:
+                self.metrics.observe(self.command, endpoint_label(self.path), self.status_code,
+                                     time.perf_counter() - self.request_started, self.timings)
+            self.timings = None
+
+    def parse_request(self):
+        # the clock starts once the request line has arrived
+        self.request_started = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def phase(self, name):
+        """Context manager timing one phase of the request (see metrics.py)."""
+        return PhaseTimer(self.timings, name) if self.timings is not None else NO_PHASE
+
+    def add_phase_time(self, name, seconds):
+        if self.timings is not None:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def authorized(self):
+        with self.phase("auth"):
+            return check_auth(self.headers)
+
+    def refresh_store(self):
+        """Pick up changes another process made to the data."""
+        with self.phase("load"):
+            self.store.refresh()
+
+    def forward_write(self, body=None):
+        """
+        Pass a mutation on to the writer process and relay its response,
+        then catch up with the version it published, so the client reads
+        its own write from this process as well. 503 if the writer cannot
+        be reached (the supervisor restarts it).
+        """
+        headers = {name: self.headers[name] for name in self.FORWARDED_HEADERS if name in self.headers}
+        connection = http.client.HTTPConnection(*self.writer_address, timeout=30)
+        try:
+            with self.phase("index"):
+                connection.request(self.command, self.path, body, headers)
+                response = connection.getresponse()
+                payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.send_status(503, b"Writer unavailable", {"Retry-After": "1"})
+            return
+        finally:
+            connection.close()
+        self.refresh_store()
+        self.send_status(response.status, payload,
+                         {name: response.getheader(name) for name in self.RELAYED_HEADERS
+                          if response.getheader(name) is not None})
+
+    def end_headers(self):
+        # one request per connection: a worker thread is never parked on
+        # an idle keep-alive socket (see PooledHTTPServer)
+        self.send_header("Connection", "close")
+        super().end_headers()
+
+    def send_status(self, http_code, body=b"", headers=None):
+        """Send a short plain response (errors, 401) with a correct Content-Length."""
+        self.send_response(http_code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def send_text(self, http_code, text, content_type="text/plain; charset=utf-8"):
+        self.send_status(http_code, text.encode("utf-8"), {"Content-Type": content_type})
+
+    def accepted_encoding(self):
+        """Content-coding negotiated from the request's Accept-Encoding (None: identity)."""
+        return negotiate_encoding(self.headers.get("Accept-Encoding"))
+
+    def encode_body(self, body):
+        """
+        Returns (payload, content-coding or None): the body compressed with
+        the negotiated coding, or unchanged below COMPRESS_MIN_BYTES.
+        """
+        encoding = self.accepted_encoding()
+        if encoding is None or len(body) < self.COMPRESS_MIN_BYTES:
+            return body, None
+        compress = compressor(encoding)
+        return compress.compress(body) + compress.flush(), encoding
+
+    def send_json_headers(self, http_code, encoding=None, headers=None):
+        """Status line and the headers shared by every JSON response (not ended)."""
         self.send_response(http_code)
         self.send_header("Content-Type", "application/json")
+        # the body depends on Accept-Encoding, so shared caches must key on it
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+    def send_body(self, http_code, body, headers=None, encoding=None):
+        """Send a complete JSON payload (already in `encoding`) with a Content-Length."""
+        self.send_json_headers(http_code, encoding, headers)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
+        self.wfile.write(body)
 
+    def send_json(self, http_code, status="success", data=None, message="", **extra):
         response = {
             "status": status,
             "data": data,
             "message": message
         }
-        self.wfile.write(json.dumps(response).encode("utf-8"))
-    
+        # optional top-level fields such as the query plan
+        response.update(extra)
+        with self.phase("serialize"):
+            body, encoding = self.encode_body(json.dumps(response).encode("utf-8"))
+
+        slot = self.cacheable_slot(http_code)
+        if slot is None:
+            self.send_body(http_code, body, encoding=encoding)
+            return
+        key, version, etag = slot
+        self.cache.put(key, version, body, encoding)
+        self.send_body(http_code, body, {"ETag": etag}, encoding)
+
+    # -- response cache ------------------------------------------------------
+
+    def etag(self, version, encoding=None):
+        """
+        Strong ETag of every GET response at a dataset version: the same
+        URL, version and negotiated coding always produce the same bytes.
+        """
+        tag = f"{self.store.instance}-{version}"
+        return f'"{tag}"' if encoding is None else f'"{tag}-{encoding}"'
+
+    def not_modified(self, etag):
+        """True if the request's If-None-Match matches etag (weak comparison, RFC 9110)."""
+        header = self.headers.get("If-None-Match")
+        if header is None:
+            return False
+        tags = [tag.strip() for tag in header.split(",")]
+        return "*" in tags or etag in tags or "W/" + etag in tags
+
+    def serve_cached(self, path, query_params):
+        """
+        Answer a cacheable GET without running it when possible: 304 if the
+        client's copy is current, else the cached body. Returns True if a
+        response was sent.
+
+        Otherwise records cache_slot, so the 200 response generated next is
+        tagged with the ETag and cached.
+        """
+        self.refresh_store()
+        version = self.store.version
+        encoding = self.accepted_encoding()
+        etag = self.etag(version, encoding)
+        if self.not_modified(etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return True
+
+        key = cache_key(path, query_params, encoding)
+        entry = self.cache.get(key, version)
+        if entry is not None:
+            body, body_encoding = entry
+            self.send_body(200, body, {"ETag": etag}, body_encoding)
+            return True
+        self.cache_slot = (key, version, etag)
+        return False
+
+    def cacheable_slot(self, http_code):
+        """
+        cache_slot if the response about to be sent may be tagged and cached:
+        a 200 to a cacheable GET, with no write since serve_cached() (writes
+        bump the version under the write lock, so an unchanged version means
+        the data read in between belonged to it).
+        """
+        slot = self.cache_slot
+        if http_code != 200 or slot is None or self.store.version != slot[1]:
+            return None
+        return slot
+
+    def _write_chunk(self, payload):
+        if payload:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+
+    def send_json_stream(self, http_code, items, message="", fields=None, **extra):
+        """
+        Stream {"status", "data": [...], "message", ...} without building it in memory.
+
+        Records are serialized one by one (optionally projected to `fields`)
+        and flushed in STREAM_CHUNK_SIZE pieces using chunked transfer
+        encoding, so time-to-first-byte and peak memory do not grow with the
+        result size. HTTP/1.0 clients get the same bytes delimited by the
+        connection close instead.
+
+        With a negotiated content-coding every piece goes through one
+        compressor, sync-flushed per chunk so the client can decode as the
+        bytes arrive. Headers wait for the first piece: a response that is
+        complete and below COMPRESS_MIN_BYTES by then is sent uncompressed.
+        """
+        stream_started = time.perf_counter()
+        written = self.timings.get("write", 0.0) if self.timings is not None else 0.0
+        chunked = self.request_version != "HTTP/1.0"
+        send = self._write_chunk if chunked else self.wfile.write
+        slot = self.cacheable_slot(http_code)
+        accepted = self.accepted_encoding()
+        encoding = None
+        compress = None
+
+        # keep a copy of what is sent for the cache, unless it grows too large
+        captured = [] if slot is not None else None
+        captured_size = 0
+        started = False
+
+        def write(payload, final=False):
+            nonlocal started, encoding, compress, captured, captured_size
+            if not started:
+                started = True
+                if accepted is not None and (not final or len(payload) >= self.COMPRESS_MIN_BYTES):
+                    encoding = accepted
+                    compress = compressor(encoding)
+                self.send_json_headers(http_code, encoding, {"ETag": slot[2]} if slot is not None else None)
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+            if compress is not None:
+                payload = compress.compress(payload) + compress.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+            send(payload)
+            if captured is not None:
+                captured_size += len(payload)
+                if captured_size > self.cache.max_entry_bytes:
+                    captured = None
+                else:
+                    captured.append(payload)
+
+        buffer = [b'{"status": "success", "data": [']
+        size = len(buffer[0])
+        for position, tx in enumerate(items):
+            if fields is not None:
+                tx = project(tx, fields)
+            piece = (b", " if position else b"") + json.dumps(tx).encode("utf-8")
+            buffer.append(piece)
+            size += len(piece)
+            if size >= self.STREAM_CHUNK_SIZE:
+                write(b"".join(buffer))
+                buffer = []
+                size = 0
+
+        trailer = {"message": message}
+        trailer.update(extra)
+        buffer.append(b"], " + json.dumps(trailer).encode("utf-8")[1:])
+        write(b"".join(buffer), final=True)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        if captured is not None:
+            key, version, _ = slot
+            self.cache.put(key, version, b"".join(captured), encoding)
+        if self.timings is not None:
+            # everything but the socket writes: lazy materialization, JSON, compression
+            self.add_phase_time("serialize", time.perf_counter() - stream_started
+                                - (self.timings.get("write", 0.0) - written))
 
+    # query parameters that are options or range bounds, not equality filters
+    RANGE_PARAMS = {"min_amount": "amount", "max_amount": "amount", "from": "timestamp", "to": "timestamp"}
+    OPTION_PARAMS = {"explain", "limit", "cursor", "fields", "order"}
+
+    def build_query(self, query_params):
+        """
+        Translate query parameters into planner predicates.
+
+        min_amount/max_amount and from/to become range predicates, q a
+        full-text search of the descriptions, every other parameter an
+        equality predicate (all ANDed together).
+        Returns (equals, ranges, text). Raises ValueError on a malformed bound.
+        """
+        equals = {}
+        ranges = {}
+        text = None
+        for key, values in query_params.items():
+            value = values[0]
+            if key in self.OPTION_PARAMS:
+                continue
+            if key == "q":
+                text = value
+                continue
+            if key not in self.RANGE_PARAMS:
+                equals[key] = value
+                continue
+            field = self.RANGE_PARAMS[key]
+            if field == "amount":
+                bound = float(value)
+                if not math.isfinite(bound):
+                    raise ValueError(f"invalid {key}: {value}")
+            else:
+                bound = to_epoch(value)
+                if bound is None:
+                    raise ValueError(f"invalid {key} timestamp: {value}")
+            low, high = ranges.get(field, (None, None))
+            if key in ("min_amount", "from"):
+                low = bound
+            else:
+                high = bound
+            ranges[field] = (low, high)
+        return equals, ranges, text
+
+    def build_page(self, query_params):
+        """
+        Read the pagination/projection options.
+
+        - order: "id", "timestamp" or, with q, "relevance" (the default with q,
+          otherwise "id")
+        - limit: page size (default: no limit)
+        - cursor: opaque keyset cursor returned as next_cursor by the previous page
+        - fields: comma separated list of fields to return
+
+        Returns (order, after, limit, fields). Raises ValueError on bad input.
+        """
+        order = query_params.get("order", ["relevance" if "q" in query_params else "id"])[0]
+        if order not in ("id", "timestamp", "relevance"):
+            raise ValueError(f"cannot order by {order}")
+
+        limit = None
+        if "limit" in query_params:
+            limit = int(query_params["limit"][0])
+            if limit < 1:
+                raise ValueError("limit must be positive")
+
+        after = None
+        if "cursor" in query_params:
+            cursor_order, after = decode_cursor(query_params["cursor"][0])
+            if cursor_order != order:
+                raise ValueError("cursor does not match order")
+
+        fields = None
+        if "fields" in query_params:
+            fields = [field for field in query_params["fields"][0].split(",") if field]
+
+        return order, after, limit, fields
 
     def do_GET(self):
         """ handles Get requests"""
 
-        if not check_auth(self.headers):
-            self.send_response(401)
-            self.send_header("WWW-Authenticate", 'Basic realm="Transaction Realm"')
-            self.end_headers()
-            self.wfile.write(b" Unauthorized")
+        if not self.authorized():
+            self.send_status(401, b" Unauthorized", {"WWW-Authenticate": 'Basic realm="Transaction Realm"'})
             return
     
         parsed_url = urlparse(self.path)
         path = parsed_url.path
         query_params = parse_qs(parsed_url.query)
 
+        if path == "/metrics":
+            self.handle_metrics()
+            return
+        if path == "/metrics/profile":
+            others = self.metrics_exchange.other_profiles() if self.metrics_exchange is not None else ()
+            self.send_text(200, self.profiler.report(others=others))
+            return
+
         # Support GET /transactions/<id>
         parts = path.split("/")
         if len(parts) == 3 and parts[1] == "transactions":
             try:
                 tx_id = int(parts[2])
             except ValueError:
-                self.send_response(400)
-                self.end_headers()
+                self.send_status(400)
                 return
-            try:
-                transactions = load_transactions()
-            except FileNotFoundError:
-                self.send_response(404)
-                self.end_headers()
+            if self.serve_cached(path, query_params):
                 return
-            if tx_id < 0 or tx_id >= len(transactions):
-                self.send_response(404)
-                self.end_headers()
+            # DSA: O(1) lookup by stable id
+            with self.phase("index"):
+                transaction = self.store.get(tx_id)
+            if transaction is None:
+                self.send_status(404)
                 return
-            self.send_json(200, "success", transactions[tx_id], "Transaction retrieved")
+            if "fields" in query_params:
+                transaction = project(transaction, query_params["fields"][0].split(","))
+            self.send_json(200, "success", transaction, "Transaction retrieved")
             return
 
-        # Only list endpoint remains
-        if path != "/transactions":
-            self.send_response(404)
-            self.end_headers()
-            self.wfile.write(b"Endpoint not found")
+        if path not in ("/transactions", "/stats", "/balance"):
+            self.send_status(404, b"Endpoint not found")
             return
-        
+
+        # Repeated polls are answered from the response cache (or with 304)
+        if self.serve_cached(path, query_params):
+            return
+
+        if path == "/stats":
+            self.handle_stats(query_params)
+            return
+        if path == "/balance":
+            self.handle_balance(query_params)
+            return
+
+        # DSA: Query planner ANDs every filter by intersecting sorted
+        # posting lists, smallest first (hash map, binary search and
+        # full-text indexes)
         try:
-            results = load_transactions()
-        except FileNotFoundError:
-            self.send_response(404)
-            self.end_headers()
+            equals, ranges, text = self.build_query(query_params)
+            order, after, limit, fields = self.build_page(query_params)
+            with self.phase("index"):
+                results, plan = self.store.query(equals, ranges, order, after, limit, text)
+        except ValueError as error:
+            self.send_json(400, "error", None, f"Invalid query parameter: {error}")
             return
 
-        # DSA: Use hash map index for O(1) lookups instead of O(n) linear scan
-        for key in ["transaction_type", "sender", "receiver"]:
-            if key in query_params:
-                value = query_params[key][0]
-                # O(1) average case lookup via hash map
-                results = self.index.search_by_field(key, value)
+        extra = {}
+        if plan["has_more"]:
+            extra["next_cursor"] = encode_cursor(order, plan.pop("next_after"))
+        if query_params.get("explain", ["0"])[0] not in ("", "0", "false"):
+            extra["plan"] = plan
 
-        self.send_json(200, "success", results, f"Retrieved {len(results)} transaction(s)")
+        # Stream the array: memory and time-to-first-byte stay flat
+        self.send_json_stream(200, results, f"Retrieved {len(results)} transaction(s)", fields, **extra)
     
+    def handle_stats(self, query_params):
+        """
+        GET /stats?group_by=<dimension>: count, sum, min, max and avg of
+        the amounts per group, plus the overall totals.
+
+        Dimensions: transaction_type (default), sender, receiver, day,
+        week, month. Served from the rollups kept up to date by every
+        write, so the cost is O(groups), not O(transactions).
+
+        The filters of GET /transactions narrow the statistics to the
+        matching transactions; those are aggregated per request
+        (vectorized when NumPy is installed).
+        """
+        group_by = query_params.get("group_by", ["transaction_type"])[0]
+        try:
+            equals, ranges, text = self.build_query(
+                {key: values for key, values in query_params.items() if key != "group_by"})
+            with self.phase("index"):
+                groups, totals = self.store.stats(group_by, equals, ranges, text)
+        except ValueError as error:
+            self.send_json(400, "error", None, f"Invalid query parameter: {error}")
+            return
+        self.send_json(200, "success", groups, f"Statistics for {len(groups)} group(s)",
+                       group_by=group_by, totals=totals)
+
+    BALANCE_PERIODS = ("day", "week", "month")
+
+    def balance_window(self, query_params):
+        """
+        The time window of a /balance request: at=<T> (everything up to T),
+        from/to (inclusive bounds, either may be omitted) or one period
+        day=YYYY-MM-DD, week=YYYY-Www or month=YYYY-MM (UTC).
+
+        Returns (low, high, high_inclusive). Raises ValueError on bad input.
+        """
+        periods = [period for period in self.BALANCE_PERIODS if period in query_params]
+        bounds = [key for key in ("at", "from", "to") if key in query_params]
+        if len(periods) > 1 or (periods and bounds) or ("at" in bounds and len(bounds) > 1):
+            raise ValueError("use one of at, from/to, day, week or month")
+        if periods:
+            period = periods[0]
+            key = query_params[period][0]
+            try:
+                low, high = Rollups.bucket_bounds(period, key)
+            except ValueError:
+                raise ValueError(f"invalid {period}: {key}") from None
+            return low, high, False
+        epochs = {}
+        for key in bounds:
+            epochs[key] = to_epoch(query_params[key][0])
+            if epochs[key] is None:
+                raise ValueError(f"invalid {key} timestamp: {query_params[key][0]}")
+        if "at" in epochs:
+            return None, epochs["at"], True
+        return epochs.get("from"), epochs.get("to"), True
+
+    def handle_balance(self, query_params):
+        """
+        GET /balance: the account holder's balance and money movements over
+        a time window (see balance_window): opening and closing balance,
+        inflow, outflow, net flow and fees.
+
+        Served from the ledger's prefix sums (see indexer.Ledger), so the
+        cost is O(log n) whatever the window, not a replay of the history.
+        """
+        try:
+            low, high, high_inclusive = self.balance_window(query_params)
+            with self.phase("index"):
+                summary = self.store.balance(low, high, high_inclusive)
+        except ValueError as error:
+            self.send_json(400, "error", None, f"Invalid query parameter: {error}")
+            return
+        self.send_json(200, "success", summary, "Balance computed")
+
+    def handle_metrics(self):
+        """
+        GET /metrics: request latency histograms, status counters, phase
+        times, index statistics and response cache counters in the
+        Prometheus text format (see metrics.py). With --processes, the
+        counters of every process are added up (MetricsExchange).
+        """
+        if self.metrics is None:
+            self.send_status(404, b"Metrics are disabled")
+            return
+        others = self.metrics_exchange.others() if self.metrics_exchange is not None else ()
+        self.send_text(200, self.metrics.render(self.store, self.cache, self.profiler, others),
+                       "text/plain; version=0.0.4; charset=utf-8")
+
+    def handle_profile(self, body):
+        """
+        POST /metrics/profile {"every": N}: profile one request in every N
+        from now on (0 turns the profiler off) and drop the samples so far,
+        in every process with --processes. GET /metrics/profile shows the
+        accumulated samples.
+        """
+        try:
+            every = json.loads(body)["every"]
+            if not isinstance(every, int) or isinstance(every, bool):
+                raise ValueError("every must be an integer")
+            if self.metrics_exchange is not None:
+                self.metrics_exchange.configure_profiler(every)
+            else:
+                self.profiler.configure(every)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as error:
+            self.send_json(400, "error", None, f"Invalid profiler settings: {error}")
+            return
+        message = f"Profiling one request in {every}" if every else "Profiling disabled"
+        self.send_json(200, "success", {"every": every}, message)
+
+    def read_body(self):
+        """
+        The request body, or None after answering 400 (malformed
+        Content-Length) or 413 (larger than max_body_bytes). Those answers
+        close the connection: the unread body cannot be told apart from
+        the next request.
+        """
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            if content_length < 0:
+                raise ValueError(content_length)
+        except ValueError:
+            self.send_status(400, b"Invalid Content-Length", {"Connection": "close"})
+            return None
+        if content_length > self.max_body_bytes:
+            self.send_status(413, b"Request body too large", {"Connection": "close"})
+            return None
+        return self.rfile.read(content_length)
+
     def do_POST(self):
         """ handles POST requests"""
-        if not check_auth(self.headers):
-            self.send_response(401)
-            self.end_headers()
+        if not self.authorized():
+            self.send_status(401)
             return
         
-        if self.path != "/transactions":
-            self.send_response(404)
-            self.end_headers()
+        if self.path not in ("/transactions", "/transactions/batch", "/metrics/profile"):
+            self.send_status(404)
             return
         
-        content_length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_length)
+        body = self.read_body()
+        if body is None:
+            return
+
+        if self.writer_address is not None and self.path != "/metrics/profile":
+            self.forward_write(body)
+            return
+        if self.path == "/transactions/batch":
+            self.handle_batch(body)
+            return
+        if self.path == "/metrics/profile":
+            self.handle_profile(body)
+            return
 
         try: 
             data = json.loads(body)
         except json.JSONDecodeError:
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
 
-        required_fields = ["transaction_type", "amount", "sender", "receiver", "timestamp"]
-        for field in required_fields:
-            if field not in data:
-                self.send_response(400)
-                self.end_headers()
-                return
+        error = self.validate_transaction(data)
+        if error is not None:
+            self.send_json(400, "error", None, f"Invalid transaction: {error}")
+            return
             
-        transactions = load_transactions()
-        
-        # DSA: Auto-assign next available ID
-        next_id = TransactionManager.get_next_id(transactions)
-        data["id"] = next_id
-        
-        transactions.append(data)
-
-        with open(DATA_FILE, "w", encoding="utf-8") as file:
-            json.dump(transactions, file, indent=4)
+        self.refresh_store()
         
-        # Rebuild index for consistency
-        resourceHandler.index.rebuild(transactions)
+        # DSA: Store assigns the next ID and updates the index incrementally
+        with self.phase("index"):
+            self.store.create(data)
         
         self.send_json(201, "success", data, "Transaction created")
 
 
 
+    REQUIRED_FIELDS = ["transaction_type", "amount", "sender", "receiver", "timestamp"]
+    # indexed and grouped on (or parsed, for timestamp): a list or an object cannot be
+    SCALAR_FIELDS = ["transaction_type", "sender", "receiver", "timestamp"]
+
+    def validate_transaction(self, data):
+        """Return why a new transaction is invalid, or None if it is valid."""
+        if not isinstance(data, dict):
+            return "not a JSON object"
+        missing = [field for field in self.REQUIRED_FIELDS if field not in data]
+        if missing:
+            return "missing field(s): " + ", ".join(missing)
+        return self.validate_fields(data)
+
+    def validate_fields(self, data):
+        """Return why the typed fields present in data (a new record or an update) are invalid, or None."""
+        for field in self.SCALAR_FIELDS:
+            if field in data and not (isinstance(data[field], str) or is_finite_number(data[field])):
+                return f"{field} must be a string or a number"
+        if "amount" in data and not is_finite_number(data["amount"]):
+            return "amount must be a finite number"
+        return None
+
+    def parse_batch(self, body):
+        """
+        Split a batch body into items: a JSON array, or NDJSON (one object
+        per line) when the Content-Type says so or the body is not an array.
+
+        Returns a list of (item, error) pairs; a line that is not valid JSON
+        becomes an error for that item only. Raises ValueError if a JSON
+        array body cannot be parsed at all.
+        """
+        content_type = self.headers.get("Content-Type", "")
+        if "ndjson" not in content_type and body.lstrip().startswith(b"["):
+            items = json.loads(body)
+            return [(item, None) for item in items]
+
+        parsed = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                parsed.append((json.loads(line), None))
+            except json.JSONDecodeError as e:
+                parsed.append((None, f"invalid JSON: {e.msg}"))
+        return parsed
+
+    def handle_batch(self, body):
+        """
+        POST /transactions/batch: create many transactions in one commit.
+
+        Every item is validated (validate_transaction); the valid ones get
+        consecutive ids and are indexed and persisted together
+        (TransactionStore.create_many). The response lists one result per
+        input item, in order: {"index", "status": 201, "id"} or
+        {"index", "status": 400, "error"}. The HTTP status is 201 if every
+        item was created, 207 if only some were and 400 if none were.
+        """
+        try:
+            parsed = self.parse_batch(body)
+        except ValueError:
+            self.send_status(400)
+            return
+
+        results = []
+        valid = []
+        for position, (item, error) in enumerate(parsed):
+            error = error or self.validate_transaction(item)
+            if error is None:
+                valid.append(item)
+                results.append({"index": position, "status": 201})
+            else:
+                results.append({"index": position, "status": 400, "error": error})
+
+        if valid:
+            self.refresh_store()
+            with self.phase("index"):
+                created = iter(self.store.create_many(valid))
+            for result in results:
+                if result["status"] == 201:
+                    result["id"] = next(created)["id"]
+
+        if not valid:
+            code, status = 400, "error"
+        elif len(valid) == len(results):
+            code, status = 201, "success"
+        else:
+            code, status = 207, "partial"
+        self.send_json(code, status, results,
+                       f"Created {len(valid)} of {len(results)} transaction(s)")
+
     def do_PUT(self):
         """ handles PUT requests"""
-        if not check_auth(self.headers):
-            self.send_response(401)
-            self.end_headers()
+        if not self.authorized():
+            self.send_status(401)
             return
     
         parts = self.path.split("/")
         if len(parts) != 3 or parts[1] != "transactions":
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
     
         try:
             tx_id = int(parts[2])
         except ValueError:
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
     
-        content_length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_length)
+        body = self.read_body()
+        if body is None:
+            return
 
+        if self.writer_address is not None:
+            self.forward_write(body)
+            return
         try:
             updates = json.loads(body)
         except json.JSONDecodeError:
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
-    
-        try:
-            transactions = load_transactions()
-        except FileNotFoundError:
-            self.send_response(404)
-            self.end_headers()
+
+        error = "not a JSON object" if not isinstance(updates, dict) else self.validate_fields(updates)
+        if error is not None:
+            self.send_json(400, "error", None, f"Invalid update: {error}")
             return
+    
+        self.refresh_store()
         
+        # journal the change and re-index only the touched buckets
+        with self.phase("index"):
+            updated_tx = self.store.update(tx_id, updates)
+
         # validation of transaction id
-        if tx_id >= len(transactions) or tx_id < 0:
-            self.send_response(404)
-            self.end_headers()
+        if updated_tx is None:
+            self.send_status(404)
             return
-        
-        try:
-            transactions[tx_id].update(updates)
-        except IndexError:
-            self.send_response(404)
-            self.end_headers()
-            return
-        
-        #save it back to file
-    
-        with open(DATA_FILE, "w", encoding="utf-8") as file:
-            json.dump(transactions, file, indent=4)
-        
-        # Rebuild index for consistency
-        resourceHandler.index.rebuild(transactions)
 
-        self.send_json(200, "success", transactions[tx_id], "Transaction updated")
+        self.send_json(200, "success", updated_tx, "Transaction updated")
 
     def do_DELETE(self):
         """ handles DELETE requests"""
-        if not check_auth(self.headers):
-            self.send_response(401)
-            self.end_headers()
+        if not self.authorized():
+            self.send_status(401)
             return
         
         parts = self.path.split("/")
         if len(parts) != 3 or parts[1] != "transactions":
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
         
         try:
             tx_id = int(parts[2])
         except ValueError:
-            self.send_response(400)
-            self.end_headers()
+            self.send_status(400)
             return
-        
-        try:
-            transactions = load_transactions()
-        except FileNotFoundError:
-            self.send_response(404)
-            self.end_headers()
+
+        if self.writer_address is not None:
+            self.forward_write()
             return
+        self.refresh_store()
+        with self.phase("index"):
+            deleted_tx = self.store.delete(tx_id)
+
         # validation of transaction id
-        if tx_id >= len(transactions) or tx_id < 0:
-            self.send_response(404)
-            self.end_headers()
+        if deleted_tx is None:
+            self.send_status(404)
             return
-        deleted_tx = transactions.pop(tx_id)
-
-        with open(DATA_FILE, "w", encoding="utf-8") as file:
-            json.dump(transactions, file, indent=4)
-        
-        # Rebuild index for consistency
-        resourceHandler.index.rebuild(transactions)
 
         self.send_json(200, "success", deleted_tx, "Transaction deleted")
         
 
         
-def run():
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that handles each connection on a bounded thread pool.
+
+    Unlike ThreadingHTTPServer (one new thread per connection) at most
+    `workers` requests run at once. When all workers are busy the accept
+    loop waits, so further connections queue in the kernel listen backlog
+    (`backlog`) instead of piling up threads.
+
+    With reuse_port, several processes can listen on the same port and
+    the kernel spreads the connections over them (SO_REUSEPORT). A
+    listening socket created elsewhere can be served instead (sock).
+    """
+
+    def __init__(self, server_address, handler_class, workers=8, backlog=128, reuse_port=False, sock=None):
+        # read by server_activate() -> listen(), so set before binding
+        self.request_queue_size = backlog
+        self.reuse_port = reuse_port
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        super().__init__(server_address, handler_class, bind_and_activate=sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+            self.server_name, self.server_port = self.server_address[:2]
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request_thread, request, client_address)
+        except RuntimeError:
+            # pool already shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def run(port=8000, workers=8, backlog=128, backend="json", path=None, cache_entries=256, cache_mb=32,
+        metrics=True, profile_every=0, engine="threads", idle_timeout=75.0, snapshot=True, processes=0,
+        max_body_mb=64):
     """ run the server """ 
-    # DSA: Initialize transaction index at server startup
+    resourceHandler.max_body_bytes = max_body_mb * 1024 * 1024
+    if backend != "json" or path is not None:
+        default_path = DATA_FILE if backend == "json" else DB_FILE
+        resourceHandler.store = BACKENDS[backend](path or default_path)
+    if not snapshot:
+        resourceHandler.store.snapshot_path = None
+    resourceHandler.cache = ResponseCache(cache_entries, cache_mb * 1024 * 1024)
+    if not metrics:
+        resourceHandler.metrics = None
+    resourceHandler.profiler.configure(profile_every)
+
+    if processes:
+        # reader processes sharing the port and one writer (see prefork.py)
+        import prefork
+        prefork.supervise(resourceHandler, serve, processes, port=port, workers=workers, backlog=backlog,
+                          engine=engine, idle_timeout=idle_timeout)
+        return
+    serve(port=port, workers=workers, backlog=backlog, engine=engine, idle_timeout=idle_timeout)
+
+
+def serve(port=8000, workers=8, backlog=128, engine="threads", idle_timeout=75.0, reuse_port=False, sock=None):
+    """
+    Load resourceHandler.store and answer requests until interrupted, then
+    close the store. reuse_port/sock: see PooledHTTPServer (sock: threads
+    engine only).
+    """
+    # DSA: Load the dataset and its index once; requests are served from memory
     try:
-        transactions = load_transactions()
-        resourceHandler.index = TransactionIndex(transactions)
+        transactions = resourceHandler.store.load()
         print(f"Index initialized with {len(transactions)} transactions")
     except FileNotFoundError:
         print("Warning: Data file not found. Index will be initialized on first request.")
-        resourceHandler.index = TransactionIndex([])
-    
-    server_address = ("", 8000)
-    httpd = HTTPServer(server_address, resourceHandler)
-    print("Starting server on port 8000...")
-    httpd.serve_forever()
-
-if __name__ == "__main__":
-    run() 
 
+    # Batch journal fsyncs and compact the journal in the background
+    resourceHandler.store.start()
 
+    if engine == "asyncio":
+        # persistent connections on one event loop (see async_server.py)
+        import async_server
+        print(f"Starting asyncio server on port {port} with {workers} worker thread(s)...")
+        try:
+            async_server.serve(resourceHandler, port=port, workers=workers, backlog=backlog,
+                               idle_timeout=idle_timeout, reuse_port=reuse_port)
+        finally:
+            resourceHandler.store.close()
+        return
 
+    server_address = ("", port)
+    httpd = PooledHTTPServer(server_address, resourceHandler, workers=workers, backlog=backlog,
+                             reuse_port=reuse_port, sock=sock)
+    print(f"Starting server on port {httpd.server_port} with {workers} worker thread(s)...")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        resourceHandler.store.close()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transaction API server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8, help="maximum concurrent requests")
+    parser.add_argument("--backlog", type=int, default=128, help="listen backlog for waiting connections")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="one request per connection on a thread pool, or keep-alive connections "
+                             "on an asyncio event loop")
+    parser.add_argument("--idle-timeout", type=float, default=75.0,
+                        help="seconds an idle keep-alive connection is kept open (asyncio engine)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="json",
+                        help="storage backend: JSON file + journal, or SQLite")
+    parser.add_argument("--db", type=Path, default=None,
+                        help="data file (default: api_ready_transactions.json / transactions.db)")
+    parser.add_argument("--cache-entries", type=int, default=256, help="GET responses kept in the response cache")
+    parser.add_argument("--cache-mb", type=int, default=32, help="memory budget of the response cache, in MiB")
+    parser.add_argument("--max-body-mb", type=int, default=64,
+                        help="largest request body accepted, in MiB (larger ones get 413)")
+    parser.add_argument("--no-metrics", action="store_true", help="do not record request metrics (GET /metrics)")
+    parser.add_argument("--profile-every", type=int, default=0, metavar="N",
+                        help="profile one request in every N (0: off; see POST /metrics/profile)")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="always parse the data file; do not read or write its binary snapshot")
+    parser.add_argument("--processes", type=int, default=0, metavar="N",
+                        help="serve from N reader processes sharing the port (SO_REUSEPORT) and one writer "
+                             "process, under a supervisor that restarts them (0: one process)")
+    args = parser.parse_args()
+    if args.processes < 0:
+        parser.error("--processes must not be negative")
+    if args.processes:
+        import prefork
+        if not prefork.supported():
+            parser.error("--processes needs os.fork and SO_REUSEPORT (Linux, BSD, macOS)")
+        if args.backend != "json":
+            parser.error("--processes needs the json backend (replicas follow its journal)")
+    run(port=args.port, workers=args.workers, backlog=args.backlog, backend=args.backend, path=args.db,
+        cache_entries=args.cache_entries, cache_mb=args.cache_mb,
+        metrics=not args.no_metrics, profile_every=args.profile_every,
+        engine=args.engine, idle_timeout=args.idle_timeout, snapshot=not args.no_snapshot,
+        processes=args.processes, max_body_mb=args.max_body_mb)
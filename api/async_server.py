@@ -0,0 +1,256 @@
+"""
+asyncio serving engine for the request handler of app.py (`--engine asyncio`).
+
+PooledHTTPServer gives every connection a worker thread for as long as
+it is open, and answers one request per connection. Here one event loop
+owns every socket instead:
+
+- connections are persistent (HTTP/1.1 keep-alive): a client such as a
+  dashboard polling every few seconds pays for one TCP handshake, not one
+  per request, and an idle connection costs a few KiB of buffers, no thread
+- pipelined requests are read from the connection's buffer one after the
+  other and answered in order
+- a connection that sends nothing for `idle_timeout` seconds is closed
+
+Each request is still answered by the handler class of app.py (routing,
+auth, caching, the CRUD logic), run on a bounded thread pool because the
+store is synchronous and guarded by a reader-writer lock. The handler
+gets the raw request as its rfile and a wfile that passes the response
+to the event loop; large (streamed) responses are handed over in pieces
+and wait for the socket to drain, so a slow client cannot make the
+server buffer an unbounded amount.
+"""
+
+import asyncio
+import io
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from metrics import TimedWriter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# request line plus headers; larger heads are rejected with 431
+MAX_HEAD_BYTES = 64 * 1024
+# response bytes buffered by a handler before they are passed to the loop
+FLUSH_BYTES = 64 * 1024
+
+
+class KeepAliveMixin:
+    """
+    Mixed into the app's handler class: keeps connections open (HTTP/1.1
+    keep-alive) instead of sending "Connection: close", for requests that
+    do not ask for the connection to be closed.
+    """
+
+    idle_timeout = 75.0
+
+    def end_headers(self):
+        if self.request_version == "HTTP/1.0":
+            # a streamed HTTP/1.0 response is delimited by closing the connection
+            self.close_connection = True
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        else:
+            self.send_header("Keep-Alive", f"timeout={int(self.idle_timeout)}")
+        # skip the "Connection: close" of the app's handler
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def handle_expect_100(self):
+        # the connection loop sent 100 Continue before reading the body
+        return True
+
+
+class _ResponseWriter:
+    """
+    wfile of a handler running on a worker thread. Buffers the response;
+    once FLUSH_BYTES are pending they are written by the event loop and
+    the worker waits for the transport to drain (backpressure). The rest
+    is taken by the connection loop when the request is done.
+    """
+
+    def __init__(self, loop, stream):
+        self.loop = loop
+        self.stream = stream
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= FLUSH_BYTES:
+            pending = bytes(self.buffer)
+            self.buffer.clear()
+            asyncio.run_coroutine_threadsafe(self._send(pending), self.loop).result()
+        return len(data)
+
+    async def _send(self, data):
+        self.stream.write(data)
+        await self.stream.drain()
+
+    def flush(self):
+        pass
+
+    def take(self):
+        pending = bytes(self.buffer)
+        self.buffer.clear()
+        return pending
+
+
+def _head_fields(head):
+    """(content length, expects 100-continue, has a Transfer-Encoding) of a request head."""
+    length = 0
+    expect_continue = False
+    transfer_encoding = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value.strip())
+            if length < 0:
+                raise ValueError("negative Content-Length")
+        elif name == b"expect":
+            expect_continue = value.strip().lower() == b"100-continue"
+        elif name == b"transfer-encoding":
+            transfer_encoding = True
+    return length, expect_continue, transfer_encoding
+
+
+class AsyncHTTPServer:
+    """
+    Serves `handler_class` (a BaseHTTPRequestHandler, see app.py) with
+    persistent connections on one event loop. At most `workers` requests
+    are handled at once; any number of connections may be open.
+    """
+
+    def __init__(self, handler_class, host="", port=8000, workers=8, backlog=128, idle_timeout=75.0,
+                 reuse_port=False):
+        self.handler_class = type(handler_class.__name__, (KeepAliveMixin, handler_class),
+                                  {"idle_timeout": idle_timeout})
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.idle_timeout = idle_timeout
+        # share the port with other processes (SO_REUSEPORT, app.py --processes)
+        self.reuse_port = reuse_port
+        self.connections = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        self._server = None
+
+    async def serve_forever(self):
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host or None, self.port, backlog=self.backlog, limit=MAX_HEAD_BYTES,
+            reuse_port=self.reuse_port or None)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername") or ("", 0)
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except asyncio.LimitOverrunError:
+                    writer.write(b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+                                 b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # tolerate empty lines before a request line (RFC 9112 2.2)
+                head = head.lstrip(b"\r\n")
+                if not head:
+                    continue
+
+                try:
+                    length, expect_continue, transfer_encoding = _head_fields(head)
+                except ValueError:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    break
+                if transfer_encoding:
+                    # request bodies must carry a Content-Length
+                    writer.write(b"HTTP/1.1 411 Length Required\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    break
+                if length > self.handler_class.max_body_bytes:
+                    # refused before it is buffered (see resourceHandler.read_body)
+                    writer.write(b"HTTP/1.1 413 Request Entity Too Large\r\n"
+                                 b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+                    break
+                if expect_continue and length:
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                response = _ResponseWriter(loop, writer)
+                try:
+                    keep_alive = await loop.run_in_executor(
+                        self._pool, self._handle, head + body, peer, response)
+                except ConnectionError:
+                    break
+                writer.write(response.take())
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _handle(self, request, peer, response):
+        """Answer one request on a worker thread. Returns True to keep the connection open."""
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = peer
+        handler.request = None
+        handler.close_connection = True
+        handler.rfile = io.BytesIO(request)
+        handler.wfile = response if handler.metrics is None else TimedWriter(response, handler)
+        try:
+            handler.handle_one_request()
+        except ConnectionError:
+            raise
+        except Exception:
+            # same as socketserver's handle_error: log, then drop the connection
+            print(f"Error while handling a request from {peer}:", file=sys.stderr)
+            traceback.print_exc()
+            return False
+        return not handler.close_connection
+
+
+def raise_open_files_limit():
+    """Raise the soft limit of open files to the hard limit: every connection is a descriptor."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def serve(handler_class, port=8000, workers=8, backlog=128, idle_timeout=75.0, reuse_port=False):
+    """Run an AsyncHTTPServer until interrupted."""
+    raise_open_files_limit()
+    server = AsyncHTTPServer(handler_class, port=port, workers=workers, backlog=backlog,
+                             idle_timeout=idle_timeout, reuse_port=reuse_port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
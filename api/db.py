@@ -0,0 +1,761 @@
+"""
+Resident transaction store shared by every request handler.
+
+The dataset is parsed once when the server starts and kept in memory
+together with its TransactionIndex. A cheap fingerprint (mtime, size) of
+the JSON file is checked on access so the store only re-reads the file
+when it was really changed on disk by someone else.
+
+Mutations are not written back by rewriting the JSON file. They are
+appended to a journal (see journal.py) and a background thread folds the
+journal into api_ready_transactions.json from time to time (compaction).
+
+After each compaction, and at shutdown, the index is also saved as a
+binary snapshot (see snapshot.py) next to the data file. A start or
+reload opens the snapshot instead of parsing the file whenever it was
+taken of the file as it is on disk (same fingerprint), then replays the
+journal on top.
+
+SqliteTransactionStore keeps the same in-memory view but persists it in
+an embedded SQLite database (Database/sqlite_schema.sql) instead; BACKENDS
+maps the names accepted by `app.py --backend` to the store classes.
+
+With `app.py --processes` one process owns the TransactionStore (the
+writer) and the others serve reads from a ReplicaTransactionStore each,
+kept up to date through the journal and a SharedVersion.
+"""
+
+import json
+import mmap
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+
+from indexer import TransactionIndex, TransactionManager
+from journal import JournalTail, TransactionJournal, apply_entries, fold_entries
+from locks import ReadWriteLock
+from snapshot import Snapshot, SnapshotWriter
+from sqlite_schema import (DELETE_TRANSACTION_SQL, SCHEMA_FILE, UPSERT_TRANSACTION_SQL, UPSERT_USER_SQL,
+                           transaction_row)
+
+
+class SharedVersion:
+    """
+    Dataset version of a store, shared by the processes of app.py --processes.
+
+    It lives in an anonymous shared mapping, so it must be created before
+    the processes are forked. Only the writer process advances it:
+
+    - version: bumped by every write and reload; every process serves
+      (ETags, response cache) at this version
+    - rotations: bumped when compaction rotates the journal, so replicas
+      follow the journal to the new file
+    - compactions: bumped when the rotated journal has been folded into
+      the data file and dropped
+    - reloads: bumped when the writer re-read a data file changed by
+      someone else; replicas load it too
+
+    A sequence number, odd while an update is being written, tells a
+    reader that anything changed with one 8-byte read, and lets read()
+    return the counters consistently without a lock (a seqlock).
+    """
+
+    LAYOUT = struct.Struct("=5Q")
+    SEQUENCE = struct.Struct("=Q")
+
+    def __init__(self):
+        self._map = mmap.mmap(-1, self.LAYOUT.size)
+        # publishers of the writer process (request threads, compactor)
+        self._lock = threading.Lock()
+
+    @property
+    def sequence(self) -> int:
+        return self.SEQUENCE.unpack_from(self._map)[0]
+
+    def read(self) -> Tuple[int, int, int, int, int]:
+        """(sequence, version, rotations, compactions, reloads), never torn."""
+        while True:
+            state = self.LAYOUT.unpack_from(self._map)
+            if state[0] % 2 == 0 and self.sequence == state[0]:
+                return state
+            os.sched_yield()
+
+    def advance(self, version: int = 1, rotations: int = 0, compactions: int = 0, reloads: int = 0) -> int:
+        """Add to the counters (writer process only). Returns the new version."""
+        with self._lock:
+            state = self.LAYOUT.unpack_from(self._map)
+            sequence = state[0]
+            self.SEQUENCE.pack_into(self._map, 0, sequence + 1)
+            counters = [count + step for count, step in zip(state[1:], (version, rotations, compactions, reloads))]
+            self.LAYOUT.pack_into(self._map, 0, sequence + 1, *counters)
+            self.SEQUENCE.pack_into(self._map, 0, sequence + 2)
+            return counters[0]
+
+
+class TransactionStore:
+    """
+    Process-wide, in-memory view of api_ready_transactions.json.
+
+    - index: TransactionIndex holding the transactions by stable id
+      (shared state: the store reads and mutates through it)
+    - next_id: id counter, so creating a record needs no O(n) max() scan
+    - journal: append-only log of every create/update/delete
+    - version: dataset version, bumped by every mutation and reload (under
+      the write lock), so a response computed at one version can be
+      cached until the next; instance tells this process's versions apart
+      from another's (or a restarted one's)
+    - shared: SharedVersion the version and journal changes are published
+      to, in the writer process of app.py --processes (None: single process)
+
+    Reads are served from memory. The file is only parsed again when its
+    fingerprint no longer matches the one recorded at the last load or
+    compaction, and not at all when the snapshot (snapshot_path; None:
+    snapshots disabled) was taken of the file with that fingerprint.
+    """
+
+    def __init__(self, path: Path, compact_threshold: int = 1000, compact_interval: float = 30.0,
+                 snapshot: bool = True):
+        self.path = Path(path)
+        self.journal_path = self.path.with_suffix(".journal")
+        self.snapshot_path: Optional[Path] = self.path.with_suffix(".snapshot") if snapshot else None
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.index = TransactionIndex([])
+        self.next_id = 0
+        self.version = 0
+        self.instance = secrets.token_hex(4)
+        self.shared: Optional[SharedVersion] = None
+        self.journal: Optional[TransactionJournal] = None
+        self._fingerprint: Optional[Tuple[int, int]] = None
+        # fingerprint of the data file the snapshot on disk was taken of
+        self._snapshot_fingerprint: Optional[Tuple[int, int]] = None
+        self._needs_compaction = False
+        # Readers share the lock, writers (mutations, reload) are exclusive
+        self.lock = ReadWriteLock()
+        self._compact_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def _stat_fingerprint(self) -> Optional[Tuple[int, int]]:
+        """Return (mtime_ns, size) of the data file, or None if it is missing."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _open_journal(self) -> TransactionJournal:
+        if self.journal is None:
+            self.journal = TransactionJournal(self.journal_path)
+        return self.journal
+
+    def load(self) -> Sequence[Dict[str, Any]]:
+        """
+        Load the data file (from its snapshot when there is a valid one),
+        replay the journal on top and rebuild the index.
+        """
+        with self.lock.write():
+            transactions = self._load_locked()
+            if self.shared is not None:
+                if self.journal.repaired:
+                    # a restarted writer cut a torn line the replicas may
+                    # have read past: they must load the journal again
+                    self._publish(version=0, reloads=1)
+                else:
+                    # the version the other processes serve the same data at
+                    self.version = self.shared.read()[1]
+            return transactions
+
+    def _load_locked(self) -> Sequence[Dict[str, Any]]:
+        journal = self._open_journal()
+        fingerprint = self._stat_fingerprint()
+        if fingerprint is not None and self._load_snapshot(fingerprint):
+            if self._apply_entries(journal.replay()):
+                self._needs_compaction = True
+            ids = self.index.ids
+            self.next_id = ids[-1] + 1 if ids else 0
+            self.version += 1
+            self._fingerprint = fingerprint
+            return self.index.data.values()
+
+        if fingerprint is None:
+            if not journal.path.exists() and not journal.rotated_path.exists():
+                raise FileNotFoundError(f"{self.path} not found")
+            transactions = []
+        else:
+            with open(self.path, "r", encoding="utf-8") as file:
+                transactions = json.load(file)
+
+        # Every record needs a unique, stable id: the index and the
+        # journal are keyed by it
+        if self._normalize_ids(transactions):
+            self._needs_compaction = True
+
+        entries = list(journal.replay())
+        if entries:
+            transactions = apply_entries(transactions, entries)
+            self._needs_compaction = True
+
+        self.index.rebuild(transactions)
+        self.next_id = TransactionManager.get_next_id(transactions)
+        self.version += 1
+        self._fingerprint = fingerprint
+        return transactions
+
+    def _apply_entries(self, entries: Iterable[Dict[str, Any]]) -> bool:
+        """
+        Apply journal entries' net effect through the incremental index
+        updates. Returns False if there were none.
+        """
+        latest = fold_entries(entries)
+        records = [tx for tx in latest.values() if tx is not None]
+        if len(records) * 256 <= len(self.index.data):
+            # a few entries (a replica keeping up): O(log n) each, where
+            # add_many merges every structure in O(n)
+            for tx in records:
+                self.index.add(tx)
+        else:
+            self.index.add_many(records)
+        for tx_id, tx in latest.items():
+            if tx is None:
+                self.index.remove(tx_id)
+        return bool(latest)
+
+    def _load_snapshot(self, fingerprint: Tuple[int, int]) -> bool:
+        """
+        Open the snapshot into the index if it was taken of the data file
+        with this fingerprint. Returns False (index unchanged) if there is
+        none, or it is stale, damaged or incompatible.
+        """
+        if self.snapshot_path is None:
+            return False
+        try:
+            snapshot = Snapshot(self.snapshot_path)
+            if snapshot.meta.get("source") != list(fingerprint):
+                return False
+            self.index.load_snapshot(snapshot)
+        except (OSError, ValueError, KeyError):
+            # SnapshotError (a ValueError) included: parse the data file instead
+            return False
+        self._snapshot_fingerprint = fingerprint
+        return True
+
+    def _write_snapshot(self, index_snapshot: SnapshotWriter, fingerprint: Tuple[int, int]) -> bool:
+        """Write a snapshot of the index, taken of the data file with this fingerprint."""
+        try:
+            index_snapshot.write(self.snapshot_path, {"source": list(fingerprint)})
+        except OSError:
+            # the snapshot is only a cache: the next start parses the data file
+            return False
+        self._snapshot_fingerprint = fingerprint
+        return True
+
+    def save_snapshot(self) -> bool:
+        """
+        Snapshot the index if the snapshot on disk is not of the current
+        data file (compact() takes one whenever it writes the file). Only
+        done while the index holds exactly the file, with no journal
+        entries on top. Returns True if a snapshot was written.
+        """
+        if self.snapshot_path is None:
+            return False
+        with self._compact_lock:
+            journal = self._open_journal()
+            with self.lock.read():
+                fingerprint = self._fingerprint
+                if (fingerprint is None or fingerprint == self._snapshot_fingerprint or self._needs_compaction
+                        or journal.entries or journal.rotated_path.exists()):
+                    return False
+                index_snapshot = self.index.snapshot()
+            return self._write_snapshot(index_snapshot, fingerprint)
+
+    @staticmethod
+    def _normalize_ids(transactions: List[Dict[str, Any]]) -> bool:
+        """
+        Turn numeric string ids into ints and give missing or duplicate ids a fresh one.
+
+        Returns True if any record was changed.
+        """
+        changed = False
+        seen = set()
+        pending = []
+        for tx in transactions:
+            tx_id = tx.get("id")
+            if isinstance(tx_id, str) and tx_id.isdigit():
+                tx["id"] = tx_id = int(tx_id)
+                changed = True
+            if not isinstance(tx_id, int) or tx_id in seen:
+                pending.append(tx)
+                continue
+            seen.add(tx_id)
+        next_id = max(seen, default=-1) + 1
+        for tx in pending:
+            tx["id"] = next_id
+            next_id += 1
+            changed = True
+        return changed
+
+    @property
+    def transactions(self) -> List[Dict[str, Any]]:
+        """All transactions, in insertion order."""
+        with self.lock.read():
+            records = self.index.data.values()
+        # rows are immutable: materializing them needs no lock
+        return list(records)
+
+    def get(self, tx_id: int) -> Optional[Dict[str, Any]]:
+        """O(1) lookup by stable transaction id."""
+        with self.lock.read():
+            return self.index.get(tx_id)
+
+    def query(self, equals: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+              order: str = "id", after: Any = None, limit: Optional[int] = None,
+              text: Optional[str] = None) -> Tuple[Sequence[Dict[str, Any]], Dict[str, Any]]:
+        """Run a planned multi-predicate query (see QueryPlanner) under the read lock."""
+        with self.lock.read():
+            return self.index.query(equals, ranges, order, after, limit, text)
+
+    def stats(self, group_by: str, equals: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+              text: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Per-group aggregates and overall totals: from the rollups (see
+        rollups.py), or computed over the matching transactions when
+        filters are given (see TransactionIndex.aggregate).
+        """
+        with self.lock.read():
+            if equals or ranges or text is not None:
+                return self.index.aggregate(group_by, equals, ranges, text)
+            return self.index.stats(group_by), self.index.totals()
+
+    def balance(self, low: Optional[float] = None, high: Optional[float] = None,
+                high_inclusive: bool = True) -> Dict[str, Any]:
+        """Balances, flows and fees over a time window (see TransactionIndex.balance) under the read lock."""
+        with self.lock.read():
+            return self.index.balance(low, high, high_inclusive)
+
+    def index_stats(self) -> Dict[str, Any]:
+        """Shape of the indexes and rebuild counters (see TransactionIndex.index_stats)."""
+        with self.lock.read():
+            return self.index.index_stats()
+
+    def refresh(self) -> bool:
+        """
+        Reload the file only if it changed on disk since the last load/compaction.
+
+        Complexity: O(1) stat call when nothing changed.
+        Returns True if the data was reloaded.
+        """
+        fingerprint = self._stat_fingerprint()
+        if fingerprint is None or fingerprint == self._fingerprint:
+            return False
+        with self.lock.write():
+            # another thread may have reloaded while we waited for the lock
+            if self._stat_fingerprint() == self._fingerprint:
+                return False
+            self._load_locked()
+        if self.shared is not None:
+            # the replicas load the new data too: give them a snapshot to open
+            self.save_snapshot()
+            with self.lock.write():
+                self._publish(reloads=1)
+        return True
+
+    def _publish(self, version: int = 1, rotations: int = 0, compactions: int = 0, reloads: int = 0) -> None:
+        """Bump the dataset version, and advance the SharedVersion if there is one."""
+        if self.shared is None:
+            self.version += version
+        else:
+            self.version = self.shared.advance(version, rotations, compactions, reloads)
+
+    def create(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Assign the next id, journal the new transaction and index it.
+
+        The journal is written first: if it fails (OSError), nothing is
+        indexed and the id is not used up. Raises TypeError, with nothing
+        written, if the record cannot be indexed (TransactionIndex.check).
+        Complexity: O(1) id assignment and I/O, O(log n) index update.
+        """
+        with self.lock.write():
+            data["id"] = self.next_id
+            self.index.check(data)
+            self._record("create", data["id"], data)
+            self.next_id += 1
+            self.index.add(data)
+            self._publish()
+            return data
+
+    def create_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create a batch of transactions as one unit.
+
+        Ids come from the same counter as create(). The batch is persisted
+        in a single step (_record_many) before the index is updated once
+        (TransactionIndex.add_many), so it is durable and visible all
+        together or not at all.
+        """
+        with self.lock.write():
+            for position, data in enumerate(items):
+                data["id"] = self.next_id + position
+                self.index.check(data)
+            self._record_many([("create", data["id"], data) for data in items])
+            self.next_id += len(items)
+            self.index.add_many(items)
+            self._publish()
+            return items
+
+    def update(self, tx_id: int, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Journal the transaction with its fields updated, then re-index it
+        (None if unknown). A failed journal write leaves it unchanged.
+        """
+        with self.lock.write():
+            old_tx = self.index.get(tx_id)
+            if old_tx is None:
+                return None
+            tx = dict(old_tx)
+            tx.update({k: v for k, v in updates.items() if k != "id"})
+            self.index.check(tx)
+            self._record("update", tx_id, tx)
+            self.index.update(tx_id, tx)
+            self._publish()
+            return tx
+
+    def delete(self, tx_id: int) -> Optional[Dict[str, Any]]:
+        """Journal the deletion of a transaction, then remove it (None if unknown)."""
+        with self.lock.write():
+            if tx_id not in self.index.data:
+                return None
+            self._record("delete", tx_id)
+            tx = self.index.remove(tx_id)
+            self._publish()
+            return tx
+
+    def _record(self, op: str, tx_id: int, data: Optional[Dict[str, Any]] = None) -> None:
+        """Persist one mutation (called under the write lock): append it to the journal."""
+        self._open_journal().append(op, tx_id, data)
+
+    def _record_many(self, entries: List[Tuple[str, int, Optional[Dict[str, Any]]]]) -> None:
+        """Persist a batch of mutations as one journal commit."""
+        self._open_journal().append_many(entries)
+
+    def compact(self) -> bool:
+        """
+        Fold the journal back into the data file.
+
+        The snapshot is taken and the journal rotated under the write lock;
+        the slow part (serializing, writing and fsyncing the JSON file) runs
+        outside it so requests are not blocked. Stored rows are never
+        mutated in place (see ColumnStore), so the lazy snapshot can be
+        materialized outside the lock, one record at a time. The new file
+        replaces the old one with an atomic rename, and only then is the
+        rotated journal discarded. A snapshot of the index as of the
+        rotation (the content of the new file) is taken at the same time
+        and written last.
+
+        Returns True if a new data file was written.
+        """
+        with self._compact_lock:
+            journal = self._open_journal()
+            with self.lock.write():
+                if not (journal.entries or self._needs_compaction
+                        or journal.rotated_path.exists()):
+                    return False
+                snapshot = self.index.data.values()
+                index_snapshot = self.index.snapshot() if self.snapshot_path is not None else None
+                journal.rotate()
+                self._needs_compaction = False
+                self._publish(version=0, rotations=1)
+
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                # same bytes as json.dump(list, indent=4), one record at a time
+                file.write("[")
+                for position, tx in enumerate(snapshot):
+                    file.write(",\n    " if position else "\n    ")
+                    file.write(json.dumps(tx, indent=4).replace("\n", "\n    "))
+                file.write("\n]" if len(snapshot) else "]")
+                file.flush()
+                os.fsync(file.fileno())
+
+            with self.lock.write():
+                os.replace(tmp_path, self.path)
+                self._fingerprint = fingerprint = self._stat_fingerprint()
+            journal.discard_rotated()
+            if self.shared is not None:
+                with self.lock.write():
+                    self._publish(version=0, compactions=1)
+            if index_snapshot is not None:
+                self._write_snapshot(index_snapshot, fingerprint)
+            return True
+
+    def _background(self) -> None:
+        last_compaction = time.monotonic()
+        while not self._stop.wait(self.journal.sync_interval):
+            self.journal.sync()
+            if self.shared is not None:
+                # changes made by someone else reach the replicas through the writer
+                self.refresh()
+            due = time.monotonic() - last_compaction >= self.compact_interval
+            if self.journal.entries >= self.compact_threshold or due:
+                self.compact()
+                last_compaction = time.monotonic()
+
+    def start(self) -> None:
+        """Start the background thread that batches fsyncs and compacts the journal."""
+        self._open_journal()
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._background, name="store-compactor", daemon=True)
+            self._worker.start()
+
+    def close(self) -> None:
+        """
+        Stop the background thread, compact outstanding entries, save the
+        snapshot (if the data file has none yet) and close the journal.
+        """
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        if self.journal is not None:
+            self.compact()
+            self.save_snapshot()
+            self.journal.close()
+            self.journal = None
+
+
+class ReplicaTransactionStore(TransactionStore):
+    """
+    Read-only TransactionStore of a reader process (app.py --processes).
+
+    The writer process owns every mutation. A replica loads the data file
+    the same way (from its snapshot when there is one, so the processes
+    share its pages), then follows the writer: when the SharedVersion
+    moved, refresh() applies the entries appended to the journal since
+    (JournalTail), O(new entries), and follows the journal to the new file
+    after a compaction. Checking for changes costs one read of shared
+    memory; it is done by every request and, every follow_interval
+    seconds, by a background thread, so an idle replica does not fall
+    behind. It loads the data file again only after a reload by the
+    writer (a data file changed by someone else), or if it missed a whole
+    journal file (rotated twice since it last looked).
+    """
+
+    follow_interval = 0.05
+
+    def __init__(self, path: Path, shared: SharedVersion, snapshot: bool = True):
+        super().__init__(path, snapshot=snapshot)
+        self.shared = shared
+        # SharedVersion state applied so far (None: not loaded)
+        self._seen: Optional[Tuple[int, int, int, int, int]] = None
+        self._tail: Optional[JournalTail] = None
+
+    def _open_journal(self) -> TransactionJournal:
+        if self.journal is None:
+            self.journal = TransactionJournal(self.journal_path, read_only=True)
+        return self.journal
+
+    def load(self) -> Sequence[Dict[str, Any]]:
+        """Load the data file and the journal, and start following the journal."""
+        with self.lock.write():
+            return self._follow_locked()
+
+    def _follow_locked(self) -> Sequence[Dict[str, Any]]:
+        while True:
+            state = self.shared.read()
+            tail = JournalTail(self.journal_path)
+            try:
+                self._load_locked()
+            except FileNotFoundError:
+                # nothing written yet: the journal will be
+                self.index.rebuild([])
+            if self.shared.read()[2:] == state[2:]:
+                break
+            # compacted or reloaded meanwhile: what was read may be incomplete
+            tail.close()
+        if self._tail is not None:
+            self._tail.close()
+        self._tail = tail
+        # replayed by _load_locked already; applying them again is harmless
+        self._apply_entries(tail.read())
+        self._seen = state
+        self.version = state[1]
+        return self.index.data.values()
+
+    def refresh(self) -> bool:
+        """
+        Catch up with the writer if the SharedVersion moved: O(1) when
+        nothing changed. Returns True if anything was applied.
+        """
+        if self._seen is not None and self.shared.sequence == self._seen[0]:
+            return False
+        with self.lock.write():
+            state = self.shared.read()
+            seen = self._seen
+            if seen is not None and state[0] == seen[0]:
+                return False
+            rotations = state[2] - seen[2] if seen is not None else 0
+            if seen is None or state[4] != seen[4] or rotations > 1:
+                self._follow_locked()
+                return True
+            self._apply_entries(self._tail.reopen() if rotations else self._tail.read())
+            self._seen = state
+            self.version = state[1]
+        return True
+
+    def _read_only(self, *args, **kwargs):
+        raise PermissionError("read-only replica: mutations go to the writer process")
+
+    create = create_many = update = delete = _read_only
+
+    def compact(self) -> bool:
+        """The writer compacts the journal."""
+        return False
+
+    def save_snapshot(self) -> bool:
+        """The writer saves the snapshot."""
+        return False
+
+    def _background(self) -> None:
+        while not self._stop.wait(self.follow_interval):
+            self.refresh()
+
+    def start(self) -> None:
+        """Start the background thread that keeps up with the writer."""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._background, name="store-follower", daemon=True)
+            self._worker.start()
+
+    def close(self) -> None:
+        """Stop following the writer."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        if self._tail is not None:
+            self._tail.close()
+            self._tail = None
+
+
+class SqliteTransactionStore(TransactionStore):
+    """
+    TransactionStore persisted in an embedded SQLite database.
+
+    Reads are still served from the resident TransactionIndex; SQLite
+    replaces the JSON file, the journal and compaction. Every mutation is
+    one short transaction of prepared statements, so nothing is ever
+    rewritten wholesale and the indexes on sender, receiver, category and
+    timestamp are kept on disk for other readers (reports, the ETL).
+
+    The database runs in WAL mode with synchronous=NORMAL: commits do not
+    wait for an fsync, which is issued at checkpoints, the same trade-off
+    as the journal's batched fsync. `PRAGMA data_version` tells whether
+    another connection (e.g. an ETL load) committed since the last load,
+    so refresh() stays O(1) when nothing changed.
+    """
+
+    def __init__(self, path: Path):
+        # the resident index is loaded from SQLite, which needs no snapshot
+        super().__init__(path, snapshot=False)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        # serializes use of the shared connection
+        self._db_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+            self._conn = conn
+        return self._conn
+
+    def _version(self) -> int:
+        with self._db_lock:
+            return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_locked(self) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            rows = self._connect().execute(
+                "SELECT Transaction_id, Payload FROM TRANSACTIONS ORDER BY Transaction_id"
+            ).fetchall()
+        transactions = []
+        for tx_id, payload in rows:
+            tx = json.loads(payload)
+            tx["id"] = tx_id
+            transactions.append(tx)
+
+        self.index.rebuild(transactions)
+        self.next_id = TransactionManager.get_next_id(transactions)
+        self.version += 1
+        self._data_version = self._version()
+        return transactions
+
+    def refresh(self) -> bool:
+        """Reload only if another connection committed since the last load. O(1) otherwise."""
+        if self._version() == self._data_version:
+            return False
+        with self.lock.write():
+            if self._version() == self._data_version:
+                return False
+            self._load_locked()
+        return True
+
+    def _record(self, op: str, tx_id: int, data: Optional[Dict[str, Any]] = None) -> None:
+        """Persist one mutation in its own SQLite transaction (called under the write lock)."""
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                if op == "delete":
+                    conn.execute(DELETE_TRANSACTION_SQL, (tx_id,))
+                    return
+                row = transaction_row(data)
+                conn.executemany(UPSERT_USER_SQL, [(name,) for name in row[1:3] if name is not None])
+                conn.execute(UPSERT_TRANSACTION_SQL, row)
+
+    def _record_many(self, entries: List[Tuple[str, int, Optional[Dict[str, Any]]]]) -> None:
+        """Persist a batch of mutations in one SQLite transaction, one executemany per statement."""
+        deletes = [(tx_id,) for op, tx_id, _ in entries if op == "delete"]
+        rows = [transaction_row(data) for op, _, data in entries if op != "delete"]
+        names = {name for row in rows for name in row[1:3] if name is not None}
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(UPSERT_USER_SQL, [(name,) for name in names])
+                conn.executemany(UPSERT_TRANSACTION_SQL, rows)
+                conn.executemany(DELETE_TRANSACTION_SQL, deletes)
+
+    def compact(self) -> bool:
+        """Checkpoint the WAL into the database file. Returns True if it ran."""
+        with self._db_lock:
+            if self._conn is None:
+                return False
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    def start(self) -> None:
+        """Open the database; SQLite checkpoints on its own, so no background thread is needed."""
+        self._connect()
+
+    def close(self) -> None:
+        """Checkpoint and close the database."""
+        self.compact()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+BACKENDS = {
+    "json": TransactionStore,
+    "sqlite": SqliteTransactionStore,
+}
@@ -3,9 +3,809 @@ Data structure for efficient transaction searching using hash maps and binary se
 Demonstrates DSA efficiency in searching and managing ride/transaction records.
 """
 
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+from array import array
 from collections import defaultdict
-from bisect import bisect_left, bisect_right
-from typing import List, Dict, Any, Optional
+from collections.abc import Sequence
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from itertools import accumulate, chain, islice
+from math import inf as INF, isfinite, nan as NAN
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+
+import vectorized
+from rollups import Aggregate, Rollups
+from snapshot import Snapshot, SnapshotError, SnapshotWriter
+from textindex import TEXT_FIELDS, TextIndex
+
+
+def to_epoch(value: Union[str, int, float, None]) -> Optional[float]:
+    """
+    Convert a timestamp to seconds since the epoch.
+
+    Accepts ISO 8601 strings ("2024-05-10T16:30:58", "...Z", "...+02:00")
+    and plain numbers (seconds). Naive times are read as UTC so stored
+    timestamps and query bounds are compared the same way.
+    Returns None for anything that cannot be parsed, and for NaN and
+    infinities, which have no place in a sorted time key.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _finite(float(value))
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return _finite(float(value))
+    except (ValueError, OverflowError):
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _finite(value: float) -> Optional[float]:
+    return value if isfinite(value) else None
+
+
+class SortedKeys:
+    """
+    (key, id) pairs in ascending order, stored as two parallel typed arrays.
+
+    Replaces a list of (key, id) tuples: 16 bytes per entry instead of a
+    list slot, a tuple and a float object (~100 bytes). Ties on the key
+    are ordered by id, so every entry has exactly one position.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[float, int]] = ()):
+        entries = sorted(entries)
+        self.keys = array("d", [key for key, _ in entries])
+        self.ids = array("q", [tx_id for _, tx_id in entries])
+
+    @classmethod
+    def from_arrays(cls, keys: array, ids: array) -> "SortedKeys":
+        """Wrap parallel arrays that are already in (key, id) order, e.g. from a snapshot."""
+        sorted_keys = cls()
+        sorted_keys.keys = keys
+        sorted_keys.ids = ids
+        return sorted_keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def bounds(self, low: Optional[float], high: Optional[float]) -> Tuple[int, int]:
+        """Slice [start, end) whose keys lie in [low, high] (None = open). O(log n)."""
+        start = 0 if low is None else bisect_left(self.keys, low)
+        end = len(self.keys) if high is None else bisect_right(self.keys, high)
+        return start, max(start, end)
+
+    def _position(self, key: float, tx_id: int) -> Tuple[int, int]:
+        """(position of (key, tx_id) or where it would go, end of the key's ties)."""
+        start = bisect_left(self.keys, key)
+        end = bisect_right(self.keys, key, start)
+        return bisect_left(self.ids, tx_id, start, end), end
+
+    def position_after(self, key: float, tx_id: int) -> int:
+        """Index of the first entry greater than (key, tx_id): the keyset cursor."""
+        start = bisect_left(self.keys, key)
+        end = bisect_right(self.keys, key, start)
+        return bisect_right(self.ids, tx_id, start, end)
+
+    def insert(self, key: float, tx_id: int) -> None:
+        pos, _ = self._position(key, tx_id)
+        self.keys.insert(pos, key)
+        self.ids.insert(pos, tx_id)
+
+    def remove(self, key: float, tx_id: int) -> None:
+        pos, end = self._position(key, tx_id)
+        if pos < end and self.ids[pos] == tx_id:
+            del self.keys[pos]
+            del self.ids[pos]
+
+    def merge(self, entries: Iterable[Tuple[float, int]]) -> None:
+        """Insert many entries with one O(n + k log k) merge instead of k inserts."""
+        merged = list(heapq.merge(zip(self.keys, self.ids), sorted(entries)))
+        self.keys = array("d", [key for key, _ in merged])
+        self.ids = array("q", [tx_id for _, tx_id in merged])
+
+
+class FenwickTree:
+    """
+    Binary indexed tree over a sequence of numbers: prefix sums and point
+    updates in O(log n), appends in O(log n).
+
+    tree[i - 1] holds the sum of values (i - lowbit(i), i] (1-based), in
+    a typed array like every other index structure.
+    """
+
+    def __init__(self, values: Iterable[float] = ()):
+        # every node is a difference of two prefix sums: O(n) in C loops
+        prefix = list(accumulate(values, initial=0.0))
+        self.tree = array("d", [prefix[i] - prefix[i & (i - 1)] for i in range(1, len(prefix))])
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def prefix(self, count: int) -> float:
+        """Sum of the first `count` values."""
+        tree = self.tree
+        total = 0.0
+        while count > 0:
+            total += tree[count - 1]
+            count &= count - 1
+        return total
+
+    def range_sum(self, start: int, end: int) -> float:
+        """Sum of the values at positions [start, end)."""
+        return self.prefix(end) - self.prefix(start) if end > start else 0.0
+
+    def add(self, position: int, delta: float) -> None:
+        """Add delta to the value at a (0-based) position."""
+        tree = self.tree
+        i = position + 1
+        while i <= len(tree):
+            tree[i - 1] += delta
+            i += i & -i
+
+    def append(self, value: float) -> None:
+        i = len(self.tree) + 1
+        # the new node also covers the nodes (i - lowbit(i), i - 1]
+        self.tree.append(value + self.prefix(i - 1) - self.prefix(i & (i - 1)))
+
+
+class Ledger:
+    """
+    Running totals of the account holder's money over time (GET /balance).
+
+    Entries are the transactions that move the holder's money, ordered by
+    (epoch, id) in a SortedKeys. Parallel arrays hold each entry's signed
+    amount ("flow": + received, - sent), its inflow and its fee, and one
+    FenwickTree per channel turns them into prefix sums, so the flows and
+    fees of any time window cost two binary searches and O(log n) tree
+    steps. Transactions whose record reports the balance after them
+    ("balance", extracted from the SMS) are kept as anchors: the balance
+    at a time T is the last anchor's balance up to T plus the flows and
+    fees of the entries after it, again O(log n).
+
+    An update or removal changes the entry's values in place (removals
+    leave an all-zero slot, dropped later), and new transactions are
+    normally the latest, so the trees are usually updated in O(log n). An
+    entry inserted in the middle marks them stale instead: they are
+    rebuilt in O(n) on the next read.
+    """
+
+    ACCOUNT_HOLDER = "You"
+    CHANNELS = ("flow", "inflow", "fees")
+
+    def __init__(self, entries: Iterable[Tuple[float, int, Tuple[float, float, float]]] = (),
+                 anchors: Iterable[Tuple[float, int, float]] = ()):
+        """entries: (epoch, id, (flow, inflow, fee)); anchors: (epoch, id, balance)."""
+        entries = sorted(entries)
+        self.order = SortedKeys.from_arrays(array("d", [epoch for epoch, _, _ in entries]),
+                                            array("q", [tx_id for _, tx_id, _ in entries]))
+        self.values = {channel: array("d", [values[position] for _, _, values in entries])
+                       for position, channel in enumerate(self.CHANNELS)}
+        anchors = sorted(anchors)
+        self.anchors = SortedKeys.from_arrays(array("d", [epoch for epoch, _, _ in anchors]),
+                                              array("q", [tx_id for _, tx_id, _ in anchors]))
+        self.balances = array("d", [balance for _, _, balance in anchors])
+        # all-zero slots left by removals
+        self.garbage = 0
+        self._trees: Optional[Dict[str, FenwickTree]] = None
+        # readers rebuild stale trees; only one of them does the work
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def entry(cls, tx: Dict[str, Any], amount: Optional[float]) -> Optional[Tuple[float, float, float]]:
+        """
+        (flow, inflow, fee) of a transaction, or None if it does not move
+        the holder's money. amount is the index's numeric amount key.
+        """
+        fee = tx.get("fee")
+        if isinstance(fee, bool) or not isinstance(fee, (int, float)) or fee != fee:
+            fee = 0.0
+        amount = amount or 0.0
+        if tx.get("receiver") == cls.ACCOUNT_HOLDER:
+            flow = inflow = amount
+        elif tx.get("sender") == cls.ACCOUNT_HOLDER:
+            flow, inflow = -amount, 0.0
+        else:
+            flow = inflow = 0.0
+        if not (flow or fee):
+            return None
+        return float(flow), float(inflow), float(fee)
+
+    @staticmethod
+    def reported_balance(tx: Dict[str, Any]) -> Optional[float]:
+        """The balance after the transaction as its record reports it, or None."""
+        balance = tx.get("balance")
+        if isinstance(balance, bool) or not isinstance(balance, (int, float)) or balance != balance:
+            return None
+        return float(balance)
+
+    def __len__(self) -> int:
+        return len(self.order) - self.garbage
+
+    def add(self, tx_id: int, tx: Dict[str, Any], amount: Optional[float], epoch: Optional[float]) -> None:
+        """Count a transaction in (amount/epoch: the index's numeric keys)."""
+        if epoch is None:
+            return
+        balance = self.reported_balance(tx)
+        if balance is not None:
+            pos, _ = self.anchors._position(epoch, tx_id)
+            self.anchors.insert(epoch, tx_id)
+            self.balances.insert(pos, balance)
+        values = self.entry(tx, amount)
+        if values is not None:
+            self.add_entry(epoch, tx_id, values)
+
+    def add_entry(self, epoch: float, tx_id: int, values: Tuple[float, float, float]) -> None:
+        """Insert one entry (see entry()): O(log n) at the end or into its empty slot."""
+        order = self.order
+        pos, end = order._position(epoch, tx_id)
+        if pos < end and order.ids[pos] == tx_id:
+            # the slot a removal left behind
+            self.garbage -= 1
+            self._set(pos, values)
+        elif pos == len(order):
+            order.keys.append(epoch)
+            order.ids.append(tx_id)
+            for channel, value in zip(self.CHANNELS, values):
+                self.values[channel].append(value)
+                if self._trees is not None:
+                    self._trees[channel].append(value)
+        else:
+            order.keys.insert(pos, epoch)
+            order.ids.insert(pos, tx_id)
+            for channel, value in zip(self.CHANNELS, values):
+                self.values[channel].insert(pos, value)
+            self._trees = None
+
+    def add_many(self, items: Iterable[Tuple[int, Dict[str, Any], Optional[float], Optional[float]]]) -> None:
+        """
+        Count a batch of (id, record, amount, epoch) in. A batch that is
+        not entirely later than every entry is merged in with one
+        O(n + k log k) pass, where k inserts would cost O(k * n) moves.
+        """
+        entries = []
+        anchors = []
+        for tx_id, tx, amount, epoch in items:
+            if epoch is None:
+                continue
+            balance = self.reported_balance(tx)
+            if balance is not None:
+                anchors.append((epoch, tx_id, balance))
+            values = self.entry(tx, amount)
+            if values is not None:
+                entries.append((epoch, tx_id, values))
+        entries.sort()
+        anchors.sort()
+
+        if anchors:
+            merged = list(heapq.merge(zip(self.anchors.keys, self.anchors.ids, self.balances), anchors))
+            self.anchors = SortedKeys.from_arrays(array("d", [epoch for epoch, _, _ in merged]),
+                                                  array("q", [tx_id for _, tx_id, _ in merged]))
+            self.balances = array("d", [balance for _, _, balance in merged])
+        if not entries:
+            return
+        order = self.order
+        if not order.keys or entries[0][:2] > (order.keys[-1], order.ids[-1]):
+            for epoch, tx_id, values in entries:
+                self.add_entry(epoch, tx_id, values)
+            return
+        # drop the empty slots (the old versions of re-added records) and merge
+        live = [(order.keys[pos], order.ids[pos], tuple(self.values[channel][pos] for channel in self.CHANNELS))
+                for pos in range(len(order))
+                if any(self.values[channel][pos] for channel in self.CHANNELS)]
+        merged = list(heapq.merge(live, entries))
+        self.order = SortedKeys.from_arrays(array("d", [epoch for epoch, _, _ in merged]),
+                                            array("q", [tx_id for _, tx_id, _ in merged]))
+        self.values = {channel: array("d", [values[position] for _, _, values in merged])
+                       for position, channel in enumerate(self.CHANNELS)}
+        self.garbage = 0
+        self._trees = None
+
+    def remove(self, tx_id: int, tx: Dict[str, Any], amount: Optional[float], epoch: Optional[float]) -> None:
+        """Count a transaction out (same arguments as when it was added)."""
+        if epoch is None:
+            return
+        if self.reported_balance(tx) is not None:
+            pos, end = self.anchors._position(epoch, tx_id)
+            if pos < end and self.anchors.ids[pos] == tx_id:
+                del self.anchors.keys[pos]
+                del self.anchors.ids[pos]
+                del self.balances[pos]
+        if self.entry(tx, amount) is None:
+            return
+        order = self.order
+        pos, end = order._position(epoch, tx_id)
+        if pos < end and order.ids[pos] == tx_id:
+            self._set(pos, (0.0, 0.0, 0.0))
+            self.garbage += 1
+            if self.garbage > max(1024, len(self)):
+                # drop the empty slots at the next read
+                self._trees = None
+
+    def _set(self, pos: int, values: Tuple[float, float, float]) -> None:
+        for channel, value in zip(self.CHANNELS, values):
+            column = self.values[channel]
+            if self._trees is not None:
+                self._trees[channel].add(pos, value - column[pos])
+            column[pos] = value
+
+    def _fresh_trees(self) -> Dict[str, FenwickTree]:
+        """The trees, rebuilt (and empty slots dropped) if stale."""
+        trees = self._trees
+        if trees is None:
+            with self._refresh_lock:
+                trees = self._trees
+                if trees is None:
+                    if self.garbage:
+                        values = self.values
+                        keep = [pos for pos in range(len(self.order))
+                                if any(values[channel][pos] for channel in self.CHANNELS)]
+                        self.order = SortedKeys.from_arrays(array("d", [self.order.keys[pos] for pos in keep]),
+                                                            array("q", [self.order.ids[pos] for pos in keep]))
+                        self.values = {channel: array("d", [column[pos] for pos in keep])
+                                       for channel, column in values.items()}
+                        self.garbage = 0
+                    trees = self._trees = {channel: FenwickTree(self.values[channel])
+                                           for channel in self.CHANNELS}
+        return trees
+
+    def _position(self, keys: array, epoch: Optional[float], inclusive: bool) -> int:
+        """Number of keys before epoch (inclusive: at or before it; None: all)."""
+        if epoch is None:
+            return len(keys)
+        return bisect_right(keys, epoch) if inclusive else bisect_left(keys, epoch)
+
+    def sums(self, low: Optional[float], high: Optional[float], high_inclusive: bool = True) -> Dict[str, float]:
+        """
+        {channel: sum} over the entries with low <= epoch <= high (or
+        < high unless high_inclusive; None = open). O(log n).
+        """
+        trees = self._fresh_trees()
+        keys = self.order.keys
+        start = 0 if low is None else bisect_left(keys, low)
+        end = self._position(keys, high, high_inclusive)
+        return {channel: tree.range_sum(start, end) for channel, tree in trees.items()}
+
+    def balance(self, epoch: Optional[float], inclusive: bool = True) -> Tuple[float, Optional[int]]:
+        """
+        Balance after every transaction up to epoch (inclusive, or strictly
+        before it; None: the latest balance), with the id of the anchor it
+        was computed from (None: summed from a zero opening balance).
+        O(log n).
+        """
+        trees = self._fresh_trees()
+        order = self.order
+        end = self._position(order.keys, epoch, inclusive)
+        last = self._position(self.anchors.keys, epoch, inclusive) - 1
+        if last >= 0:
+            anchor_epoch, anchor_id = self.anchors.keys[last], self.anchors.ids[last]
+            balance = self.balances[last]
+            start = order.position_after(anchor_epoch, anchor_id)
+        else:
+            anchor_id = None
+            balance = 0.0
+            start = 0
+        if end > start:
+            balance += trees["flow"].range_sum(start, end) - trees["fees"].range_sum(start, end)
+        return balance, anchor_id
+
+    def snapshot(self, writer: SnapshotWriter, prefix: str) -> None:
+        """Add the entries, anchors and trees to a snapshot (copies; call under the owner's lock)."""
+        trees = self._fresh_trees()
+        writer.add_array(prefix + "keys", self.order.keys[:])
+        writer.add_array(prefix + "ids", self.order.ids[:])
+        for channel in self.CHANNELS:
+            writer.add_array(f"{prefix}{channel}.values", self.values[channel][:])
+            writer.add_array(f"{prefix}{channel}.tree", trees[channel].tree[:])
+        writer.add_array(prefix + "anchors.keys", self.anchors.keys[:])
+        writer.add_array(prefix + "anchors.ids", self.anchors.ids[:])
+        writer.add_array(prefix + "anchors.balances", self.balances[:])
+        writer.add_json(prefix + "garbage", self.garbage)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot, prefix: str) -> "Ledger":
+        ledger = cls()
+        ledger.order = SortedKeys.from_arrays(snapshot.array(prefix + "keys"), snapshot.array(prefix + "ids"))
+        ledger.values = {channel: snapshot.array(f"{prefix}{channel}.values") for channel in cls.CHANNELS}
+        trees = {}
+        for channel in cls.CHANNELS:
+            tree = trees[channel] = FenwickTree()
+            tree.tree = snapshot.array(f"{prefix}{channel}.tree")
+        ledger._trees = trees
+        ledger.anchors = SortedKeys.from_arrays(snapshot.array(prefix + "anchors.keys"),
+                                                snapshot.array(prefix + "anchors.ids"))
+        ledger.balances = snapshot.array(prefix + "anchors.balances")
+        ledger.garbage = snapshot.json(prefix + "garbage")
+        return ledger
+
+
+class Records(Sequence):
+    """
+    Read-only sequence of ColumnStore rows, turned into dicts on access.
+
+    Rows are immutable, so a Records taken under the store lock can be
+    iterated (e.g. while streaming a response) after the lock is released.
+    """
+
+    __slots__ = ("_columns", "_rows")
+
+    def __init__(self, columns: "ColumnStore", rows: array):
+        self._columns = columns
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return Records(self._columns, self._rows[position])
+        return self._columns._materialize(self._rows[position])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        materialize = self._columns._materialize
+        for row in self._rows:
+            yield materialize(row)
+
+
+class ColumnStore:
+    """
+    Transactions stored column by column instead of one dict each.
+
+    - id, amount and epoch live in typed arrays (8 bytes per row each)
+    - string values of CODED_FIELDS are dictionary-encoded: each row holds
+      a 4-byte code and every distinct string is stored once
+    - every other field (description, original_sms_date, timestamp, ...)
+      is JSON-encoded per row into an anonymous temporary file and only
+      read back (os.pread) when the record is materialized; the OS page
+      cache, not the Python heap, keeps the hot part in memory; a store
+      opened from a snapshot (from_snapshot) reads the rows it was saved
+      with from the snapshot's mapping instead
+    - each row records its key order (a "shape", also dictionary-encoded)
+      so a materialized dict is equal to the one that was stored
+
+    Rows are append-only: storing a record appends a new row and points
+    the id at it, deleting only unlinks the id. Existing rows never change,
+    which is what makes Records safe to materialize outside the lock.
+    Superseded rows are reclaimed by compacted(), which returns a new store.
+
+    Reads follow the Mapping protocol: store[id] -> dict, get, in, len,
+    iteration over ids, values() / items() in insertion order.
+    Ids must be integers.
+    """
+
+    CODED_FIELDS = ("transaction_type", "sender", "receiver", "currency", "category")
+
+    # codes of a CODED_FIELDS column below the first string's
+    _ABSENT, _OTHER = 0, 1
+    # amount kinds: not a number, exact int, float, int too large for a double
+    _NOT_STORED, _INT, _FLOAT, _BIG = 0, 1, 2, 3
+    _EXACT_INT = 2 ** 53  # larger ints do not survive a round trip through a double
+    _FLUSH_BYTES = 64 * 1024
+    _DENSE_SLACK = 1 << 16
+
+    def __init__(self):
+        self._row_ids = array("q")
+        self._shape_codes = array("I")
+        self._shapes: List[Tuple[str, ...]] = []
+        self._shape_lookup: Dict[Tuple[str, ...], int] = {}
+        self._codes = {field: array("I") for field in self.CODED_FIELDS}
+        # code 0: field absent or None; code 1: some other non-string value,
+        # kept with the row's extras
+        self._strings: List[Optional[str]] = [None, None]
+        self._string_lookup: Dict[str, int] = {}
+        self._amounts = array("d")
+        self._amount_kinds = array("b")
+        self._epochs = array("d")
+        self._blob_ends = array("q")
+        # id -> row: a dense array for ids near 0..n, a dict for the rest
+        self._row_of = array("q")
+        self._sparse: Dict[int, int] = {}
+        self._live = 0
+        self.garbage = 0
+        # derived data cached by vectorized.py, keyed by the store's state
+        self.vector_cache: Dict[str, Any] = {}
+
+        # payload of the rows loaded from a snapshot (offsets below _base_size);
+        # later rows go to the spill file, at their offset minus _base_size
+        self._base = memoryview(b"")
+        self._base_size = 0
+        self._spill = tempfile.TemporaryFile(prefix="transactions-", suffix=".columns")
+        self._pending = bytearray()
+        self._flushed = 0
+        self._size = 0
+        self._io_lock = threading.Lock()
+
+    # -- id -> row -------------------------------------------------------
+
+    def _row(self, tx_id: Any) -> Optional[int]:
+        if type(tx_id) is int and 0 <= tx_id < len(self._row_of):
+            row = self._row_of[tx_id]
+            if row >= 0:
+                return row
+        return self._sparse.get(tx_id)
+
+    def _link(self, tx_id: int, row: int) -> None:
+        if 0 <= tx_id < len(self._row_of) + self._DENSE_SLACK:
+            if tx_id >= len(self._row_of):
+                self._row_of.extend(array("q", [-1]) * (tx_id + 1 - len(self._row_of)))
+            self._row_of[tx_id] = row
+            self._sparse.pop(tx_id, None)
+        else:
+            self._sparse[tx_id] = row
+
+    def _unlink(self, tx_id: int) -> None:
+        if 0 <= tx_id < len(self._row_of):
+            self._row_of[tx_id] = -1
+        self._sparse.pop(tx_id, None)
+
+    # -- spill file --------------------------------------------------------
+
+    def _flush_locked(self) -> None:
+        os.pwrite(self._spill.fileno(), self._pending, self._flushed - self._base_size)
+        self._flushed += len(self._pending)
+        self._pending.clear()
+
+    def _read_blob(self, row: int) -> Dict[str, Any]:
+        start = self._blob_ends[row - 1] if row else 0
+        end = self._blob_ends[row]
+        if start == end:
+            return {}
+        if end <= self._base_size:
+            return json.loads(bytes(self._base[start:end]))
+        with self._io_lock:
+            if end > self._flushed:
+                self._flush_locked()
+        return json.loads(os.pread(self._spill.fileno(), end - start, start - self._base_size))
+
+    def _payload_chunks(self, size: int, chunk: int = 1 << 20) -> Iterator[Union[bytes, memoryview]]:
+        """The first `size` bytes of the row payload, in chunks (rows below size never change)."""
+        base = min(size, self._base_size)
+        for start in range(0, base, chunk):
+            yield self._base[start:min(start + chunk, base)]
+        for start in range(base, size, chunk):
+            yield os.pread(self._spill.fileno(), min(chunk, size - start), start - self._base_size)
+
+    # -- writes (under the owner's write lock) ------------------------------
+
+    def _string_code(self, value: str) -> int:
+        code = self._string_lookup.get(value)
+        if code is None:
+            code = self._string_lookup[value] = len(self._strings)
+            self._strings.append(value)
+        return code
+
+    def put(self, tx: Dict[str, Any], epoch: Optional[float]) -> None:
+        """Store (or replace) a transaction; epoch is its precomputed time key."""
+        tx_id = tx["id"]
+        if type(tx_id) is not int:
+            raise TypeError(f"transaction ids must be integers, got {tx_id!r}")
+
+        extras = {}
+        for field in self.CODED_FIELDS:
+            value = tx.get(field)
+            if isinstance(value, str):
+                self._codes[field].append(self._string_code(value))
+            else:
+                self._codes[field].append(self._ABSENT if value is None else self._OTHER)
+                if field in tx:
+                    extras[field] = value
+
+        amount = tx.get("amount")
+        if type(amount) is int and -self._EXACT_INT <= amount <= self._EXACT_INT:
+            kind = self._INT
+        elif type(amount) is float:
+            kind = self._FLOAT
+        else:
+            kind = self._BIG if type(amount) is int else self._NOT_STORED
+            if "amount" in tx:
+                extras["amount"] = amount
+        self._amounts.append(amount if kind == self._INT or kind == self._FLOAT else 0.0)
+        self._amount_kinds.append(kind)
+
+        for key, value in tx.items():
+            if key != "id" and key != "amount" and key not in self._codes:
+                extras[key] = value
+
+        shape = tuple(tx)
+        shape_code = self._shape_lookup.get(shape)
+        if shape_code is None:
+            shape_code = self._shape_lookup[shape] = len(self._shapes)
+            self._shapes.append(shape)
+        self._shape_codes.append(shape_code)
+
+        blob = json.dumps(extras, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if extras else b""
+        with self._io_lock:
+            self._pending += blob
+            self._size += len(blob)
+            if len(self._pending) >= self._FLUSH_BYTES:
+                self._flush_locked()
+        self._blob_ends.append(self._size)
+        self._epochs.append(NAN if epoch is None else epoch)
+
+        row = len(self._row_ids)
+        self._row_ids.append(tx_id)
+        if self._row(tx_id) is None:
+            self._live += 1
+        else:
+            self.garbage += 1
+        self._link(tx_id, row)
+
+    def delete(self, tx_id: int) -> bool:
+        """Unlink a transaction. Returns False if the id is unknown."""
+        if self._row(tx_id) is None:
+            return False
+        self._unlink(tx_id)
+        self._live -= 1
+        self.garbage += 1
+        return True
+
+    def compacted(self) -> "ColumnStore":
+        """A new store holding only the live rows (in the same order)."""
+        store = ColumnStore()
+        for row in self._live_rows():
+            store.put(self._materialize(row), self._epoch_at(row))
+        return store
+
+    # -- snapshots (see snapshot.py) -----------------------------------------
+
+    def snapshot(self, writer: SnapshotWriter, prefix: str) -> None:
+        """
+        Add the store's sections to a snapshot.
+
+        Arrays and tables are copied now (call under the owner's lock);
+        the row payload is append-only, so it is only streamed later, when
+        the writer writes, and may be read outside the lock.
+        """
+        with self._io_lock:
+            self._flush_locked()
+            size = self._size
+        for name in ("_row_ids", "_shape_codes", "_amounts", "_amount_kinds", "_epochs", "_blob_ends", "_row_of"):
+            writer.add_array(prefix + name.lstrip("_"), getattr(self, name)[:])
+        for field, codes in self._codes.items():
+            writer.add_array(f"{prefix}codes.{field}", codes[:])
+        writer.add_array(prefix + "sparse_ids", array("q", self._sparse))
+        writer.add_array(prefix + "sparse_rows", array("q", self._sparse.values()))
+        writer.add_json(prefix + "tables", {
+            "coded_fields": list(self.CODED_FIELDS),
+            "strings": self._strings[:],
+            "shapes": self._shapes[:],
+            "live": self._live,
+            "garbage": self.garbage,
+        })
+        writer.add_bytes(prefix + "payload", self._payload_chunks(size), size)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot, prefix: str) -> "ColumnStore":
+        """A store holding the rows saved by snapshot(); their payload stays in the mapping."""
+        tables = snapshot.json(prefix + "tables")
+        if tables["coded_fields"] != list(cls.CODED_FIELDS):
+            raise SnapshotError(f"{snapshot.path} was written with other coded fields")
+        store = cls()
+        for name in ("_row_ids", "_shape_codes", "_amounts", "_amount_kinds", "_epochs", "_blob_ends", "_row_of"):
+            setattr(store, name, snapshot.array(prefix + name.lstrip("_")))
+        store._codes = {field: snapshot.array(f"{prefix}codes.{field}") for field in cls.CODED_FIELDS}
+        store._sparse = dict(zip(snapshot.array(prefix + "sparse_ids"), snapshot.array(prefix + "sparse_rows")))
+        store._strings = tables["strings"]
+        store._string_lookup = {value: code for code, value in enumerate(store._strings) if code > cls._OTHER}
+        store._shapes = [tuple(shape) for shape in tables["shapes"]]
+        store._shape_lookup = {shape: code for code, shape in enumerate(store._shapes)}
+        store._live = tables["live"]
+        store.garbage = tables["garbage"]
+        store._base = snapshot.view(prefix + "payload")
+        store._base_size = store._flushed = store._size = len(store._base)
+        return store
+
+    # -- reads ---------------------------------------------------------------
+
+    def _materialize(self, row: int) -> Dict[str, Any]:
+        extras = self._read_blob(row)
+        tx = {}
+        for key in self._shapes[self._shape_codes[row]]:
+            if key in extras:
+                tx[key] = extras[key]
+            elif key == "id":
+                tx[key] = self._row_ids[row]
+            elif key == "amount":
+                amount = self._amounts[row]
+                tx[key] = int(amount) if self._amount_kinds[row] == self._INT else amount
+            else:
+                tx[key] = self._strings[self._codes[key][row]]
+        return tx
+
+    def _epoch_at(self, row: int) -> Optional[float]:
+        epoch = self._epochs[row]
+        return None if epoch != epoch else epoch
+
+    def _live_rows(self) -> Iterator[int]:
+        row_of = self._row
+        for row, tx_id in enumerate(self._row_ids):
+            if row_of(tx_id) == row:
+                yield row
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, tx_id: Any) -> bool:
+        return self._row(tx_id) is not None
+
+    def __getitem__(self, tx_id: int) -> Dict[str, Any]:
+        row = self._row(tx_id)
+        if row is None:
+            raise KeyError(tx_id)
+        return self._materialize(row)
+
+    def get(self, tx_id: Any, default: Any = None) -> Any:
+        row = self._row(tx_id)
+        return default if row is None else self._materialize(row)
+
+    def __iter__(self) -> Iterator[int]:
+        row_ids = self._row_ids
+        for row in self._live_rows():
+            yield row_ids[row]
+
+    def values(self) -> Records:
+        """Every live record, in insertion order (materialized lazily)."""
+        return Records(self, array("q", self._live_rows()))
+
+    def items(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for row in self._live_rows():
+            yield self._row_ids[row], self._materialize(row)
+
+    def records(self, ids: Iterable[int]) -> Records:
+        """The records of known ids, in the given order (materialized lazily)."""
+        return Records(self, array("q", [self._row(tx_id) for tx_id in ids]))
+
+    def epoch(self, tx_id: int) -> Optional[float]:
+        """Epoch time key of a stored transaction (None if it has none)."""
+        return self._epoch_at(self._row(tx_id))
+
+    def _amount_at(self, row: int) -> Optional[float]:
+        kind = self._amount_kinds[row]
+        if kind == self._NOT_STORED:
+            return None
+        if kind == self._BIG:
+            return self._materialize(row)["amount"]
+        amount = self._amounts[row]
+        if kind == self._INT:
+            return int(amount)
+        return None if amount != amount else amount
+
+    def amount_key(self, tx_id: int) -> Optional[float]:
+        """Numeric amount of a stored transaction, None if missing or not a number."""
+        return self._amount_at(self._row(tx_id))
+
+    def _value_at(self, row: int, field: str) -> Any:
+        if field == "id":
+            return self._row_ids[row]
+        if field in self._codes:
+            code = self._codes[field][row]
+            if code == self._ABSENT:
+                return None
+            if code != self._OTHER:
+                return self._strings[code]
+        elif field == "amount" and self._amount_kinds[row] != self._NOT_STORED:
+            return self._amount_at(row)
+        return self._materialize(row).get(field)
+
+    def value(self, tx_id: int, field: str) -> Any:
+        """One field of a stored transaction, read from its column when possible."""
+        return self._value_at(self._row(tx_id), field)
 
 
 class TransactionIndex:
@@ -17,47 +817,149 @@ class TransactionIndex:
     - receiver
     - transaction_type
     
-    Provides O(1) lookup instead of O(n) linear search.
+    Provides O(1) lookup instead of O(n) linear search. The words of the
+    text fields are indexed too (see textindex.py), for ?q= searches, and
+    the account holder's flows, fees and reported balances over time
+    (Ledger), for GET /balance.
+
+    Transactions are addressed by their stable "id" field rather than by
+    list position, so deleting one never shifts the others. Posting lists
+    and the sorted amount/timestamp keys hold ids and are kept sorted, so
+    add/update/remove only touch the affected buckets instead of
+    rebuilding everything. The stats rollups (see rollups.py) are
+    maintained the same way.
+
+    The records themselves live in a ColumnStore (`data`) and every index
+    structure is a typed array, so nothing holds a Python object per
+    transaction: a record is only turned into a dict when it is returned.
     """
+
+    INDEXED_FIELDS = ["sender", "receiver", "transaction_type"]
+    # fields whose values are dict keys somewhere (posting lists, rollup groups)
+    HASHED_FIELDS = list(dict.fromkeys(INDEXED_FIELDS + Rollups.FIELD_DIMENSIONS))
+    # run scans and filtered aggregations with NumPy (vectorized.py) when installed
+    vectorize = vectorized.available()
+    # upper bounds of the posting-list length histogram of index_stats()
+    POSTING_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
     
     def __init__(self, transactions: List[Dict[str, Any]]):
         """Initialize indexes from transaction list."""
-        self.data = transactions
-        self.indexes = self._build_indexes()
-        self.sorted_amounts = self._build_sorted_amounts()
-        self.sorted_timestamps = self._build_sorted_timestamps()
+        self.rebuilds = 0
+        self.rebuild_seconds = 0.0
+        self.last_rebuild_seconds = 0.0
+        self.snapshot_loads = 0
+        self.last_snapshot_load_seconds = 0.0
+        # building the initial index is not counted as a rebuild
+        self._build(transactions)
+
+    @staticmethod
+    def _amount_key(tx: Dict[str, Any]) -> Optional[float]:
+        """Numeric sort key for amount, or None if the amount is missing or not a number."""
+        amount = tx.get("amount")
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount != amount:
+            return None
+        return amount
+
+    @staticmethod
+    def _timestamp_key(tx: Dict[str, Any]) -> Optional[float]:
+        """
+        Epoch seconds of a transaction, or None if it has no usable time.
+
+        Falls back to the raw SMS "date" field (milliseconds) for records
+        that were never given an ISO "timestamp".
+        """
+        epoch = to_epoch(tx.get("timestamp"))
+        if epoch is None and tx.get("date") is not None:
+            epoch = to_epoch(tx["date"])
+            if epoch is not None:
+                epoch /= 1000.0
+        return epoch
     
-    def _build_indexes(self) -> Dict[str, Dict[Any, List[int]]]:
+    def _build_indexes(self, transactions: Iterable[Dict[str, Any]]) -> Dict[str, Dict[Any, array]]:
         """
         Build hash map indexes for O(1) lookups.
         
-        Returns: {field: {value: [transaction_indices]}}
+        Returns: {field: {value: array of transaction ids}}
         Example: {"sender": {"Alice": [0, 2, 5], "Bob": [1, 3]}}
         """
         indexes = defaultdict(lambda: defaultdict(list))
         
-        for idx, tx in enumerate(self.data):
+        # Visit ids in ascending order so every posting list starts sorted
+        for tx in sorted(transactions, key=lambda tx: tx["id"]):
             # Index searchable fields
-            for key in ["sender", "receiver", "transaction_type"]:
+            for key in self.INDEXED_FIELDS:
                 value = tx.get(key)
                 if value is not None:
-                    indexes[key][value].append(idx)
+                    indexes[key][value].append(tx["id"])
         
-        return dict(indexes)
+        return {key: {value: array("q", ids) for value, ids in buckets.items()}
+                for key, buckets in indexes.items()}
     
-    def _build_sorted_amounts(self) -> List[tuple]:
-        """Build sorted list of (amount, tx_index) for binary search."""
-        return sorted(
-            [(tx.get("amount", 0), idx) for idx, tx in enumerate(self.data)],
-            key=lambda x: x[0]
-        )
+    def _build_sorted_amounts(self, transactions: Iterable[Dict[str, Any]]) -> SortedKeys:
+        """Build sorted (amount, tx_id) keys for binary search (numeric amounts only)."""
+        entries = []
+        for tx in transactions:
+            amount = self._amount_key(tx)
+            if amount is not None:
+                entries.append((amount, tx["id"]))
+        return SortedKeys(entries)
     
-    def _build_sorted_timestamps(self) -> List[tuple]:
-        """Build sorted list of (timestamp, tx_index) for binary search."""
-        return sorted(
-            [(tx.get("timestamp", ""), idx) for idx, tx in enumerate(self.data)],
-            key=lambda x: x[1]
-        )
+    def _build_sorted_timestamps(self) -> SortedKeys:
+        """
+        Build sorted (epoch, tx_id) keys for binary search.
+
+        Transactions without a parseable time are left out: they can never
+        fall inside a time window.
+        """
+        entries = []
+        for tx_id in self.ids:
+            epoch = self.data.epoch(tx_id)
+            if epoch is not None:
+                entries.append((epoch, tx_id))
+        return SortedKeys(entries)
+
+    def _build_rollups(self, transactions: Iterable[Dict[str, Any]]) -> Rollups:
+        """Aggregate every transaction into the per-group rollups."""
+        rollups = Rollups(self._group_amounts)
+        for tx in transactions:
+            rollups.add(tx, self._amount_key(tx), self.data.epoch(tx["id"]))
+        return rollups
+
+    def _build_ledger(self, transactions: Iterable[Dict[str, Any]]) -> "Ledger":
+        """Time-ordered flows, fees and reported balances of the account holder."""
+        entries = []
+        anchors = []
+        for tx in transactions:
+            epoch = self.data.epoch(tx["id"])
+            if epoch is None:
+                continue
+            values = Ledger.entry(tx, self._amount_key(tx))
+            if values is not None:
+                entries.append((epoch, tx["id"], values))
+            balance = Ledger.reported_balance(tx)
+            if balance is not None:
+                anchors.append((epoch, tx["id"], balance))
+        return Ledger(entries, anchors)
+
+    def _group_amounts(self, dimension: Optional[str], key: Any) -> Iterator[float]:
+        """Amounts of a rollup group's members (see Rollups), read from the indexes."""
+        if dimension is None:
+            ids = self.sorted_amounts.ids
+            ids = ids[:1] + ids[-1:]  # min and max of the whole set
+        elif dimension in Rollups.TIME_DIMENSIONS:
+            start, end = Rollups.bucket_bounds(dimension, key)
+            keys = self.sorted_timestamps.keys
+            ids = self.sorted_timestamps.ids[bisect_left(keys, start):bisect_left(keys, end)]
+        else:
+            ids = self.indexes.get(dimension, {}).get(key, ())
+        for tx_id in ids:
+            amount = self.data.amount_key(tx_id)
+            if amount is not None:
+                yield amount
+
+    def get(self, tx_id: int) -> Optional[Dict[str, Any]]:
+        """O(1) lookup by transaction id."""
+        return self.data.get(tx_id)
     
     def search_by_field(self, field: str, value: Any) -> List[Dict[str, Any]]:
         """
@@ -67,41 +969,825 @@ class TransactionIndex:
         Use this: index.search_by_field(field, value)  # O(1) average case
         """
         if field in self.indexes:
-            indices = self.indexes[field].get(value, [])
-            return [self.data[i] for i in indices]
+            ids = self.indexes[field].get(value, [])
+            return [self.data[i] for i in ids]
         return []
     
-    def search_by_amount_range(self, min_amount: float, max_amount: float) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _range_ids(sorted_keys: SortedKeys, low: Optional[float], high: Optional[float]) -> List[int]:
+        """
+        Ids whose key lies in [low, high] (either bound may be None = open).
+
+        Two binary searches find the slice boundaries, then only the k
+        matching entries are touched: O(log n + k).
+        """
+        start, end = sorted_keys.bounds(low, high)
+        return list(sorted_keys.ids[start:end])
+
+    @staticmethod
+    def _range_bounds(sorted_keys: SortedKeys, low: Optional[float], high: Optional[float]) -> Tuple[int, int]:
+        """Slice [start, end) of sorted_keys whose keys lie in [low, high]. O(log n)."""
+        return sorted_keys.bounds(low, high)
+
+    def amount_range_ids(self, min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> List[int]:
+        """Ids of transactions with min_amount <= amount <= max_amount, ordered by amount."""
+        return self._range_ids(self.sorted_amounts, min_amount, max_amount)
+
+    def timestamp_range_ids(self, start_ts: Union[str, float, None] = None,
+                            end_ts: Union[str, float, None] = None) -> List[int]:
+        """Ids of transactions with start_ts <= time <= end_ts, ordered by time."""
+        return self._range_ids(self.sorted_timestamps, to_epoch(start_ts), to_epoch(end_ts))
+    
+    def search_by_amount_range(self, min_amount: Optional[float] = None,
+                               max_amount: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         Binary search for amount range queries.
         
         Complexity: O(log n + k) where k is number of results
         Better than O(n) linear scan for large datasets.
         """
-        results = []
-        for amount, idx in self.sorted_amounts:
-            if min_amount <= amount <= max_amount:
-                results.append(self.data[idx])
-        return results
+        return [self.data[i] for i in self.amount_range_ids(min_amount, max_amount)]
     
-    def search_by_timestamp_range(self, start_ts: str, end_ts: str) -> List[Dict[str, Any]]:
+    def search_by_timestamp_range(self, start_ts: Union[str, float, None] = None,
+                                  end_ts: Union[str, float, None] = None) -> List[Dict[str, Any]]:
         """
         Binary search for timestamp range queries.
+
+        Bounds may be ISO 8601 strings or epoch seconds.
         
         Complexity: O(log n + k) where k is number of results
         """
-        results = []
-        for ts, idx in self.sorted_timestamps:
-            if start_ts <= ts <= end_ts:
-                results.append(self.data[idx])
-        return results
+        return [self.data[i] for i in self.timestamp_range_ids(start_ts, end_ts)]
+
+    def _index_tx(self, tx_id: int, tx: Dict[str, Any], epoch: Optional[float]) -> None:
+        """Insert one transaction into every structure. O(log n) searches."""
+        for key in self.INDEXED_FIELDS:
+            value = tx.get(key)
+            if value is not None:
+                postings = self.indexes.setdefault(key, {}).setdefault(value, array("q"))
+                insort(postings, tx_id)
+        self.text.add(tx_id, tx)
+        amount = self._amount_key(tx)
+        if amount is not None:
+            self.sorted_amounts.insert(amount, tx_id)
+        if epoch is not None:
+            self.sorted_timestamps.insert(epoch, tx_id)
+        self.rollups.add(tx, amount, epoch)
+        self.ledger.add(tx_id, tx, amount, epoch)
+
+    def _unindex_tx(self, tx_id: int, tx: Dict[str, Any]) -> None:
+        """Remove one transaction from every structure. O(log n) searches."""
+        for key in self.INDEXED_FIELDS:
+            value = tx.get(key)
+            if value is None:
+                continue
+            buckets = self.indexes.get(key, {})
+            postings = buckets.get(value)
+            if postings is None:
+                continue
+            pos = bisect_left(postings, tx_id)
+            if pos < len(postings) and postings[pos] == tx_id:
+                del postings[pos]
+            if not postings:
+                del buckets[value]
+        self.text.remove(tx_id, tx)
+        amount = self._amount_key(tx)
+        epoch = self.data.epoch(tx_id)
+        self.rollups.remove(tx, amount, epoch)
+        self.ledger.remove(tx_id, tx, amount, epoch)
+        if amount is not None:
+            self.sorted_amounts.remove(amount, tx_id)
+        if epoch is not None:
+            self.sorted_timestamps.remove(epoch, tx_id)
+
+    def check(self, tx: Dict[str, Any]) -> None:
+        """
+        Raise TypeError if a transaction cannot be indexed: a non-integer
+        id, or a value of a hashed field (indexed field or rollup
+        dimension) that is not hashable, such as a list or a dict. Called
+        before anything is changed, so a rejected record leaves no trace
+        (TransactionStore calls it before journaling a record, too).
+        """
+        tx_id = tx.get("id")
+        if type(tx_id) is not int:
+            raise TypeError(f"transaction ids must be integers, got {tx_id!r}")
+        for field in self.HASHED_FIELDS:
+            value = tx.get(field)
+            try:
+                hash(value)
+            except TypeError:
+                raise TypeError(f"{field} must be a string or a number, got {type(value).__name__}") from None
+
+    def add(self, tx: Dict[str, Any]) -> None:
+        """
+        Index a new transaction.
+
+        Complexity: O(log n) per structure instead of O(n log n) rebuild.
+        Raises TypeError, with nothing changed, if it cannot be indexed
+        (see check).
+        """
+        self.check(tx)
+        tx_id = tx["id"]
+        if tx_id in self.data:
+            self.remove(tx_id)
+        epoch = self._timestamp_key(tx)
+        self.data.put(tx, epoch)
+        # new ids are normally the largest, so this is an append
+        insort(self.ids, tx_id)
+        self._index_tx(tx_id, tx, epoch)
+
+    def add_many(self, txs: List[Dict[str, Any]]) -> None:
+        """
+        Index a batch of new transactions in one pass.
+
+        The batch's entries are collected per structure, sorted, and merged
+        into each structure once: O(n + k log k), where k separate insorts
+        would cost O(k * n) element moves. As in rebuild(), the last record
+        wins for an id that occurs more than once. Raises TypeError, with
+        nothing changed, if any record cannot be indexed (see check).
+        """
+        for tx in txs:
+            self.check(tx)
+        txs = list({tx["id"]: tx for tx in txs}.values())
+        for tx in txs:
+            if tx["id"] in self.data:
+                self.remove(tx["id"])
+
+        postings: Dict[Tuple[str, Any], List[int]] = {}
+        amounts = []
+        timestamps = []
+        ledger = []
+        for tx in txs:
+            tx_id = tx["id"]
+            epoch = self._timestamp_key(tx)
+            self.data.put(tx, epoch)
+            for key in self.INDEXED_FIELDS:
+                value = tx.get(key)
+                if value is not None:
+                    postings.setdefault((key, value), []).append(tx_id)
+            amount = self._amount_key(tx)
+            if amount is not None:
+                amounts.append((amount, tx_id))
+            if epoch is not None:
+                timestamps.append((epoch, tx_id))
+            self.rollups.add(tx, amount, epoch)
+            ledger.append((tx_id, tx, amount, epoch))
+
+        self.ids = array("q", heapq.merge(self.ids, sorted(tx["id"] for tx in txs)))
+        self.sorted_amounts.merge(amounts)
+        self.sorted_timestamps.merge(timestamps)
+        for (key, value), ids in postings.items():
+            buckets = self.indexes.setdefault(key, {})
+            buckets[value] = array("q", heapq.merge(buckets.get(value, ()), sorted(ids)))
+        self.text.add_many(txs)
+        self.ledger.add_many(ledger)
+
+    def update(self, tx_id: int, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply field updates to a transaction, re-indexing only what it touches.
+
+        The id is stable and cannot be changed through an update. The
+        updated record is stored as a new row rather than overwriting the
+        old one, so a reader still serializing the old version is never
+        affected.
+        Returns the updated transaction, or None if the id is unknown.
+        Raises TypeError, with nothing changed, if the updated record
+        cannot be indexed (see check).
+        """
+        old_tx = self.data.get(tx_id)
+        if old_tx is None:
+            return None
+        tx = dict(old_tx)
+        tx.update({k: v for k, v in updates.items() if k != "id"})
+        self.check(tx)
+        self._unindex_tx(tx_id, old_tx)
+        epoch = self._timestamp_key(tx)
+        self.data.put(tx, epoch)
+        self._index_tx(tx_id, tx, epoch)
+        self._reclaim()
+        return tx
+
+    def remove(self, tx_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Drop a transaction from the index.
+
+        Returns the removed transaction, or None if the id is unknown.
+        """
+        tx = self.data.get(tx_id)
+        if tx is not None:
+            pos = bisect_left(self.ids, tx_id)
+            if pos < len(self.ids) and self.ids[pos] == tx_id:
+                del self.ids[pos]
+            self._unindex_tx(tx_id, tx)
+            self.data.delete(tx_id)
+            self._reclaim()
+        return tx
+
+    def _reclaim(self) -> None:
+        """
+        Replace the column store by a compacted copy once superseded rows
+        outnumber live ones (amortized O(1) per update/remove). Readers
+        still holding Records of the old store are unaffected.
+        """
+        if self.data.garbage > max(1024, len(self.data)):
+            self.data = self.data.compacted()
     
+    def query(self, equals: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+              order: str = "id", after: Any = None, limit: Optional[int] = None,
+              text: Optional[str] = None) -> Tuple[Sequence[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Run an ANDed multi-predicate query, optionally with a full-text
+        search. See QueryPlanner.
+
+        Returns (matching transactions, plan description).
+        """
+        return QueryPlanner(self).execute(equals, ranges, order, after, limit, text)
+
     def rebuild(self, transactions: List[Dict[str, Any]]) -> None:
         """Rebuild all indexes with updated transaction data."""
-        self.data = transactions
-        self.indexes = self._build_indexes()
-        self.sorted_amounts = self._build_sorted_amounts()
+        started = time.perf_counter()
+        self._build(transactions)
+        self.last_rebuild_seconds = time.perf_counter() - started
+        self.rebuild_seconds += self.last_rebuild_seconds
+        self.rebuilds += 1
+
+    def _build(self, transactions: List[Dict[str, Any]]) -> None:
+        """Build every structure from scratch."""
+        # the last record wins for a repeated id
+        latest = {tx["id"]: tx for tx in transactions}
+        self.data = ColumnStore()
+        for tx in latest.values():
+            self.data.put(tx, self._timestamp_key(tx))
+        self.ids = array("q", sorted(latest))
+        self.indexes = self._build_indexes(latest.values())
+        self.sorted_amounts = self._build_sorted_amounts(latest.values())
         self.sorted_timestamps = self._build_sorted_timestamps()
+        self.rollups = self._build_rollups(latest.values())
+        self.text = TextIndex(latest.values())
+        self.ledger = self._build_ledger(latest.values())
+
+    def _layout(self) -> Dict[str, List[str]]:
+        """The indexed fields and rollup dimensions, which a snapshot must have been written with."""
+        return {"indexed_fields": list(self.INDEXED_FIELDS), "dimensions": list(Rollups.DIMENSIONS),
+                "text_fields": list(TEXT_FIELDS), "account_holder": Ledger.ACCOUNT_HOLDER}
+
+    def snapshot(self) -> SnapshotWriter:
+        """
+        A snapshot of the records and every index structure, ready to be
+        written (SnapshotWriter.write). Takes copies of the arrays, so call
+        it under the owner's lock; writing can then happen outside it.
+
+        Posting lists are saved per field as one concatenated id array,
+        the array of each bucket's end and the list of bucket values.
+        """
+        writer = SnapshotWriter()
+        writer.add_json("index.layout", self._layout())
+        self.data.snapshot(writer, "columns.")
+        writer.add_array("index.ids", self.ids[:])
+        for field in self.INDEXED_FIELDS:
+            buckets = self.indexes.get(field, {})
+            postings = array("q")
+            ends = array("q")
+            for ids in buckets.values():
+                postings.extend(ids)
+                ends.append(len(postings))
+            writer.add_json(f"index.{field}.values", list(buckets))
+            writer.add_array(f"index.{field}.ends", ends)
+            writer.add_array(f"index.{field}.postings", postings)
+        for name, keys in (("amounts", self.sorted_amounts), ("timestamps", self.sorted_timestamps)):
+            writer.add_array(f"index.sorted_{name}.keys", keys.keys[:])
+            writer.add_array(f"index.sorted_{name}.ids", keys.ids[:])
+        writer.add_json("index.rollups", self.rollups.state())
+        self.text.snapshot(writer, "index.text.")
+        self.ledger.snapshot(writer, "index.ledger.")
+        return writer
+
+    def load_snapshot(self, snapshot: Snapshot) -> None:
+        """
+        Replace the index by the one saved in a snapshot: arrays are
+        copied out of the mapping, nothing is parsed or sorted.
+
+        Raises SnapshotError (leaving the index unchanged) if the snapshot
+        was written with other indexed fields or dimensions.
+        """
+        started = time.perf_counter()
+        if snapshot.json("index.layout") != self._layout():
+            raise SnapshotError(f"{snapshot.path} was written with other indexed fields")
+        data = ColumnStore.from_snapshot(snapshot, "columns.")
+        indexes = {}
+        for field in self.INDEXED_FIELDS:
+            postings = snapshot.array(f"index.{field}.postings")
+            buckets = {}
+            start = 0
+            for value, end in zip(snapshot.json(f"index.{field}.values"), snapshot.array(f"index.{field}.ends")):
+                buckets[value] = postings[start:end]
+                start = end
+            if buckets:
+                indexes[field] = buckets
+        text = TextIndex.from_snapshot(snapshot, "index.text.")
+        ledger = Ledger.from_snapshot(snapshot, "index.ledger.")
+
+        self.data = data
+        self.ids = snapshot.array("index.ids")
+        self.indexes = indexes
+        self.sorted_amounts = SortedKeys.from_arrays(snapshot.array("index.sorted_amounts.keys"),
+                                                     snapshot.array("index.sorted_amounts.ids"))
+        self.sorted_timestamps = SortedKeys.from_arrays(snapshot.array("index.sorted_timestamps.keys"),
+                                                        snapshot.array("index.sorted_timestamps.ids"))
+        self.rollups = Rollups.from_state(snapshot.json("index.rollups"), self._group_amounts)
+        self.text = text
+        self.ledger = ledger
+        self.snapshot_loads += 1
+        self.last_snapshot_load_seconds = time.perf_counter() - started
+
+    def index_stats(self) -> Dict[str, Any]:
+        """
+        Shape of the indexes, for monitoring. O(buckets).
+
+        Per indexed field: the number of buckets (distinct values), of
+        postings, the longest posting list and a histogram of posting-list
+        lengths ({upper bound: buckets}, cumulative); the sizes of the
+        store (and its superseded rows) and of the sorted amount/timestamp
+        keys; the size of the full-text index (TextIndex.stats) and of the
+        ledger (entries, balance anchors, empty slots); the
+        number and total time of rebuilds; and the number of snapshot loads
+        and the duration of the latest.
+        """
+        fields = {}
+        for field in self.INDEXED_FIELDS:
+            lengths = [len(ids) for ids in self.indexes.get(field, {}).values()]
+            fields[field] = {
+                "buckets": len(lengths),
+                "postings": sum(lengths),
+                "largest": max(lengths, default=0),
+                "histogram": {bound: sum(1 for length in lengths if length <= bound)
+                              for bound in self.POSTING_BUCKETS},
+            }
+        return {
+            "transactions": len(self.data),
+            "garbage_rows": self.data.garbage,
+            "sorted_amounts": len(self.sorted_amounts),
+            "sorted_timestamps": len(self.sorted_timestamps),
+            "fields": fields,
+            "text": self.text.stats(),
+            "ledger": {"entries": len(self.ledger), "anchors": len(self.ledger.anchors),
+                       "garbage": self.ledger.garbage},
+            "rebuilds": self.rebuilds,
+            "rebuild_seconds": self.rebuild_seconds,
+            "last_rebuild_seconds": self.last_rebuild_seconds,
+            "snapshot_loads": self.snapshot_loads,
+            "last_snapshot_load_seconds": self.last_snapshot_load_seconds,
+        }
+
+    def stats(self, group_by: str) -> List[Dict[str, Any]]:
+        """Aggregates per group of `group_by`, read from the rollups. O(groups)."""
+        return self.rollups.stats(group_by)
+
+    def aggregate(self, group_by: str, equals: Optional[Dict[str, Any]] = None,
+                  ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                  text: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        stats() and totals() over only the transactions matching a query
+        (same predicates as query()), which the rollups cannot answer.
+
+        With NumPy the groups are summed column-wise (np.bincount over the
+        encoded keys); otherwise the matching ids are aggregated one by one.
+        Returns (groups, totals). Raises ValueError for an unknown dimension
+        or range field.
+        """
+        if group_by not in Rollups.DIMENSIONS:
+            raise ValueError(f"unknown group_by {group_by!r}")
+        planner = QueryPlanner(self)
+        rows = planner.vector_rows(equals or {}, ranges or {}) if text is None else None
+        if rows is not None:
+            return vectorized.aggregate(self.data, rows, group_by)
+
+        ids, _ = planner.matching_ids(equals, ranges, text)
+        data = self.data
+        groups: Dict[Any, Aggregate] = {}
+        totals = Aggregate()
+        for tx_id in ids:
+            amount = data.amount_key(tx_id)
+            totals.add(amount)
+            if group_by in Rollups.TIME_DIMENSIONS:
+                key = Rollups.time_keys(data.epoch(tx_id)).get(group_by)
+            else:
+                key = data.value(tx_id, group_by)
+            if key is not None:
+                groups.setdefault(key, Aggregate()).add(amount)
+
+        return Rollups.rows(groups), totals.to_dict()
+
+    def totals(self) -> Dict[str, Any]:
+        """Aggregates over every transaction. O(1)."""
+        return self.rollups.totals_dict()
+
+    def balance(self, low: Optional[float] = None, high: Optional[float] = None,
+                high_inclusive: bool = True) -> Dict[str, Any]:
+        """
+        The account holder's money over a time window [low, high] (or
+        [low, high) unless high_inclusive; None = open), from the Ledger's
+        prefix sums: the balances before and at the end of the window, the
+        money received and sent, the net flow and the fees paid. O(log n).
+
+        Balances start from the latest reported balance (the anchor, whose
+        id is returned) and add the flows and fees after it; with no
+        anchor they are summed from zero.
+        """
+        ledger = self.ledger
+        sums = ledger.sums(low, high, high_inclusive)
+        closing, anchor_id = ledger.balance(high, high_inclusive)
+        opening = ledger.balance(low, inclusive=False)[0] if low is not None else None
+        return {
+            "opening_balance": opening,
+            "closing_balance": closing,
+            "inflow": sums["inflow"],
+            "outflow": sums["inflow"] - sums["flow"],
+            "net_flow": sums["flow"],
+            "fees": sums["fees"],
+            "anchor_id": anchor_id,
+        }
+
+
+def intersect_sorted(small: List[int], large: List[int]) -> List[int]:
+    """
+    Intersect two ascending id lists.
+
+    When one list is much longer than the other, each id of the short list
+    is located in the long one by binary search (O(k log m)); otherwise a
+    linear merge is cheaper (O(k + m)).
+    """
+    if len(small) > len(large):
+        small, large = large, small
+    result = []
+    if len(large) > 8 * len(small):
+        lo = 0
+        for tx_id in small:
+            lo = bisect_left(large, tx_id, lo)
+            if lo == len(large):
+                break
+            if large[lo] == tx_id:
+                result.append(tx_id)
+        return result
+    i = j = 0
+    while i < len(small) and j < len(large):
+        a, b = small[i], large[j]
+        if a == b:
+            result.append(a)
+            i += 1
+            j += 1
+        elif a < b:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class QueryPlanner:
+    """
+    Combines any number of equality and range predicates (logical AND).
+
+    1. Every indexed predicate is costed without materializing it:
+       posting-list length for equality on an indexed field, two bisects
+       for a range.
+    2. Predicates are applied smallest first. The smallest one produces
+       the candidate ids; each following one intersects with them (merge
+       or binary-search probe, see intersect_sorted). A range that is far
+       larger than the candidate set is checked per candidate instead of
+       being materialized.
+    3. Equality on a field that has no index is evaluated last, as a
+       filter over the remaining candidates. Only when no predicate is
+       indexed does the query fall back to a full scan.
+    4. Rows come out ordered by id, timestamp or (for a full-text search)
+       relevance, starting after a keyset cursor and stopping at the page
+       limit.
+
+    A full-text search (see textindex.py) is one more indexed predicate:
+    costed by the postings of its rarest word, it either produces the
+    candidates or is probed for the ones already found, and it scores
+    them for the relevance order.
+
+    The plan that was executed is returned alongside the results, so
+    clients can ask for it with ?explain=1.
+    """
+
+    RANGE_FIELDS = {"amount": "sorted_amounts", "timestamp": "sorted_timestamps"}
+    ORDERS = ("id", "timestamp", "relevance")
+    # The vectorized path costs O(n) cheap NumPy operations; the Python path
+    # costs O(candidates) interpreted ones. Vectorize once the candidates
+    # reach both a minimum and this fraction of the table.
+    VECTOR_MIN_ROWS = 1024
+    VECTOR_RATIO = 32
+
+    def __init__(self, index: TransactionIndex):
+        self.index = index
+        # {id: relevance} of the full-text search's matches
+        self.scores: Dict[int, float] = {}
+
+    def _range_key(self, field: str, tx_id: int) -> Optional[float]:
+        if field == "amount":
+            return self.index.data.amount_key(tx_id)
+        return self.index.data.epoch(tx_id)
+
+    @staticmethod
+    def _matches(stored: Any, value: Any) -> bool:
+        """Equality for non-indexed fields; query-string values compare as text."""
+        if stored == value:
+            return True
+        return stored is not None and isinstance(value, str) and str(stored) == value
+
+    def execute(self, equals: Optional[Dict[str, Any]] = None,
+                ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                order: str = "id", after: Any = None, limit: Optional[int] = None,
+                text: Optional[str] = None) -> Tuple[Sequence[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Plan and run the query.
+
+        `text` is a full-text search every result must match. Results are
+        ordered by `order`: "id", "timestamp" or, with `text`, "relevance"
+        (best score first, then by id). Ordered by timestamp, records
+        without a usable time come last, by id. For keyset pagination,
+        `after` is the sort key of the last row already seen (an id, or an
+        (epoch, id) or (score, id) pair; the epoch is None for a record
+        without a time) and `limit` caps the page size.
+        The plan's "has_more" tells whether another page follows and
+        "next_after" is the `after` value that fetches it.
+
+        Returns (transactions, plan); the transactions are a lazy Records
+        sequence.
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"cannot order by {order}")
+        if order == "relevance" and text is None:
+            raise ValueError("only a text search can be ordered by relevance")
+        index = self.index
+        equals = equals or {}
+        ranges = ranges or {}
+        if order == "timestamp" and after is not None:
+            # records without a time sort after every timed one
+            after = (INF if after[0] is None else after[0], after[1])
+        indexed, residual = self._predicates(equals, ranges, text)
+        steps = []
+
+        time_ordered = order == "timestamp" and all(step.get("field") == "timestamp" for step in indexed)
+        lazy = not residual and (time_ordered or (not indexed and order == "id"))
+        scanned = indexed[0]["estimated_rows"] if indexed else len(index.ids)
+        rows = None
+        if (text is None and not lazy and scanned >= self.VECTOR_MIN_ROWS
+                and scanned * self.VECTOR_RATIO >= len(index.ids)):
+            rows = self.vector_rows(equals, ranges)
+
+        if rows is not None:
+            # DSA: one vectorized pass over the columns replaces the
+            # per-row intersections, probes, filters and sort
+            ordered = iter(vectorized.page_ids(index.data, rows, order, after, limit))
+            steps.append({"predicate": " AND ".join(self._describe(equals, ranges)) or None,
+                          "access": "vector_scan", "estimated_rows": len(index.data),
+                          "rows_out": len(rows)})
+            residual = []
+        elif time_ordered:
+            # DSA: the time index is already in output order, so the page is
+            # a slice of it found by binary search: O(log n + limit)
+            sorted_keys = index.sorted_timestamps
+            start, end = indexed[0]["slice"][1:] if indexed else (0, len(sorted_keys))
+            if after is not None:
+                start = max(start, sorted_keys.position_after(*after))
+            ordered = islice(sorted_keys.ids, start, end)
+            untimed = 0 if indexed else len(index.ids) - len(sorted_keys)
+            if untimed:
+                # then the records without a time, only scanned for once
+                # the timed ones are used up
+                ordered = chain(ordered, self._untimed_ids(after[1] if after and after[0] == INF else None))
+            steps.append({"predicate": indexed[0]["predicate"] if indexed else None,
+                          "access": "range_index" if indexed else "ordered_scan",
+                          "estimated_rows": max(0, end - start) + untimed})
+        elif not indexed and order == "id":
+            # DSA: keyset on the sorted id list, no full materialization
+            start = 0 if after is None else bisect_right(index.ids, after)
+            ordered = islice(index.ids, start, None)
+            steps.append({"predicate": None, "access": "full_scan",
+                          "estimated_rows": len(index.ids) - start})
+        else:
+            candidates = self._candidates(indexed, steps)
+            if order == "relevance":
+                # the ranking needs every match, so filter before it
+                for field, value in residual:
+                    candidates = list(self._filter(candidates, field, value))
+                    steps.append({"predicate": f"{field} = {value!r}", "access": "scan_filter",
+                                  "rows_out": len(candidates)})
+                residual = []
+                scores = self.scores
+                keyed = ((-scores[tx_id], tx_id) for tx_id in candidates)
+                if after is not None:
+                    bound = (-after[0], after[1])
+                    keyed = (key for key in keyed if key > bound)
+                # DSA: a bounded heap selects the page, O(k log limit)
+                keyed = sorted(keyed) if limit is None else heapq.nsmallest(limit + 1, keyed)
+                ordered = (tx_id for _, tx_id in keyed)
+                steps.append({"predicate": None, "access": "rank", "key": "relevance",
+                              "rows_out": len(keyed)})
+            elif order == "timestamp":
+                keyed = []
+                untimed = []
+                for tx_id in candidates:
+                    epoch = index.data.epoch(tx_id)
+                    if epoch is None:
+                        untimed.append((INF, tx_id))
+                    else:
+                        keyed.append((epoch, tx_id))
+                keyed.sort()
+                # candidates ascend, so the untimed ones are in id order already
+                keyed.extend(untimed)
+                start = 0 if after is None else bisect_right(keyed, after)
+                ordered = (tx_id for _, tx_id in islice(keyed, start, None))
+                steps.append({"predicate": None, "access": "sort", "key": "timestamp",
+                              "rows_out": len(keyed) - start})
+            else:
+                start = 0 if after is None else bisect_right(candidates, after)
+                ordered = islice(candidates, start, None)
+
+        for field, value in residual:
+            ordered = self._filter(ordered, field, value)
+            steps.append({"predicate": f"{field} = {value!r}", "access": "scan_filter"})
+
+        # Pull one row past the limit to know whether another page exists;
+        # lazy iteration stops the scan filters as soon as the page is full
+        page_ids = list(islice(ordered, None if limit is None else limit + 1))
+        has_more = limit is not None and len(page_ids) > limit
+        if has_more:
+            page_ids = page_ids[:limit]
+
+        # DSA: rows are only turned into dicts as the response is written
+        results = index.data.records(page_ids)
+        plan = {"steps": steps, "order": order, "rows": len(results), "has_more": has_more}
+        if has_more:
+            # keyset for the next page: sort key of the last row returned
+            last_id = page_ids[-1]
+            if order == "id":
+                plan["next_after"] = last_id
+            elif order == "timestamp":
+                plan["next_after"] = [index.data.epoch(last_id), last_id]
+            else:
+                plan["next_after"] = [self.scores[last_id], last_id]
+        return results, plan
+
+    def _predicates(self, equals: Dict[str, Any],
+                    ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+                    text: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Any]]]:
+        """
+        Cost every predicate without materializing it.
+
+        Returns (indexed steps sorted cheapest first, residual (field, value)
+        equality predicates that have no index). Raises ValueError for a
+        text search without a searchable word.
+        """
+        index = self.index
+        indexed = []
+        residual = []
+        for field, value in equals.items():
+            if field in index.INDEXED_FIELDS:
+                postings = index.indexes.get(field, {}).get(value, [])
+                indexed.append({"predicate": f"{field} = {value!r}", "access": "hash_index",
+                                "estimated_rows": len(postings), "ids": postings})
+            else:
+                residual.append((field, value))
+        for field, (low, high) in ranges.items():
+            if field not in self.RANGE_FIELDS:
+                raise ValueError(f"no range index on {field}")
+            sorted_keys = getattr(index, self.RANGE_FIELDS[field])
+            start, end = sorted_keys.bounds(low, high)
+            indexed.append({"predicate": self._describe_range(field, low, high), "access": "range_index",
+                            "estimated_rows": end - start, "field": field, "bounds": (low, high),
+                            "slice": (sorted_keys, start, end)})
+        if text is not None:
+            # DSA: only the vocabulary is searched here, postings are not merged yet
+            text_query = index.text.parse(text, len(index.ids))
+            indexed.append({"predicate": f"text matches {text!r}", "access": "text_index",
+                            "estimated_rows": text_query.estimated_rows, "query": text_query})
+
+        # DSA: cheapest predicate first keeps every intersection small
+        indexed.sort(key=lambda step: step["estimated_rows"])
+        return indexed, residual
+
+    def _candidates(self, indexed: List[Dict[str, Any]], steps: List[Dict[str, Any]]) -> List[int]:
+        """Ascending ids satisfying every indexed predicate (every id if there is none)."""
+        if indexed:
+            return self._intersect(indexed, steps)
+        candidates = list(self.index.ids)
+        steps.append({"predicate": None, "access": "full_scan",
+                      "estimated_rows": len(candidates), "rows_out": len(candidates)})
+        return candidates
+
+    def matching_ids(self, equals: Optional[Dict[str, Any]] = None,
+                     ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                     text: Optional[str] = None) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Ascending ids of every match, without ordering or paging. Returns (ids, steps)."""
+        indexed, residual = self._predicates(equals or {}, ranges or {}, text)
+        steps = []
+        ids = self._candidates(indexed, steps)
+        for field, value in residual:
+            ids = list(self._filter(ids, field, value))
+            steps.append({"predicate": f"{field} = {value!r}", "access": "scan_filter",
+                          "rows_out": len(ids)})
+        return ids, steps
+
+    def vector_rows(self, equals: Dict[str, Any],
+                    ranges: Dict[str, Tuple[Optional[float], Optional[float]]]):
+        """
+        ColumnStore rows of every match, computed with NumPy (see
+        vectorized.py), or None when NumPy is unavailable or disabled or a
+        predicate is not on a column (a field outside ColumnStore.CODED_FIELDS,
+        or a non-string value).
+        """
+        if not self.index.vectorize:
+            return None
+        exact = {}
+        loose = {}
+        for field, value in equals.items():
+            if field not in ColumnStore.CODED_FIELDS or not isinstance(value, str):
+                return None
+            if field in self.index.INDEXED_FIELDS:
+                exact[field] = value
+            else:
+                loose[field] = value
+        for field in ranges:
+            if field not in self.RANGE_FIELDS:
+                raise ValueError(f"no range index on {field}")
+        return vectorized.filter_rows(self.index.data, exact, loose, ranges, self._matches)
+
+    def _intersect(self, indexed: List[Dict[str, Any]], steps: List[Dict[str, Any]]) -> List[int]:
+        """Intersect indexed predicates smallest first; returns ascending ids."""
+        index = self.index
+        driver = indexed[0]
+        if driver["access"] == "hash_index":
+            candidates = list(driver["ids"])
+        elif driver["access"] == "text_index":
+            candidates, self.scores = index.text.scores(driver["query"])
+        else:
+            sorted_keys, start, end = driver["slice"]
+            candidates = sorted(sorted_keys.ids[start:end])
+        steps.append({"predicate": driver["predicate"], "access": driver["access"],
+                      "estimated_rows": driver["estimated_rows"], "rows_out": len(candidates)})
+        for step in indexed[1:]:
+            if step["access"] == "hash_index":
+                candidates = intersect_sorted(candidates, step["ids"])
+                method = "intersect"
+            elif step["access"] == "text_index":
+                candidates, self.scores = index.text.scores(step["query"], candidates)
+                method = "probe"
+            elif step["estimated_rows"] <= 8 * len(candidates):
+                sorted_keys, start, end = step["slice"]
+                ids = sorted(sorted_keys.ids[start:end])
+                candidates = intersect_sorted(candidates, ids)
+                method = "intersect"
+            else:
+                low, high = step["bounds"]
+                field = step["field"]
+                candidates = [
+                    tx_id for tx_id in candidates
+                    if self._in_range(self._range_key(field, tx_id), low, high)
+                ]
+                method = "probe"
+            steps.append({"predicate": step["predicate"], "access": step["access"], "method": method,
+                          "estimated_rows": step["estimated_rows"], "rows_out": len(candidates)})
+        return candidates
+
+    def _untimed_ids(self, after: Optional[int] = None) -> Iterator[int]:
+        """Lazily, the ascending ids above `after` of the records without a usable time."""
+        index = self.index
+        start = 0 if after is None else bisect_right(index.ids, after)
+        for tx_id in islice(index.ids, start, None):
+            if index.data.epoch(tx_id) is None:
+                yield tx_id
+
+    def _filter(self, ids: Iterator[int], field: str, value: Any) -> Iterator[int]:
+        """Lazily keep the ids whose record matches a non-indexed equality predicate."""
+        data = self.index.data
+        for tx_id in ids:
+            if self._matches(data.value(tx_id, field), value):
+                yield tx_id
+
+    def _describe(self, equals: Dict[str, Any],
+                  ranges: Dict[str, Tuple[Optional[float], Optional[float]]]) -> List[str]:
+        return ([f"{field} = {value!r}" for field, value in equals.items()]
+                + [self._describe_range(field, low, high) for field, (low, high) in ranges.items()])
+
+    @staticmethod
+    def _describe_range(field: str, low: Optional[float], high: Optional[float]) -> str:
+        if low is not None and high is not None:
+            return f"{low} <= {field} <= {high}"
+        if low is not None:
+            return f"{field} >= {low}"
+        if high is not None:
+            return f"{field} <= {high}"
+        return f"{field} is set"
+
+    @staticmethod
+    def _in_range(key: Optional[float], low: Optional[float], high: Optional[float]) -> bool:
+        if key is None:
+            return False
+        return (low is None or key >= low) and (high is None or key <= high)
 
 
 class TransactionManager:
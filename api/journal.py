@@ -0,0 +1,291 @@
+"""
+Append-only write-ahead journal for transaction mutations.
+
+Every POST/PUT/DELETE (and every POST /transactions/batch, as a whole) is
+written as one JSON line instead of rewriting the whole data file:
+
+    {"op": "create", "id": 7, "data": {...}}
+    {"op": "update", "id": 7, "data": {...}}
+    {"op": "delete", "id": 7}
+    {"op": "batch", "entries": [{"op": "create", ...}, ...]}
+
+Entries are keyed by the transaction "id" and carry the full record, so
+replaying an entry twice gives the same result. That is what makes
+compaction crash-safe: the journal is only dropped after the compacted
+file has been atomically renamed into place, and replaying it on top of
+the compacted file is harmless.
+
+JournalTail follows the journal from another process: the read-only
+replicas of `app.py --processes` apply the entries the writer appends
+instead of re-reading the data file.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+
+class TransactionJournal:
+    """
+    Durable append-only log with batched fsync (group commit).
+
+    append() writes and flushes the line to the OS immediately. fsync is
+    issued once `sync_every` entries are pending or `sync_interval`
+    seconds have passed since the last one, so a burst of writes shares a
+    single disk flush. Call sync() to force it.
+
+    A read_only journal only replays (see replay()); nothing may be
+    appended to it.
+    """
+
+    def __init__(self, path: Path, sync_every: int = 64, sync_interval: float = 0.05, read_only: bool = False):
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + ".1")
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.entries = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        # True if a torn last line (a crash mid-append) was cut off on opening
+        self.repaired = False
+        self._file = None
+        if not read_only:
+            # appending after a torn line would corrupt the next entry too
+            self.repaired = bool(truncate_torn_line(self.rotated_path) + truncate_torn_line(self.path))
+            self._file = open(self.path, "ab")
+
+    def append(self, op: str, tx_id: Any, data: Optional[Dict[str, Any]] = None) -> None:
+        """Append one mutation record. O(1) regardless of dataset size."""
+        entry = {"op": op, "id": tx_id}
+        if data is not None:
+            entry["data"] = data
+        line = json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries += 1
+            self._pending += 1
+            if (self._pending >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync_locked()
+
+    def append_many(self, entries: List[Tuple[str, Any, Optional[Dict[str, Any]]]]) -> None:
+        """
+        Append a batch of (op, id, data) records as a single commit.
+
+        The batch is written as one "batch" line and fsynced at once, so
+        after a crash it is either replayed whole or (torn line) not at all.
+        """
+        batch = []
+        for op, tx_id, data in entries:
+            entry = {"op": op, "id": tx_id}
+            if data is not None:
+                entry["data"] = data
+            batch.append(entry)
+        line = json.dumps({"op": "batch", "entries": batch}, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries += len(batch)
+            self._pending += len(batch)
+            self._sync_locked()
+
+    def sync(self) -> None:
+        """fsync any entries written since the last flush to disk."""
+        with self._lock:
+            if self._pending:
+                self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def rotate(self) -> None:
+        """
+        Move the current journal aside (to <name>.1) and start an empty one.
+
+        Used by compaction: entries written after the rotation go to the new
+        file while the rotated one is being folded into the data file. If a
+        previous compaction was interrupted, the live entries are appended to
+        the leftover rotated file instead of overwriting it.
+        """
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+            if self.rotated_path.exists():
+                with open(self.path, "rb") as src, open(self.rotated_path, "ab") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+            self._file = open(self.path, "ab")
+            self.entries = 0
+
+    def discard_rotated(self) -> None:
+        """Remove the rotated journal once its entries are safely compacted."""
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every entry of the rotated journal (if any) then the live one.
+
+        An undecodable line (a torn last line left by a crash mid-write)
+        is skipped; the entries after it are still replayed.
+        """
+        for path in (self.rotated_path, self.path):
+            if not path.exists():
+                continue
+            with open(path, "rb") as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+    def close(self) -> None:
+        """Flush outstanding entries and close the journal file."""
+        with self._lock:
+            if self._file is None:
+                return
+            if self._pending:
+                self._sync_locked()
+            self._file.close()
+
+
+class JournalTail:
+    """
+    Reads the entries another process appends to a journal, as they come.
+
+    read() returns the complete lines written since the previous call (a
+    line still being written is kept for the next one). The open file is
+    followed, not the path: after the writer rotates the journal, call
+    reopen() to finish the rotated file (still readable through the open
+    descriptor, even once removed) and move on to the new one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+        self._partial = b""
+        self._open()
+
+    def _open(self) -> None:
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            self._file = None
+        self._partial = b""
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Entries appended since the last read. O(new bytes)."""
+        if self._file is None:
+            self._open()
+            if self._file is None:
+                return []
+        lines = (self._partial + self._file.read()).split(b"\n")
+        self._partial = lines.pop()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the torn line of a crashed writer, followed by the next writer's entries
+                continue
+        return entries
+
+    def reopen(self) -> List[Dict[str, Any]]:
+        """The rest of the file being followed, then the entries of the file now at path, if another."""
+        entries = self.read()
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and self._file is not None:
+            followed = os.fstat(self._file.fileno())
+            if (followed.st_dev, followed.st_ino) == (current.st_dev, current.st_ino):
+                return entries
+        self.close()
+        self._open()
+        return entries + self.read()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def truncate_torn_line(path: Path, chunk_size: int = 4096) -> int:
+    """
+    Truncate a line-oriented file (a journal, an NDJSON output) after its
+    last newline, dropping a line torn by a crash mid-append. Returns the
+    number of bytes removed (0 for a missing file).
+    """
+    try:
+        file = open(path, "r+b")
+    except FileNotFoundError:
+        return 0
+    with file:
+        size = end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - chunk_size)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            file.truncate(end)
+            file.flush()
+            os.fsync(file.fileno())
+    return size - end
+
+
+def apply_entries(transactions: List[Dict[str, Any]], entries: Iterator[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fold journal entries into a transaction list, keyed by "id".
+
+    Complexity: O(n + m) for n transactions and m entries.
+    """
+    by_id = {tx.get("id"): tx for tx in transactions}
+    for entry in _flatten(entries):
+        op = entry.get("op")
+        if op in ("create", "update"):
+            by_id[entry["id"]] = entry["data"]
+        elif op == "delete":
+            by_id.pop(entry["id"], None)
+    return list(by_id.values())
+
+
+def fold_entries(entries: Iterator[Dict[str, Any]]) -> Dict[Any, Optional[Dict[str, Any]]]:
+    """
+    Net effect of journal entries per id: the latest record, or None if
+    the transaction was deleted last. O(m) for m entries.
+    """
+    latest: Dict[Any, Optional[Dict[str, Any]]] = {}
+    for entry in _flatten(entries):
+        op = entry.get("op")
+        if op in ("create", "update"):
+            latest[entry["id"]] = entry["data"]
+        elif op == "delete":
+            latest[entry["id"]] = None
+    return latest
+
+
+def _flatten(entries: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Expand "batch" entries into the records they group."""
+    for entry in entries:
+        if entry.get("op") == "batch":
+            yield from entry.get("entries", [])
+        else:
+            yield entry
@@ -0,0 +1,569 @@
+"""
+Request metrics and a sampling profiler for GET /metrics.
+
+Metrics keeps, per method and endpoint, a latency histogram and the
+response count per status code, and per endpoint the time spent in each
+phase of a request:
+
+    auth        checking the Authorization header
+    load        store.refresh(): re-reading data changed by another process
+    index       store lookups, queries, aggregations and mutations
+    serialize   JSON encoding and compression (for streamed lists also
+                materializing the records, which happens lazily)
+    write       writing to the socket
+
+render() formats them, together with the index statistics of the store
+and the response cache counters, in the Prometheus text format (0.0.4).
+
+Recording a request costs a handful of perf_counter() calls and one
+short critical section. Profiler wraps cProfile and only profiles one
+request in every `every`; with every = 0 (the default) it costs one
+attribute check per request.
+
+With app.py --processes, MetricsExchange lets the process answering
+GET /metrics (or /metrics/profile) add up the counters and profiler
+samples of all of them.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from pathlib import Path
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# seconds; upper bounds of the request latency histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ENDPOINTS = ("/transactions", "/transactions/batch", "/stats", "/balance", "/metrics", "/metrics/profile")
+
+# stands in for a PhaseTimer when metrics are disabled
+NO_PHASE = nullcontext()
+
+
+def endpoint_label(path: str) -> str:
+    """
+    Route of a request path, as a low-cardinality label: ids are folded
+    into "/transactions/{id}" and unknown paths into "other".
+    """
+    path = path.split("?", 1)[0]
+    if path in ENDPOINTS:
+        return path
+    parts = path.split("/")
+    if len(parts) == 3 and parts[1] == "transactions":
+        return "/transactions/{id}"
+    return "other"
+
+
+class PhaseTimer:
+    """Context manager adding the time spent in its block to timings[name]."""
+
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: Dict[str, float], name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class TimedWriter:
+    """
+    File-like wrapper of a handler's wfile that adds the time spent in
+    write() to the handler's current timings["write"].
+    """
+
+    __slots__ = ("raw", "handler")
+
+    def __init__(self, raw, handler):
+        self.raw = raw
+        self.handler = handler
+
+    def write(self, data):
+        timings = self.handler.timings
+        if timings is None:
+            return self.raw.write(data)
+        started = time.perf_counter()
+        try:
+            return self.raw.write(data)
+        finally:
+            timings["write"] = timings.get("write", 0.0) + time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum (Prometheus histogram)."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # one count per bound, plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram(self.bounds)
+        histogram.counts, histogram.total, histogram.count = list(self.counts), self.total, self.count
+        return histogram
+
+    def add(self, counts: List[int], total: float, count: int) -> None:
+        """Add the observations of another histogram with the same bounds."""
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """[(le label, observations <= bound)], ending with +Inf."""
+        rows = []
+        running = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            running += count
+            rows.append(("+Inf" if bound == float("inf") else _number(bound), running))
+        return rows
+
+
+def _number(value: Any) -> str:
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class _Exposition:
+    """Builder of a Prometheus text exposition."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: Any, **labels: Any) -> None:
+        self.lines.append(f"{name}{_labels(**labels)} {_number(value)}")
+
+    def histogram(self, name: str, histogram: Histogram, **labels: Any) -> None:
+        for le, count in histogram.cumulative():
+            self.sample(name + "_bucket", count, **labels, le=le)
+        self.sample(name + "_sum", histogram.total, **labels)
+        self.sample(name + "_count", histogram.count, **labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _cache_counters(cache) -> Dict[str, int]:
+    return {"hits": cache.hits, "misses": cache.misses, "entries": len(cache), "bytes": cache.size}
+
+
+class Metrics:
+    """Request latency, status and phase counters of one server process. Thread-safe."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._responses: Counter = Counter()
+        # (endpoint, phase) -> [seconds, requests]
+        self._phases: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, endpoint: str, code: int, seconds: float,
+                phases: Dict[str, float]) -> None:
+        """Record one answered request."""
+        with self._lock:
+            histogram = self._latency.get((method, endpoint))
+            if histogram is None:
+                histogram = self._latency[(method, endpoint)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            self._responses[(method, endpoint, code)] += 1
+            for phase, spent in phases.items():
+                entry = self._phases.get((endpoint, phase))
+                if entry is None:
+                    entry = self._phases[(endpoint, phase)] = [0.0, 0]
+                entry[0] += spent
+                entry[1] += 1
+
+    def state(self) -> Dict[str, Any]:
+        """The counters as JSON-serializable data, for another process to add to its own (render())."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "latency": [[method, endpoint, list(histogram.counts), histogram.total, histogram.count]
+                            for (method, endpoint), histogram in self._latency.items()],
+                "responses": [[method, endpoint, code, count]
+                              for (method, endpoint, code), count in self._responses.items()],
+                "phases": [[endpoint, phase, seconds, count]
+                           for (endpoint, phase), (seconds, count) in self._phases.items()],
+            }
+
+    def render(self, store=None, cache=None, profiler: Optional["Profiler"] = None,
+               others: Iterable[Dict[str, Any]] = ()) -> str:
+        """
+        Every metric in the Prometheus text format. others: what the other
+        processes published (MetricsExchange.others()), added to the
+        request, cache and profiler counters of this one.
+        """
+        with self._lock:
+            latency = {key: histogram.copy() for key, histogram in self._latency.items()}
+            responses = dict(self._responses)
+            phases = {key: tuple(entry) for key, entry in self._phases.items()}
+        started = self.started
+        cache_counters = _cache_counters(cache) if cache is not None else None
+        profiled = profiler.profiled if profiler is not None else 0
+
+        processes = 1
+        for other in others:
+            processes += 1
+            profiled += other.get("profiled", 0)
+            if cache_counters is not None and other.get("cache") is not None:
+                cache_counters = {name: value + other["cache"].get(name, 0) for name, value in cache_counters.items()}
+            state = other.get("metrics")
+            if state is None:
+                continue
+            started = min(started, state["started"])
+            for method, endpoint, counts, total, count in state["latency"]:
+                histogram = latency.get((method, endpoint))
+                if histogram is None:
+                    histogram = latency[(method, endpoint)] = Histogram(LATENCY_BUCKETS)
+                histogram.add(counts, total, count)
+            for method, endpoint, code, count in state["responses"]:
+                responses[(method, endpoint, code)] = responses.get((method, endpoint, code), 0) + count
+            for endpoint, phase, seconds, count in state["phases"]:
+                total_seconds, total_count = phases.get((endpoint, phase), (0.0, 0))
+                phases[(endpoint, phase)] = (total_seconds + seconds, total_count + count)
+
+        out = _Exposition()
+        out.family("process_start_time_seconds", "gauge", "Start time of the server, in seconds since the epoch.")
+        out.sample("process_start_time_seconds", started)
+        out.family("metrics_processes", "gauge", "Server processes whose counters are added up here.")
+        out.sample("metrics_processes", processes)
+
+        out.family("http_request_duration_seconds", "histogram", "Request latency by method and endpoint.")
+        for (method, endpoint), histogram in sorted(latency.items()):
+            out.histogram("http_request_duration_seconds", histogram, method=method, endpoint=endpoint)
+
+        out.family("http_responses_total", "counter", "Responses by method, endpoint and status code.")
+        for (method, endpoint, code), count in sorted(responses.items()):
+            out.sample("http_responses_total", count, method=method, endpoint=endpoint, code=code)
+
+        out.family("http_request_phase_seconds", "summary",
+                   "Time spent per request phase (auth, load, index, serialize, write) by endpoint.")
+        for (endpoint, phase), (seconds, count) in sorted(phases.items()):
+            out.sample("http_request_phase_seconds_sum", seconds, endpoint=endpoint, phase=phase)
+            out.sample("http_request_phase_seconds_count", count, endpoint=endpoint, phase=phase)
+
+        if store is not None:
+            self._render_store(out, store)
+        if cache_counters is not None:
+            out.family("response_cache_hits_total", "counter", "GET responses served from the response cache.")
+            out.sample("response_cache_hits_total", cache_counters["hits"])
+            out.family("response_cache_misses_total", "counter", "Cacheable GET responses that had to be computed.")
+            out.sample("response_cache_misses_total", cache_counters["misses"])
+            out.family("response_cache_entries", "gauge", "Responses in the response cache.")
+            out.sample("response_cache_entries", cache_counters["entries"])
+            out.family("response_cache_bytes", "gauge", "Bytes held by the response cache.")
+            out.sample("response_cache_bytes", cache_counters["bytes"])
+        if profiler is not None:
+            out.family("profiler_sample_every", "gauge", "One request in this many is profiled (0: off).")
+            out.sample("profiler_sample_every", profiler.every)
+            out.family("profiler_profiled_requests_total", "counter", "Requests profiled since the last reset.")
+            out.sample("profiler_profiled_requests_total", profiled)
+        return out.text()
+
+    @staticmethod
+    def _render_store(out: _Exposition, store) -> None:
+        stats = store.index_stats()
+        out.family("transaction_store_version", "gauge", "Dataset version (bumped by every write and reload).")
+        out.sample("transaction_store_version", store.version)
+        out.family("transaction_store_transactions", "gauge", "Transactions held in memory.")
+        out.sample("transaction_store_transactions", stats["transactions"])
+        out.family("transaction_store_garbage_rows", "gauge", "Superseded rows awaiting compaction.")
+        out.sample("transaction_store_garbage_rows", stats["garbage_rows"])
+
+        fields = stats["fields"]
+        out.family("transaction_index_buckets", "gauge", "Distinct values (hash buckets) per indexed field.")
+        for field, shape in fields.items():
+            out.sample("transaction_index_buckets", shape["buckets"], field=field)
+        out.family("transaction_index_largest_posting_list", "gauge", "Longest posting list per indexed field.")
+        for field, shape in fields.items():
+            out.sample("transaction_index_largest_posting_list", shape["largest"], field=field)
+        out.family("transaction_index_posting_list_length", "histogram",
+                   "Posting-list lengths per indexed field (one observation per bucket).")
+        for field, shape in fields.items():
+            for bound, count in shape["histogram"].items():
+                out.sample("transaction_index_posting_list_length_bucket", count, field=field, le=bound)
+            out.sample("transaction_index_posting_list_length_bucket", shape["buckets"], field=field, le="+Inf")
+            out.sample("transaction_index_posting_list_length_sum", shape["postings"], field=field)
+            out.sample("transaction_index_posting_list_length_count", shape["buckets"], field=field)
+
+        out.family("transaction_index_sorted_keys", "gauge", "Entries of the sorted range-query keys.")
+        out.sample("transaction_index_sorted_keys", stats["sorted_amounts"], key="amount")
+        out.sample("transaction_index_sorted_keys", stats["sorted_timestamps"], key="timestamp")
+        text = stats["text"]
+        out.family("transaction_text_index_terms", "gauge", "Distinct words in the full-text index.")
+        out.sample("transaction_text_index_terms", text["terms"])
+        out.family("transaction_text_index_postings", "gauge", "(word, transaction) pairs in the full-text index.")
+        out.sample("transaction_text_index_postings", text["postings"])
+        out.family("transaction_text_index_grams", "gauge", "Distinct trigrams of the full-text vocabulary.")
+        out.sample("transaction_text_index_grams", text["grams"])
+        ledger = stats["ledger"]
+        out.family("transaction_ledger_entries", "gauge", "Transactions moving the account holder's money in the balance ledger.")
+        out.sample("transaction_ledger_entries", ledger["entries"])
+        out.family("transaction_ledger_anchors", "gauge", "Transactions reporting the balance after them.")
+        out.sample("transaction_ledger_anchors", ledger["anchors"])
+        out.family("transaction_index_rebuilds_total", "counter", "Full index rebuilds (loads and reloads).")
+        out.sample("transaction_index_rebuilds_total", stats["rebuilds"])
+        out.family("transaction_index_rebuild_seconds_total", "counter", "Time spent in full index rebuilds.")
+        out.sample("transaction_index_rebuild_seconds_total", stats["rebuild_seconds"])
+        out.family("transaction_index_last_rebuild_seconds", "gauge", "Duration of the latest full index rebuild.")
+        out.sample("transaction_index_last_rebuild_seconds", stats["last_rebuild_seconds"])
+        out.family("transaction_index_snapshot_loads_total", "counter",
+                   "Loads served from the binary snapshot instead of a rebuild.")
+        out.sample("transaction_index_snapshot_loads_total", stats["snapshot_loads"])
+        out.family("transaction_index_last_snapshot_load_seconds", "gauge", "Duration of the latest snapshot load.")
+        out.sample("transaction_index_last_snapshot_load_seconds", stats["last_snapshot_load_seconds"])
+
+
+class Profiler:
+    """
+    Sampling cProfile hook: profiles one request in every `every` (0: off)
+    and accumulates the samples, so a slow path can be inspected on a
+    running server (POST /metrics/profile, GET /metrics/profile).
+
+    At most one request is profiled at a time; a sampled request that
+    arrives while another is being profiled is skipped.
+    """
+
+    def __init__(self, every: int = 0):
+        self.every = every
+        self.profiled = 0
+        self._seen = 0
+        self._stats: Optional[pstats.Stats] = None
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def configure(self, every: int) -> None:
+        """Profile one request in every `every` from now on (0: off); drops the samples so far."""
+        if every < 0:
+            raise ValueError("every must be >= 0")
+        with self._lock:
+            self.every = every
+            self.profiled = 0
+            self._seen = 0
+            self._stats = None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """A running profile if this request is sampled, else None."""
+        every = self.every
+        if not every:
+            return None
+        # unsynchronized: a lost increment only shifts which request is sampled
+        self._seen += 1
+        if self._seen % every or not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile) -> None:
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+
+    def dump(self, path: Path) -> bool:
+        """Write the samples (pstats format) to path. Returns False if there are none."""
+        with self._lock:
+            if self._stats is None:
+                return False
+            self._stats.dump_stats(path)
+            return True
+
+    def report(self, sort: str = "cumulative", limit: int = 40,
+               others: Iterable[Tuple[int, Path]] = ()) -> str:
+        """
+        The accumulated samples as a pstats table, most expensive first.
+        others: (profiled requests, samples file) of other processes
+        (MetricsExchange.other_profiles()), added to this one's.
+        """
+        out = io.StringIO()
+        stats = pstats.Stats(stream=out)
+        with self._lock:
+            profiled = self.profiled
+            if self._stats is not None:
+                stats.add(self._stats)
+        for count, path in others:
+            try:
+                stats.add(str(path))
+            except (OSError, EOFError, ValueError, TypeError):
+                # replaced or removed meanwhile
+                continue
+            profiled += count
+        if not profiled:
+            return f"no profiled requests (sampling one in {self.every or 'none'})\n"
+        out.write(f"{profiled} profiled request(s), one in {self.every}\n")
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class MetricsExchange:
+    """
+    Shares the counters and profiler samples of the processes of
+    app.py --processes through files in a directory they all use (made
+    by the supervisor), so that GET /metrics and GET /metrics/profile
+    cover every process, whichever one answers.
+
+    Every `interval` seconds a background thread of each process rewrites
+    <name>.json (Metrics.state(), cache and profiler counters) and
+    <name>.prof (profiler samples), by writing a temporary file and
+    renaming it. The answering process adds its live counters to the
+    others' files, which are at most `interval` seconds old. A process
+    restarted under the same name starts its counters from zero again,
+    like a restarted server.
+
+    Profiler settings (POST /metrics/profile) are written to
+    profiler.json, which every process checks at the same pace; samples
+    taken under older settings are left out of the report.
+    """
+
+    SETTINGS = "profiler.json"
+
+    def __init__(self, directory: Path, name: str, interval: float = 1.0):
+        self.directory = Path(directory)
+        self.name = name
+        self.interval = interval
+        self.metrics: Optional[Metrics] = None
+        self.cache = None
+        self.profiler: Optional[Profiler] = None
+        # profiler settings applied, and profiled count of the samples file written
+        self._settings: Optional[str] = None
+        self._dumped: Optional[int] = None
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self, metrics: Optional[Metrics], cache, profiler: Profiler) -> None:
+        """
+        Publish this process's counters from now on. metrics or cache is
+        None where they would count requests twice (the writer only
+        answers requests forwarded by readers, which count them).
+        """
+        self.metrics, self.cache, self.profiler = metrics, cache, profiler
+        self._settings = self._read_settings()[0]
+        self._worker = threading.Thread(target=self._run, name="metrics-exchange", daemon=True)
+        self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll_settings()
+                self.publish()
+            except OSError:
+                if not self.directory.is_dir():
+                    # removed by the supervisor on its way out
+                    return
+
+    def _write(self, name: str, write: Callable[[Path], Any]) -> None:
+        """write(path) to a temporary file, renamed to name unless write returned False."""
+        path = self.directory / name
+        tmp_path = path.with_name(f".{name}.{os.getpid()}.tmp")
+        if write(tmp_path) is False:
+            path.unlink(missing_ok=True)
+        else:
+            os.replace(tmp_path, path)
+
+    def publish(self) -> None:
+        """Write this process's counters and, if new ones were taken, its profiler samples."""
+        profiled = self.profiler.profiled
+        if profiled != self._dumped:
+            self._write(f"{self.name}.prof", self.profiler.dump)
+            self._dumped = profiled
+        state = {
+            "metrics": self.metrics.state() if self.metrics is not None else None,
+            "cache": _cache_counters(self.cache) if self.cache is not None else None,
+            "profiled": profiled,
+            "settings": self._settings,
+        }
+        self._write(f"{self.name}.json", lambda path: path.write_text(json.dumps(state), encoding="utf-8"))
+
+    def others(self) -> List[Dict[str, Any]]:
+        """
+        What the other processes published last (unreadable files are
+        skipped), for Metrics.render(). Samples taken under older
+        profiler settings are not counted.
+        """
+        settings = self._read_settings()[0]
+        states = []
+        for path in self.directory.glob("*.json"):
+            if path.name == self.SETTINGS or path.stem == self.name:
+                continue
+            try:
+                state = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if state.get("settings") != settings:
+                state["profiled"] = 0
+            state["name"] = path.stem
+            states.append(state)
+        return states
+
+    def other_profiles(self) -> List[Tuple[int, Path]]:
+        """(profiled requests, samples file) of the other processes, for Profiler.report()."""
+        return [(state["profiled"], self.directory / f"{state['name']}.prof")
+                for state in self.others() if state["profiled"]]
+
+    def _read_settings(self) -> Tuple[Optional[str], int]:
+        try:
+            settings = json.loads((self.directory / self.SETTINGS).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None, 0
+        return settings["token"], settings["every"]
+
+    def configure_profiler(self, every: int) -> None:
+        """Profiler.configure(every) in this process now and in the others within `interval`."""
+        self.profiler.configure(every)
+        self._settings = f"{os.getpid()}-{time.time_ns()}"
+        settings = json.dumps({"token": self._settings, "every": every})
+        self._write(self.SETTINGS, lambda path: path.write_text(settings, encoding="utf-8"))
+
+    def poll_settings(self) -> None:
+        """Apply profiler settings written by another process since the last check."""
+        token, every = self._read_settings()
+        if token is not None and token != self._settings:
+            self.profiler.configure(every)
+            self._settings = token
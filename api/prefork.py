@@ -0,0 +1,209 @@
+"""
+Pre-fork multi-process mode of app.py (`--processes N`).
+
+A server process runs Python code on one core at a time (the GIL), so
+JSON encoding and index work are capped at about one core whatever the
+number of threads. Here a supervisor forks:
+
+- N reader processes, each listening on the public port with a socket
+  of its own (SO_REUSEPORT: the kernel spreads new connections over
+  them), serving reads from a ReplicaTransactionStore
+- one writer process owning the TransactionStore (journal, compaction,
+  snapshot). It listens on a loopback socket opened by the supervisor,
+  and the readers pass every POST/PUT/DELETE on to it
+  (resourceHandler.forward_write)
+
+Every write advances a SharedVersion in memory shared by all the
+processes. A reader checks it on each request (one 8-byte read) and,
+when it moved, applies the journal entries written since: the writer's
+changes are never picked up by re-reading the data file. The workers
+open the same binary snapshot at start, so its record payload sits once
+in the page cache.
+
+Each worker publishes its request, cache and profiler counters to a
+directory the supervisor creates (MetricsExchange), so GET /metrics adds
+up those of every process whichever reader answers it.
+
+The supervisor only forks and waits. A worker that exits is started
+again (RESTART_DELAY later if it died right after starting); SIGINT or
+SIGTERM stops the readers, then the writer, which compacts the journal
+on the way out. While the writer restarts, forwarded writes wait in the
+backlog of its socket, which the supervisor keeps open.
+"""
+
+import os
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from functools import partial
+from typing import Callable, Dict, Iterable, Tuple
+
+from db import ReplicaTransactionStore, SharedVersion, SqliteTransactionStore, TransactionStore
+from metrics import MetricsExchange
+
+# a worker that exits sooner than this after starting is restarted this much later
+RESTART_DELAY = 1.0
+# seconds the workers get to stop before they are killed
+STOP_TIMEOUT = 30.0
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def supported() -> bool:
+    """True if this platform can fork and share a port (SO_REUSEPORT)."""
+    return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+
+def _prepare(store: TransactionStore) -> None:
+    """Fold the journal into the data file and snapshot it, so the workers open the snapshot."""
+    try:
+        store.load()
+    except FileNotFoundError:
+        pass
+    store.close()
+
+
+def _check_port(port: int) -> None:
+    """Raise OSError now, not in every worker, if the port cannot be shared (e.g. already served)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        probe.bind(("", port))
+
+
+def _stop_once(signum, frame):
+    # a worker ignores the supervisor's SIGTERM that follows a Ctrl+C
+    # (SIGINT), so its shutdown (the writer's compaction) is not cut short
+    for stop_signal in STOP_SIGNALS:
+        signal.signal(stop_signal, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def _fork(target: Callable[[], None]) -> int:
+    """Run target in a new process, which exits when it returns. Returns the pid."""
+    # no signal may reach the child before it has its own handlers
+    signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+    try:
+        pid = os.fork()
+    except BaseException:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        raise
+    if pid:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        return pid
+    code = 0
+    try:
+        for stop_signal in STOP_SIGNALS:
+            signal.signal(stop_signal, _stop_once)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        target()
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def _stop(pids: Iterable[int]) -> None:
+    """SIGTERM the workers and wait for them (SIGKILL after STOP_TIMEOUT)."""
+    pending = set(pids)
+    for pid in pending:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + STOP_TIMEOUT
+    while pending:
+        for pid in list(pending):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                pending.discard(pid)
+        if pending and time.monotonic() > deadline:
+            for pid in pending:
+                os.kill(pid, signal.SIGKILL)
+            deadline = float("inf")
+        time.sleep(0.05)
+
+
+def supervise(handler_class, serve: Callable[..., None], processes: int, port: int = 8000, workers: int = 8,
+              backlog: int = 128, engine: str = "threads", idle_timeout: float = 75.0) -> None:
+    """
+    Run the writer and `processes` readers of handler_class until SIGINT
+    or SIGTERM. serve is app.serve; handler_class.store only tells the
+    data file and whether snapshots are enabled.
+    """
+    if isinstance(handler_class.store, SqliteTransactionStore):
+        raise ValueError("pre-fork mode needs the json backend: the replicas follow its journal")
+    path = handler_class.store.path
+    snapshot = handler_class.store.snapshot_path is not None
+    _prepare(TransactionStore(path, snapshot=snapshot))
+    _check_port(port)
+    shared = SharedVersion()
+    # one ETag namespace for every process (see resourceHandler.etag)
+    instance = secrets.token_hex(4)
+    writer_socket = socket.create_server(("127.0.0.1", 0), backlog=backlog)
+    writer_address = writer_socket.getsockname()
+    metrics_directory = tempfile.mkdtemp(prefix="transactions-metrics-")
+
+    def writer():
+        store = TransactionStore(path, snapshot=snapshot)
+        store.shared = shared
+        store.instance = instance
+        handler_class.store = store
+        # the readers count the requests they forward here: only profiler samples are published
+        handler_class.metrics_exchange = MetricsExchange(metrics_directory, "writer")
+        handler_class.metrics_exchange.start(None, None, handler_class.profiler)
+        serve(workers=workers, backlog=backlog, sock=writer_socket)
+
+    def reader(number):
+        writer_socket.close()
+        store = ReplicaTransactionStore(path, shared, snapshot=snapshot)
+        store.instance = instance
+        handler_class.store = store
+        handler_class.writer_address = writer_address
+        handler_class.metrics_exchange = MetricsExchange(metrics_directory, f"reader-{number}")
+        handler_class.metrics_exchange.start(handler_class.metrics, handler_class.cache, handler_class.profiler)
+        serve(port=port, workers=workers, backlog=backlog, engine=engine, idle_timeout=idle_timeout,
+              reuse_port=True)
+
+    targets = {"writer": writer}
+    targets.update((f"reader {number}", partial(reader, number)) for number in range(1, processes + 1))
+    # pid -> (role, start time)
+    running: Dict[int, Tuple[str, float]] = {}
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for role, target in targets.items():
+            running[_fork(target)] = (role, time.monotonic())
+        print(f"Supervisor {os.getpid()}: {processes} reader(s) on port {port}, writer on "
+              f"{writer_address[0]}:{writer_address[1]}")
+        while True:
+            pid, status = os.wait()
+            if pid not in running:
+                continue
+            role, started = running.pop(pid)
+            print(f"{role} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting",
+                  file=sys.stderr)
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            running[_fork(targets[role])] = (role, time.monotonic())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for stop_signal in STOP_SIGNALS:
+            signal.signal(stop_signal, signal.SIG_IGN)
+        # readers first: they forward their last writes to the writer
+        _stop(pid for pid, (role, _) in running.items() if role != "writer")
+        _stop(pid for pid, (role, _) in running.items() if role == "writer")
+        writer_socket.close()
+        shutil.rmtree(metrics_directory, ignore_errors=True)
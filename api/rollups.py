@@ -0,0 +1,217 @@
+"""
+Precomputed aggregates (rollups) for GET /stats.
+
+For every group-by dimension the rollup keeps one running aggregate per
+group (count, sum, min, max). TransactionIndex updates them as
+transactions are added, updated and removed, so a stats request costs
+O(groups) instead of a scan over every transaction.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Aggregate:
+    """
+    count, sum, min, max and average of one group.
+
+    Only O(1) state is kept per group. Removing the current min or max
+    marks the aggregate stale; Rollups then recomputes both from the
+    group's members the next time it is read.
+    """
+
+    __slots__ = ("count", "total", "numeric", "low", "high", "stale")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        # number of members with a numeric amount (sum/min/max/avg are over these)
+        self.numeric = 0
+        self.low: Optional[float] = None
+        self.high: Optional[float] = None
+        self.stale = False
+
+    def add(self, amount: Optional[float]) -> None:
+        self.count += 1
+        if amount is not None:
+            self.total += amount
+            self.numeric += 1
+            if self.low is None or amount < self.low:
+                self.low = amount
+            if self.high is None or amount > self.high:
+                self.high = amount
+
+    def remove(self, amount: Optional[float]) -> None:
+        self.count -= 1
+        if amount is not None:
+            self.total -= amount
+            self.numeric -= 1
+            if not self.numeric:
+                self.low = self.high = None
+                self.stale = False
+            elif amount == self.low or amount == self.high:
+                self.stale = True
+
+    def refresh(self, amounts: Iterable[float]) -> None:
+        """Recompute min/max from the group's current amounts."""
+        amounts = list(amounts)
+        self.low = min(amounts, default=None)
+        self.high = max(amounts, default=None)
+        self.stale = False
+
+    def state(self) -> List[Any]:
+        """The aggregate's fields as a JSON-compatible list (see from_state)."""
+        return [self.count, self.total, self.numeric, self.low, self.high, self.stale]
+
+    @classmethod
+    def from_state(cls, state: List[Any]) -> "Aggregate":
+        aggregate = cls.__new__(cls)
+        aggregate.count, aggregate.total, aggregate.numeric, aggregate.low, aggregate.high, aggregate.stale = state
+        return aggregate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.low,
+            "max": self.high,
+            "avg": self.total / self.numeric if self.numeric else None,
+        }
+
+
+class Rollups:
+    """
+    Aggregates per group for each dimension in DIMENSIONS.
+
+    Field dimensions group by the raw field value; time dimensions group
+    by the UTC day ("2024-05-10"), ISO week ("2024-W19") or month
+    ("2024-05") of the transaction's epoch. Records without a value for a
+    dimension are only counted in the overall totals.
+    """
+
+    FIELD_DIMENSIONS = ["transaction_type", "sender", "receiver"]
+    TIME_DIMENSIONS = ["day", "week", "month"]
+    DIMENSIONS = FIELD_DIMENSIONS + TIME_DIMENSIONS
+
+    def __init__(self, group_amounts: Optional[Callable[[Optional[str], Any], Iterable[float]]] = None):
+        """
+        group_amounts(dimension, key) yields the amounts of a group's current
+        members (dimension None: the overall totals); it is used to refresh
+        a min/max invalidated by a removal.
+        """
+        self.groups: Dict[str, Dict[Any, Aggregate]] = {dimension: {} for dimension in self.DIMENSIONS}
+        self.totals = Aggregate()
+        self._group_amounts = group_amounts
+
+    @staticmethod
+    def bucket_bounds(dimension: str, key: str) -> Tuple[float, float]:
+        """[start, end) epoch seconds of a day/week/month bucket key."""
+        if dimension == "day":
+            start = datetime.strptime(key, "%Y-%m-%d")
+            end = start + timedelta(days=1)
+        elif dimension == "week":
+            year, week = key.split("-W")
+            start = datetime.fromisocalendar(int(year), int(week), 1)
+            end = start + timedelta(days=7)
+        else:
+            start = datetime.strptime(key, "%Y-%m")
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        return (start.replace(tzinfo=timezone.utc).timestamp(),
+                end.replace(tzinfo=timezone.utc).timestamp())
+
+    def _fresh(self, aggregate: Aggregate, dimension: Optional[str], key: Any) -> Aggregate:
+        if aggregate.stale and self._group_amounts is not None:
+            aggregate.refresh(self._group_amounts(dimension, key))
+        return aggregate
+
+    @staticmethod
+    def time_keys(epoch: Optional[float]) -> Dict[str, str]:
+        """{dimension: bucket key} of every time dimension ({} without a usable epoch)."""
+        if epoch is None:
+            return {}
+        try:
+            dt = datetime.fromtimestamp(epoch, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return {}
+        year, week, _ = dt.isocalendar()
+        return {
+            "day": dt.strftime("%Y-%m-%d"),
+            "week": f"{year}-W{week:02d}",
+            "month": dt.strftime("%Y-%m"),
+        }
+
+    def _keys(self, tx: Dict[str, Any], epoch: Optional[float]) -> Dict[str, Any]:
+        keys = {dimension: tx.get(dimension) for dimension in self.FIELD_DIMENSIONS}
+        keys.update(self.time_keys(epoch))
+        return keys
+
+    def add(self, tx: Dict[str, Any], amount: Optional[float], epoch: Optional[float]) -> None:
+        """Count a transaction in. amount/epoch are the index's numeric keys (or None)."""
+        self.totals.add(amount)
+        for dimension, key in self._keys(tx, epoch).items():
+            if key is not None:
+                groups = self.groups[dimension]
+                aggregate = groups.get(key)
+                if aggregate is None:
+                    aggregate = groups[key] = Aggregate()
+                aggregate.add(amount)
+
+    def remove(self, tx: Dict[str, Any], amount: Optional[float], epoch: Optional[float]) -> None:
+        """Count a transaction out (same arguments as when it was added)."""
+        self.totals.remove(amount)
+        for dimension, key in self._keys(tx, epoch).items():
+            groups = self.groups[dimension]
+            aggregate = groups.get(key)
+            if aggregate is None:
+                continue
+            aggregate.remove(amount)
+            if not aggregate.count:
+                del groups[key]
+
+    def stats(self, dimension: str) -> List[Dict[str, Any]]:
+        """
+        One row per group of a dimension, sorted by key: {"key", "count", "sum", "min", "max", "avg"}.
+
+        Complexity: O(g log g) for g groups, independent of the number of
+        transactions (plus the size of any group whose min/max was removed).
+        Raises ValueError for an unknown dimension.
+        """
+        if dimension not in self.groups:
+            raise ValueError(f"unknown group_by {dimension!r}")
+        groups = self.groups[dimension]
+        return self.rows({key: self._fresh(aggregate, dimension, key) for key, aggregate in groups.items()})
+
+    @staticmethod
+    def rows(groups: Dict[Any, Aggregate]) -> List[Dict[str, Any]]:
+        """Stats rows of {key: aggregate}, sorted by key as text (then by key type)."""
+        rows = []
+        for key, aggregate in sorted(groups.items(), key=lambda item: (str(item[0]), type(item[0]).__name__)):
+            row = {"key": key}
+            row.update(aggregate.to_dict())
+            rows.append(row)
+        return rows
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Every aggregate as JSON-compatible data, for a snapshot (see
+        snapshot.py). Group keys are kept in [key, aggregate] pairs so
+        non-string keys keep their type.
+        """
+        return {
+            "totals": self.totals.state(),
+            "groups": {dimension: [[key, aggregate.state()] for key, aggregate in groups.items()]
+                       for dimension, groups in self.groups.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any],
+                   group_amounts: Optional[Callable[[Optional[str], Any], Iterable[float]]] = None) -> "Rollups":
+        rollups = cls(group_amounts)
+        rollups.totals = Aggregate.from_state(state["totals"])
+        for dimension, pairs in state["groups"].items():
+            rollups.groups[dimension] = {key: Aggregate.from_state(aggregate) for key, aggregate in pairs}
+        return rollups
+
+    def totals_dict(self) -> Dict[str, Any]:
+        """Aggregates over every transaction."""
+        return self._fresh(self.totals, None, None).to_dict()
@@ -0,0 +1,193 @@
+"""
+Binary snapshot of the resident dataset and its indexes (fast restarts).
+
+Parsing api_ready_transactions.json and building the TransactionIndex
+costs seconds for large datasets, on every start and every reload. A
+snapshot holds the same state in the layout it has in memory, so it can
+be opened without parsing:
+
+    header   magic, format version, table-of-contents length, payload
+             length and the CRC-32 of everything after the header
+    toc      JSON: byte order, metadata, and {section: [offset, length,
+             array typecode, item size]}
+    payload  the sections, each aligned to 8 bytes: typed arrays in
+             native byte order (columns, posting lists, sorted keys), a
+             few JSON tables (string dictionaries, record shapes,
+             rollups) and the raw record payload of the column store
+
+The file is opened with mmap. Arrays are copied out of the mapping with
+one memcpy each (they must stay growable); the record payload, the bulk
+of the file, is read in place through a memoryview, so it is never
+copied onto the heap and processes that map the same snapshot share its
+pages in the OS page cache.
+
+A snapshot is only a cache of the data file: the store writes it after
+a compaction and at shutdown, and throws it away (SnapshotError) if its
+checksum, format or byte order does not match.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+MAGIC = b"TXNSNAP\x00"
+FORMAT_VERSION = 1
+# magic, format version, toc length, payload length, crc32 of toc + payload
+HEADER = struct.Struct("<8sIIQI4x")
+ALIGNMENT = 8
+
+Chunks = Union[bytes, memoryview, Iterable[Union[bytes, memoryview]]]
+
+
+class SnapshotError(ValueError):
+    """The snapshot is missing, damaged or was written by an incompatible version."""
+
+
+def _padding(length: int) -> int:
+    return -length % ALIGNMENT
+
+
+class SnapshotWriter:
+    """
+    Collects sections, then writes them as one snapshot file (write()).
+
+    Sections are written in the order they were added. A section may be
+    given as an iterable of chunks with its total length, so a large one
+    (the column store's record payload) is streamed instead of joined.
+    JSON sections are only encoded by write(), so the owner's lock need
+    not be held for it: pass values that are not modified afterwards.
+    """
+
+    def __init__(self):
+        self._sections: List[Tuple[str, int, Optional[str], Chunks]] = []
+        self._json: Dict[str, Any] = {}
+
+    def add_bytes(self, name: str, data: Chunks, length: Optional[int] = None) -> None:
+        if length is None:
+            length = len(data)
+        self._sections.append((name, length, None, data))
+
+    def add_array(self, name: str, values: array) -> None:
+        data = memoryview(values).cast("B")
+        self._sections.append((name, len(data), values.typecode, data))
+
+    def add_json(self, name: str, value: Any) -> None:
+        self._json[name] = value
+        # encoded by write()
+        self._sections.append((name, -1, None, b""))
+
+    def write(self, path: Path, meta: Dict[str, Any]) -> int:
+        """
+        Write the snapshot to path atomically (temporary file, fsync, rename).
+
+        Returns the size of the file in bytes.
+        """
+        path = Path(path)
+        for position, (name, length, typecode, data) in enumerate(self._sections):
+            if name in self._json:
+                data = json.dumps(self._json.pop(name), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                self._sections[position] = (name, len(data), typecode, data)
+        sections = {}
+        offset = 0
+        for name, length, typecode, _ in self._sections:
+            sections[name] = [offset, length, typecode, array(typecode).itemsize if typecode else 1]
+            offset += length + _padding(length)
+        toc = json.dumps({"byteorder": sys.byteorder, "meta": meta, "sections": sections},
+                         ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        toc += b" " * _padding(HEADER.size + len(toc))
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(bytes(HEADER.size))
+                checksum = zlib.crc32(toc)
+                file.write(toc)
+                for name, length, _, data in self._sections:
+                    chunks = [data] if isinstance(data, (bytes, bytearray, memoryview)) else data
+                    written = 0
+                    for chunk in chunks:
+                        checksum = zlib.crc32(chunk, checksum)
+                        file.write(chunk)
+                        written += len(chunk)
+                    if written != length:
+                        raise ValueError(f"section {name!r}: {written} bytes written, {length} announced")
+                    pad = bytes(_padding(length))
+                    checksum = zlib.crc32(pad, checksum)
+                    file.write(pad)
+                file.seek(0)
+                file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(toc), offset, checksum))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return HEADER.size + len(toc) + offset
+
+
+class Snapshot:
+    """
+    A snapshot file mapped into memory, validated on open.
+
+    The mapping stays open for as long as any memoryview returned by
+    view() is alive; the file itself may be replaced (renamed over) in
+    the meantime.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        try:
+            with open(self.path, "rb") as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            raise SnapshotError(f"{self.path} is empty") from None
+        self.size = len(self._map)
+        if self.size < HEADER.size:
+            raise SnapshotError(f"{self.path} is truncated")
+        magic, version, toc_length, payload_length, checksum = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path} is not a snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{self.path} has format version {version}, expected {FORMAT_VERSION}")
+        if HEADER.size + toc_length + payload_length != self.size:
+            raise SnapshotError(f"{self.path} is truncated")
+        body = memoryview(self._map)[HEADER.size:]
+        if zlib.crc32(body) != checksum:
+            raise SnapshotError(f"{self.path} is damaged (checksum mismatch)")
+
+        toc = json.loads(bytes(body[:toc_length]))
+        if toc["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{self.path} was written on a {toc['byteorder']}-endian machine")
+        self.meta: Dict[str, Any] = toc["meta"]
+        self._sections: Dict[str, List[Any]] = toc["sections"]
+        for name, (_, _, typecode, itemsize) in self._sections.items():
+            if typecode is not None and array(typecode).itemsize != itemsize:
+                raise SnapshotError(f"{self.path}: section {name!r} has {itemsize}-byte items")
+        self._payload = body[toc_length:]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def view(self, name: str) -> memoryview:
+        """The bytes of a section, in place (no copy)."""
+        try:
+            offset, length, _, _ = self._sections[name]
+        except KeyError:
+            raise SnapshotError(f"{self.path} has no section {name!r}") from None
+        return self._payload[offset:offset + length]
+
+    def array(self, name: str) -> array:
+        """A typed-array section, copied into a new (growable) array."""
+        data = self.view(name)
+        values = array(self._sections[name][2])
+        values.frombytes(data)
+        return values
+
+    def json(self, name: str) -> Any:
+        return json.loads(bytes(self.view(name)))
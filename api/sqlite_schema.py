@@ -0,0 +1,57 @@
+"""
+Statements and row conversion for the SQLite database of
+Database/sqlite_schema.sql.
+
+Both writers of that database use this module, so they store the same
+row for the same transaction: the API's SqliteTransactionStore (db.py,
+imported as `sqlite_schema`) and the ETL loader (etl/load_db.py, which
+runs from the repository root and imports it as `api.sqlite_schema`).
+It must therefore only import the standard library.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+SCHEMA_FILE = Path(__file__).resolve().parent.parent / "Database" / "sqlite_schema.sql"
+
+UPSERT_USER_SQL = "INSERT OR IGNORE INTO USERS (Full_name) VALUES (?)"
+UPSERT_TRANSACTION_SQL = """
+    INSERT INTO TRANSACTIONS (Transaction_id, Sender_id, Receiver_id, Category_id,
+                              Type, Amount, Transaction_transaction_type, Payload)
+    VALUES (?,
+            (SELECT User_id FROM USERS WHERE Full_name = ?),
+            (SELECT User_id FROM USERS WHERE Full_name = ?),
+            (SELECT Category_id FROM CATEGORIES WHERE Category_name = ?),
+            ?, ?, ?, ?)
+    ON CONFLICT (Transaction_id) DO UPDATE SET
+        Sender_id = excluded.Sender_id, Receiver_id = excluded.Receiver_id,
+        Category_id = excluded.Category_id, Type = excluded.Type, Amount = excluded.Amount,
+        Transaction_transaction_type = excluded.Transaction_transaction_type,
+        Payload = excluded.Payload
+"""
+DELETE_TRANSACTION_SQL = "DELETE FROM TRANSACTIONS WHERE Transaction_id = ?"
+
+
+def _scalar(value: Any) -> Any:
+    """A value SQLite can store in a typed column (None for lists, dicts, bools)."""
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def transaction_row(tx: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Parameters of UPSERT_TRANSACTION_SQL for one transaction. Ids like
+    "12" are stored as integers (in the column and the payload).
+    """
+    tx_id = tx.get("id")
+    if isinstance(tx_id, str) and tx_id.isdigit():
+        tx_id = int(tx_id)
+    payload = dict(tx, id=tx_id) if tx_id is not tx.get("id") else tx
+    return (
+        tx_id, _scalar(tx.get("sender")), _scalar(tx.get("receiver")),
+        _scalar(tx.get("category")), _scalar(tx.get("transaction_type")),
+        _scalar(tx.get("amount")), _scalar(tx.get("timestamp")),
+        json.dumps(payload, ensure_ascii=False),
+    )
@@ -0,0 +1,289 @@
+"""
+Full-text index over transaction texts (GET /transactions?q=...).
+
+The text fields of a record (TEXT_FIELDS: the ETL's "description" and
+the raw SMS "body") are split into lowercase word tokens. The index
+keeps:
+
+    terms     the vocabulary, token -> term number
+    postings  per term, the ascending ids of the transactions containing it
+    grams     per character trigram, the ascending numbers of the terms
+              containing it; terms are prefixed with START first, so the
+              gram START + "ab" lists the terms that begin with "ab"
+
+A query is split the same way and every word of it must match (AND). A
+query word matches a term equal to it, a term it begins (prefix) and,
+from three characters on, a term it occurs in (a merchant fragment, the
+last digits of a phone number, part of a TxId). Those terms are found in
+the vocabulary through the word's rarest trigram, so a lookup costs
+O(terms sharing that trigram + postings of the matching terms),
+independently of the number of transactions.
+
+Matches are ranked by the sum, over the query words, of the weight of
+the best term each matched: the kind of match (MATCH_WEIGHTS) times the
+term's inverse document frequency, so rare tokens such as TxIds and
+phone numbers outrank words every message contains.
+
+Removing a transaction only empties postings; terms stay in the
+vocabulary (with no postings they match nothing) until the next rebuild.
+"""
+
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from snapshot import Snapshot, SnapshotWriter
+
+TEXT_FIELDS = ("description", "body")
+# a longer word is indexed (and searched for) as pieces of this length
+MAX_TERM_LENGTH = 64
+TOKEN = re.compile(r"\w{1,%d}" % MAX_TERM_LENGTH)
+START = "\x02"
+MATCH_WEIGHTS = {"exact": 1.0, "prefix": 0.75, "substring": 0.5}
+
+
+def tokenize(text: str) -> List[str]:
+    """The indexable tokens of a text, lowercased, in order (repeats included)."""
+    return TOKEN.findall(text.casefold())
+
+
+def record_terms(tx: Dict[str, Any]) -> Set[str]:
+    """Distinct tokens of a record's text fields."""
+    terms = set()
+    for field in TEXT_FIELDS:
+        value = tx.get(field)
+        if isinstance(value, str):
+            terms.update(tokenize(value))
+    return terms
+
+
+def term_grams(term: str) -> Set[str]:
+    """Trigrams of START + term (none for a one-character term)."""
+    padded = START + term
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TextQuery:
+    """
+    A parsed query: for each query word, the (postings, weight) of every
+    term it matches. estimated_rows bounds the number of matches: the
+    postings of the rarest word.
+    """
+
+    def __init__(self, text: str, words: List[List[Tuple[array, float]]]):
+        self.text = text
+        self.words = words
+        self.estimated_rows = min(self.word_rows(word) for word in words)
+
+    @staticmethod
+    def word_rows(word: List[Tuple[array, float]]) -> int:
+        return sum(len(postings) for postings, _ in word)
+
+
+class TextIndex:
+    """
+    Token and trigram inverted index of the records' text fields.
+
+    Postings and gram lists are typed arrays kept sorted, so add() and
+    remove() only touch the terms of one record.
+    """
+
+    def __init__(self, transactions: Iterable[Dict[str, Any]] = ()):
+        self.terms: List[str] = []
+        self.term_numbers: Dict[str, int] = {}
+        self.postings: List[array] = []
+        self.grams: Dict[str, array] = {}
+        # visit ids in ascending order so every posting list starts sorted
+        lists: Dict[str, List[int]] = {}
+        for tx in sorted(transactions, key=lambda tx: tx["id"]):
+            tx_id = tx["id"]
+            for term in record_terms(tx):
+                ids = lists.get(term)
+                if ids is None:
+                    ids = lists[term] = []
+                ids.append(tx_id)
+        for term, ids in lists.items():
+            self._postings(term).extend(ids)
+
+    def _postings(self, term: str) -> array:
+        """Posting list of a term, adding the term to the vocabulary if new."""
+        number = self.term_numbers.get(term)
+        if number is None:
+            number = self.term_numbers[term] = len(self.terms)
+            self.terms.append(term)
+            self.postings.append(array("q"))
+            for gram in term_grams(term):
+                numbers = self.grams.get(gram)
+                if numbers is None:
+                    numbers = self.grams[gram] = array("q")
+                numbers.append(number)
+        return self.postings[number]
+
+    def add(self, tx_id: int, tx: Dict[str, Any]) -> None:
+        """Index one record's text. O(terms * log n)."""
+        for term in record_terms(tx):
+            insort(self._postings(term), tx_id)
+
+    def add_many(self, txs: Iterable[Dict[str, Any]]) -> None:
+        """Index a batch of records, merging each term's new ids in once."""
+        batch: Dict[str, List[int]] = {}
+        for tx in txs:
+            for term in record_terms(tx):
+                batch.setdefault(term, []).append(tx["id"])
+        for term, ids in batch.items():
+            number = self.term_numbers.get(term)
+            if number is None:
+                self._postings(term).extend(sorted(ids))
+            else:
+                self.postings[number] = array("q", heapq.merge(self.postings[number], sorted(ids)))
+
+    def remove(self, tx_id: int, tx: Dict[str, Any]) -> None:
+        """Drop one record's text from the postings. O(terms * log n)."""
+        for term in record_terms(tx):
+            number = self.term_numbers.get(term)
+            if number is None:
+                continue
+            postings = self.postings[number]
+            pos = bisect_left(postings, tx_id)
+            if pos < len(postings) and postings[pos] == tx_id:
+                del postings[pos]
+
+    def _matching_terms(self, word: str) -> Iterable[int]:
+        """Numbers of the terms a query word can match (a superset for substrings)."""
+        if len(word) < 2:
+            number = self.term_numbers.get(word)
+            return () if number is None else (number,)
+        grams = term_grams(word)
+        if len(word) == 2:
+            # too short to be searched inside terms: prefixes only
+            grams = {START + word}
+        else:
+            grams.discard(START + word[:2])
+        return min((self.grams.get(gram, ()) for gram in grams), key=len)
+
+    def parse(self, text: str, documents: int) -> TextQuery:
+        """
+        Look a query up in the vocabulary; `documents` (the number of
+        indexed records) scales the terms' inverse document frequency.
+        Raises ValueError if the query has no searchable word.
+        """
+        query_words = list(dict.fromkeys(tokenize(text)))
+        if not query_words:
+            raise ValueError(f"no searchable word in {text!r}")
+        total = max(1, documents)
+        words = []
+        for word in query_words:
+            matches = []
+            for number in self._matching_terms(word):
+                term = self.terms[number]
+                postings = self.postings[number]
+                if not postings:
+                    continue
+                if term == word:
+                    kind = "exact"
+                elif term.startswith(word):
+                    kind = "prefix"
+                elif word in term:
+                    kind = "substring"
+                else:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                matches.append((postings, MATCH_WEIGHTS[kind] * idf))
+            words.append(matches)
+        return TextQuery(text, words)
+
+    def scores(self, query: TextQuery, within: Optional[List[int]] = None
+               ) -> Tuple[List[int], Dict[int, float]]:
+        """
+        Ids matching every word of the query, restricted to the ascending
+        ids `within` if given, and their scores.
+
+        Words are applied rarest first, each restricted to the ids the
+        previous ones left. Returns (ascending ids, {id: score}).
+        """
+        ids = within
+        totals: Dict[int, float] = {}
+        for position, word in enumerate(sorted(query.words, key=TextQuery.word_rows)):
+            best = self._word_scores(word, ids)
+            if position == 0 and within is None:
+                # a single term's postings are already ascending
+                ids = list(word[0][0]) if len(word) == 1 else sorted(best)
+            else:
+                ids = [tx_id for tx_id in ids if tx_id in best]
+            totals = {tx_id: totals.get(tx_id, 0.0) + best[tx_id] for tx_id in ids}
+            if not ids:
+                break
+        return ids, totals
+
+    @staticmethod
+    def _word_scores(word: List[Tuple[array, float]], within: Optional[List[int]]) -> Dict[int, float]:
+        """{id: weight of its best matching term} for one query word."""
+        best: Dict[int, float] = {}
+        within_set = None
+        # lightest first, so a heavier match of the same id overwrites it
+        for postings, weight in sorted(word, key=lambda match: match[1]):
+            if within is None:
+                ids = postings
+            elif len(postings) > 8 * len(within):
+                # DSA: probe the long posting list by binary search, O(k log m)
+                ids = []
+                lo = 0
+                for tx_id in within:
+                    lo = bisect_left(postings, tx_id, lo)
+                    if lo == len(postings):
+                        break
+                    if postings[lo] == tx_id:
+                        ids.append(tx_id)
+            else:
+                if within_set is None:
+                    within_set = set(within)
+                ids = [tx_id for tx_id in postings if tx_id in within_set]
+            best.update(dict.fromkeys(ids, weight))
+        return best
+
+    def snapshot(self, writer: SnapshotWriter, prefix: str) -> None:
+        """Add the vocabulary, postings and grams to a snapshot (copies; call under the owner's lock)."""
+        postings = array("q")
+        ends = array("q")
+        for ids in self.postings:
+            postings.extend(ids)
+            ends.append(len(postings))
+        writer.add_json(prefix + "terms", self.terms[:])
+        writer.add_array(prefix + "ends", ends)
+        writer.add_array(prefix + "postings", postings)
+        numbers = array("q")
+        gram_ends = array("q")
+        for gram_numbers in self.grams.values():
+            numbers.extend(gram_numbers)
+            gram_ends.append(len(numbers))
+        writer.add_json(prefix + "grams", list(self.grams))
+        writer.add_array(prefix + "gram_ends", gram_ends)
+        writer.add_array(prefix + "gram_terms", numbers)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot, prefix: str) -> "TextIndex":
+        index = cls()
+        index.terms = snapshot.json(prefix + "terms")
+        index.term_numbers = {term: number for number, term in enumerate(index.terms)}
+        postings = snapshot.array(prefix + "postings")
+        start = 0
+        for end in snapshot.array(prefix + "ends"):
+            index.postings.append(postings[start:end])
+            start = end
+        numbers = snapshot.array(prefix + "gram_terms")
+        start = 0
+        for gram, end in zip(snapshot.json(prefix + "grams"), snapshot.array(prefix + "gram_ends")):
+            index.grams[gram] = numbers[start:end]
+            start = end
+        return index
+
+    def stats(self) -> Dict[str, int]:
+        """Vocabulary size, postings and trigrams, for index_stats(). O(terms)."""
+        return {
+            "terms": len(self.terms),
+            "postings": sum(len(ids) for ids in self.postings),
+            "grams": len(self.grams),
+        }
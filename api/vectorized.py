@@ -0,0 +1,249 @@
+"""
+Optional NumPy execution path over the ColumnStore columns (see indexer.py).
+
+The typed arrays of a ColumnStore are viewed as NumPy arrays without
+copying (np.frombuffer), so a predicate is one vectorized comparison over
+a whole column instead of a Python loop over records:
+
+    equality    code column == dictionary code of the value
+    ranges      low <= amount/epoch column <= high
+    AND         boolean masks combined with &
+    group by    np.unique / np.bincount over the encoded group keys
+
+Results are identical to the pure-Python path. The few rows whose value
+does not fit a column (non-string values of a coded field, ints beyond
+2**53) are evaluated in Python. Float sums may differ in the last digit,
+because NumPy adds in a different order.
+
+NumPy is optional: when it is not installed available() is False and
+TransactionIndex keeps using the pure-Python path.
+
+The views share memory with arrays that writers append to, and an array
+cannot grow while a view of it exists. Callers therefore hold the store's
+read lock, and nothing returned from here is a view: every result is
+converted to Python objects first.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rollups import Aggregate, Rollups
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SECONDS_PER_DAY = 86400.0
+
+
+def available() -> bool:
+    """True if NumPy can be imported."""
+    return np is not None
+
+
+def _view(values, dtype):
+    return np.frombuffer(values, dtype=dtype) if len(values) else np.empty(0, dtype=dtype)
+
+
+def live_mask(store):
+    """
+    Boolean mask of the rows that are the current version of their id.
+
+    Cached in store.vector_cache until the next put or delete (rows are
+    append-only, so (rows, garbage) identifies the store's state).
+    """
+    state = (len(store._row_ids), store.garbage)
+    cached = store.vector_cache.get("live")
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    row_ids = _view(store._row_ids, np.int64)
+    row_of = _view(store._row_of, np.int64)
+    rows = np.arange(len(row_ids))
+    dense = (row_ids >= 0) & (row_ids < len(row_of))
+    mask = np.zeros(len(row_ids), dtype=bool)
+    mask[dense] = row_of[row_ids[dense]] == rows[dense]
+    for tx_id, row in store._sparse.items():
+        if store._row(tx_id) == row:
+            mask[row] = True
+    store.vector_cache["live"] = (state, mask)
+    return mask
+
+
+def _code_of(store, value: Any) -> Optional[int]:
+    return store._string_lookup.get(value) if isinstance(value, str) else None
+
+
+def filter_rows(store, exact: Dict[str, Any], loose: Dict[str, Any],
+                ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+                matches: Callable[[Any, Any], bool]):
+    """
+    Rows (ascending) of live transactions matching every predicate.
+
+    exact: {coded field: string}, compared like the hash indexes do.
+    loose: {coded field: string}, compared with matches(stored, value), so
+           non-string stored values are also tried as text.
+    ranges: {"amount" | "timestamp": (low, high)}, inclusive, None = open.
+    """
+    mask = live_mask(store).copy()
+    for field, value in exact.items():
+        code = _code_of(store, value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        mask &= _view(store._codes[field], np.uint32) == code
+    for field, value in loose.items():
+        codes = _view(store._codes[field], np.uint32)
+        code = _code_of(store, value)
+        wanted = codes == code if code is not None else np.zeros(len(codes), dtype=bool)
+        for row in np.flatnonzero(mask & (codes == store._OTHER)).tolist():
+            if matches(store._materialize(row).get(field), value):
+                wanted[row] = True
+        mask &= wanted
+    for field, (low, high) in ranges.items():
+        if field == "amount":
+            kinds = _view(store._amount_kinds, np.int8)
+            keys = _view(store._amounts, np.float64)
+            in_range = ((kinds == store._INT) | (kinds == store._FLOAT)) & ~np.isnan(keys)
+        else:
+            keys = _view(store._epochs, np.float64)
+            in_range = ~np.isnan(keys)
+        if low is not None:
+            in_range &= keys >= low
+        if high is not None:
+            in_range &= keys <= high
+        if field == "amount":
+            for row in np.flatnonzero(mask & (kinds == store._BIG)).tolist():
+                amount = store._amount_at(row)
+                if (low is None or amount >= low) and (high is None or amount <= high):
+                    in_range[row] = True
+        mask &= in_range
+    return np.flatnonzero(mask)
+
+
+def page_ids(store, rows, order: str, after: Any, limit: Optional[int]) -> List[int]:
+    """
+    Ids of `rows` in output order ("id" or "timestamp"), after the keyset
+    cursor, at most limit + 1 of them (one more than a page shows whether
+    another page follows). Rows without a time come last when ordering by
+    timestamp, as in the Python path: their key is +inf (so is the
+    cursor's epoch for such a row).
+    """
+    ids = _view(store._row_ids, np.int64)[rows]
+    if order == "id":
+        ids.sort()
+        if after is not None:
+            ids = ids[np.searchsorted(ids, after, side="right"):]
+    else:
+        epochs = _view(store._epochs, np.float64)[rows]
+        epochs = np.where(np.isnan(epochs), np.inf, epochs)
+        if after is not None:
+            after_epoch, after_id = after
+            later = (epochs > after_epoch) | ((epochs == after_epoch) & (ids > after_id))
+            ids, epochs = ids[later], epochs[later]
+        ids = ids[np.lexsort((ids, epochs))]
+    if limit is not None:
+        ids = ids[:limit + 1]
+    return ids.tolist()
+
+
+def _group_labels(store, rows, dimension: str):
+    """
+    (labels, keys, loose): the group number of every row (-1: no group),
+    the key of every group, and the rows whose key is only known in Python.
+    """
+    if dimension in Rollups.TIME_DIMENSIONS:
+        epochs = _view(store._epochs, np.float64)[rows]
+        timed = np.flatnonzero(~np.isnan(epochs))
+        _, first, inverse = np.unique(np.floor(epochs[timed] / SECONDS_PER_DAY),
+                                         return_index=True, return_inverse=True)
+        # a bucket key per distinct day, taken from one of its epochs
+        day_keys = [Rollups.time_keys(epoch).get(dimension)
+                    for epoch in epochs[timed][first].tolist()]
+        keys = sorted({key for key in day_keys if key is not None})
+        number = {key: i for i, key in enumerate(keys)}
+        day_labels = np.array([number.get(key, -1) for key in day_keys], dtype=np.int64)
+        labels = np.full(len(rows), -1, dtype=np.int64)
+        labels[timed] = day_labels[inverse.ravel()]
+        return labels, keys, np.empty(0, dtype=np.int64)
+
+    codes = _view(store._codes[dimension], np.uint32)[rows]
+    used, labels = np.unique(codes, return_inverse=True)
+    labels = labels.ravel().astype(np.int64)
+    keys = [store._strings[code] for code in used.tolist()]
+    # absent/None values belong to no group; other non-strings are Python-side
+    for code in (store._ABSENT, store._OTHER):
+        position = np.searchsorted(used, code)
+        if position < len(used) and used[position] == code:
+            labels[labels == position] = -1
+    loose = rows[codes == store._OTHER]
+    return labels, keys, loose
+
+
+def _fill(aggregates: List[Aggregate], labels, store, rows) -> None:
+    """Vectorized count/sum/min/max of `rows` into aggregates[label]."""
+    groups = len(aggregates)
+    grouped = labels >= 0
+    labels, rows = labels[grouped], rows[grouped]
+    kinds = _view(store._amount_kinds, np.int8)[rows]
+    amounts = _view(store._amounts, np.float64)[rows]
+
+    big = kinds == store._BIG
+    counts = np.bincount(labels[~big], minlength=groups)
+    for aggregate, count in zip(aggregates, counts.tolist()):
+        aggregate.count += count
+
+    for kind in (store._INT, store._FLOAT):
+        numeric = (kinds == kind) & ~np.isnan(amounts)
+        if not numeric.any():
+            continue
+        values, where = amounts[numeric], labels[numeric]
+        numerics = np.bincount(where, minlength=groups)
+        if kind == store._INT and np.abs(values).sum() >= 2.0 ** 53:
+            # partial sums would no longer be exact doubles
+            sums = [0] * groups
+            for label, value in zip(where.tolist(), values.tolist()):
+                sums[label] += int(value)
+        else:
+            sums = np.bincount(where, weights=values, minlength=groups).tolist()
+        lows = np.full(groups, np.inf)
+        highs = np.full(groups, -np.inf)
+        np.minimum.at(lows, where, values)
+        np.maximum.at(highs, where, values)
+        cast = int if kind == store._INT else float
+        for label, numeric_count in enumerate(numerics.tolist()):
+            if not numeric_count:
+                continue
+            aggregate = aggregates[label]
+            low, high = cast(lows[label]), cast(highs[label])
+            aggregate.total += cast(sums[label])
+            aggregate.numeric += numeric_count
+            aggregate.low = low if aggregate.low is None else min(aggregate.low, low)
+            aggregate.high = high if aggregate.high is None else max(aggregate.high, high)
+
+    # ints too large for the amount column
+    for label, row in zip(labels[big].tolist(), rows[big].tolist()):
+        aggregates[label].add(store._amount_at(row))
+
+
+def aggregate(store, rows, dimension: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Per-group and overall count/sum/min/max/avg of `rows`, in the format
+    of Rollups.stats() and Rollups.totals_dict().
+    Raises ValueError for an unknown dimension.
+    """
+    if dimension not in Rollups.DIMENSIONS:
+        raise ValueError(f"unknown group_by {dimension!r}")
+    rows = np.asarray(rows, dtype=np.int64)
+
+    totals = [Aggregate()]
+    _fill(totals, np.zeros(len(rows), dtype=np.int64), store, rows)
+
+    labels, keys, loose = _group_labels(store, rows, dimension)
+    aggregates = [Aggregate() for _ in keys]
+    _fill(aggregates, labels, store, rows)
+    groups = {key: aggregate for key, aggregate in zip(keys, aggregates) if aggregate.count}
+    for row in loose.tolist():
+        key = store._materialize(row)[dimension]
+        groups.setdefault(key, Aggregate()).add(store._amount_at(row))
+
+    return Rollups.rows(groups), totals[0].to_dict()
@@ -0,0 +1,59 @@
+"""
+Benchmark: legacy SMS transform vs the compiled rule engine.
+
+Runs transform_sms_to_api_format (detect_transaction_type + extract_amount
++ extract_parties) and transform_sms_compiled over the bundled backup,
+checks that both produce the same transactions, and prints the timings.
+
+    python bench/bench_extractor.py [--xml modified_sms_v2.xml] [--repeat 20]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from etl.extract_details import SmsExtractor  # noqa: E402
+from parse_sms import parse_sms_xml  # noqa: E402
+from transform_transactions import transform_sms_compiled, transform_sms_to_api_format  # noqa: E402
+
+
+def best_of(func, repeat):
+    """Best wall time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--xml", default=str(ROOT / "modified_sms_v2.xml"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    raw_sms = parse_sms_xml(args.xml)
+    extractor = SmsExtractor()
+
+    legacy = transform_sms_to_api_format(raw_sms)
+    compiled = transform_sms_compiled(raw_sms, extractor)
+    if legacy != compiled:
+        sys.exit("compiled engine output differs from transform_sms_to_api_format")
+
+    legacy_time = best_of(lambda: transform_sms_to_api_format(raw_sms), args.repeat)
+    compiled_time = best_of(lambda: transform_sms_compiled(raw_sms, extractor), args.repeat)
+
+    count = len(raw_sms)
+    print(f"messages:  {count} ({len(compiled)} transactions)")
+    print(f"legacy:    {legacy_time * 1000:8.2f} ms  ({legacy_time / count * 1e6:.2f} us/msg)")
+    print(f"compiled:  {compiled_time * 1000:8.2f} ms  ({compiled_time / count * 1e6:.2f} us/msg)")
+    print(f"speedup:   {legacy_time / compiled_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Microbenchmarks: SMS parsing, transformation and TransactionIndex operations.
+
+Writes a synthetic backup of each size (bench/synthetic_sms.py) to a
+temporary directory and times, best of --repeat runs:
+
+    parse           parse_sms_xml
+    transform       transform_sms_to_api_format / transform_sms_compiled
+    index build     TransactionIndex(...)
+    index search    field lookups, amount/time ranges, a multi-filter query,
+                    full-text searches (ranked, and combined with a filter)
+    index rebuild   TransactionIndex.rebuild over the same records
+    snapshot        writing the index as a binary snapshot, and loading it
+
+Prints a table, or with --json one JSON document with every timing, so
+runs can be stored and compared.
+
+    python bench/bench_pipeline.py [--sizes 10000 100000] [--repeat 3] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
+
+from bench_vectorized import best_of  # noqa: E402
+from synthetic_sms import write_sms_xml  # noqa: E402
+
+from db import TransactionStore  # noqa: E402
+from indexer import TransactionIndex, to_epoch  # noqa: E402
+from parse_sms import parse_sms_xml  # noqa: E402
+from snapshot import Snapshot  # noqa: E402
+from transform_transactions import transform_sms_compiled, transform_sms_to_api_format  # noqa: E402
+
+SEARCHES = [
+    ("search sender", lambda index: index.search_by_field("sender", "You")),
+    ("search type", lambda index: index.search_by_field("transaction_type", "bank_deposit")),
+    ("amount range", lambda index: index.search_by_amount_range(1000, 5000)),
+    ("time range", lambda index: index.search_by_timestamp_range(to_epoch("2024-06-01"), to_epoch("2024-07-01"))),
+    ("multi-filter query", lambda index: index.query({"receiver": "Jane Smith"}, {"amount": (500, None)},
+                                                   "timestamp", None, 50)),
+    ("text search", lambda index: index.query(text="samuel", order="relevance", limit=50)[0]),
+    ("text search + filter", lambda index: index.query({"transaction_type": "transfer"}, None, "id", None, 50,
+                                                       "8123")[0]),
+]
+
+
+def run_size(count, repeat, directory):
+    """Timings of every benchmark at one size, in seconds: {name: seconds}."""
+    path = os.path.join(directory, f"sms_{count}.xml")
+    write_sms_xml(path, count)
+    timings = {}
+
+    timings["parse"], raw_sms = best_of(lambda: parse_sms_xml(path), repeat)
+    timings["transform"], transactions = best_of(lambda: transform_sms_to_api_format(raw_sms), repeat)
+    timings["transform compiled"], _ = best_of(lambda: transform_sms_compiled(raw_sms), repeat)
+
+    # ids as the store holds them
+    TransactionStore._normalize_ids(transactions)
+    timings["index build"], index = best_of(lambda: TransactionIndex(transactions), repeat)
+    for name, search in SEARCHES:
+        # len() materializes lazily returned records
+        timings[name], _ = best_of(lambda: len(list(search(index))), repeat)
+    timings["index rebuild"], _ = best_of(lambda: index.rebuild(transactions), repeat)
+    snapshot_path = os.path.join(directory, f"index_{count}.snapshot")
+    timings["snapshot write"], _ = best_of(lambda: index.snapshot().write(snapshot_path, {}), repeat)
+    timings["snapshot load"], _ = best_of(
+        lambda: TransactionIndex([]).load_snapshot(Snapshot(snapshot_path)), repeat)
+    return {"messages": count, "transactions": len(transactions), "seconds": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.sizes:
+            start = time.perf_counter()
+            results.append(run_size(count, args.repeat, directory))
+            if not args.json:
+                result = results[-1]
+                print(f"\n{count} messages, {result['transactions']} transactions "
+                      f"({time.perf_counter() - start:.1f} s)")
+                for name, seconds in result["seconds"].items():
+                    print(f"  {name:20} {seconds * 1000:10.2f} ms  ({seconds / count * 1e6:8.3f} us/msg)")
+
+    if args.json:
+        print(json.dumps({"benchmark": "pipeline", "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: pure-Python vs NumPy (api/vectorized.py) query and aggregation paths.
+
+Builds a TransactionIndex over synthetic transactions, runs each query
+and filtered aggregation on both paths, checks that they agree, and
+prints the timings. Without NumPy only the Python path is timed.
+
+    python bench/bench_vectorized.py [--sizes 10000 100000 1000000] [--repeat 5]
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "api"))
+
+import vectorized  # noqa: E402
+from indexer import TransactionIndex, to_epoch  # noqa: E402
+
+TYPES = ["money_received", "payment", "transfer", "withdrawal", "airtime", "bank_deposit"]
+CATEGORIES = ["Transfer", "Payment", "Withdrawal", "Deposit", "Utility Bill", "Airtime"]
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+QUERIES = [
+    ("category filter (no index)", {"category": "Airtime"}, {}, "id", None),
+    ("type + amount + window", {"transaction_type": "payment"},
+     {"amount": (1000, 50000), "timestamp": (to_epoch("2024-03-01"), to_epoch("2024-09-01"))}, "timestamp", None),
+    ("amount range, by time, page", {}, {"amount": (5000, None)}, "timestamp", 50),
+    ("two parties + currency", {"sender": "You", "currency": "RWF"}, {"amount": (None, 20000)}, "id", 100),
+]
+AGGREGATES = [
+    ("sender totals, amount >= 1000", "sender", {}, {"amount": (1000, None)}),
+    ("monthly totals of payments", "month", {"transaction_type": "payment"}, {}),
+    ("daily totals of a category", "day", {"category": "Transfer"}, {}),
+]
+
+
+def synthetic(count, seed=7):
+    """ETL-shaped transactions with repeated parties, types and categories."""
+    rnd = random.Random(seed)
+    people = [f"Person {i}" for i in range(max(10, count // 200))]
+    for i in range(count):
+        received = rnd.random() < 0.4
+        party = rnd.choice(people)
+        yield {
+            "id": i,
+            "transaction_type": rnd.choice(TYPES),
+            "amount": rnd.randint(100, 100000),
+            "currency": "RWF",
+            "sender": party if received else "You",
+            "receiver": "You" if received else party,
+            "timestamp": (START + timedelta(minutes=rnd.randint(0, 365 * 24 * 60))).isoformat(),
+            "description": f"Synthetic transaction {i}",
+            "category": rnd.choice(CATEGORIES),
+        }
+
+
+def best_of(func, repeat):
+    """Best wall time of `repeat` runs, in seconds, and the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same_stats(a, b):
+    """Aggregates are equal up to floating-point rounding of the sums."""
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(same_stats(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_stats(a[key], b[key]) for key in a)
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9)
+    return a == b
+
+
+def run_size(count, repeat):
+    start = time.perf_counter()
+    index = TransactionIndex(list(synthetic(count)))
+    print(f"\n{count} transactions (index built in {time.perf_counter() - start:.1f} s)")
+    print(f"  {'':34} {'python':>10} {'numpy':>10} {'speedup':>8}")
+
+    def compare(name, func, normalize=lambda result: result):
+        index.vectorize = False
+        python_time, expected = best_of(func, repeat)
+        expected = normalize(expected)
+        if not vectorized.available():
+            print(f"  {name:34} {python_time * 1000:8.2f}ms {'-':>10} {'-':>8}")
+            return
+        index.vectorize = True
+        numpy_time, result = best_of(func, repeat)
+        if not same_stats(expected, normalize(result)):
+            sys.exit(f"{name}: NumPy path differs from the Python path")
+        print(f"  {name:34} {python_time * 1000:8.2f}ms {numpy_time * 1000:8.2f}ms "
+              f"{python_time / numpy_time:7.1f}x")
+
+    for name, equals, ranges, order, limit in QUERIES:
+        # records are materialized lazily, so the timing covers planning and
+        # execution; the ids are compared afterwards
+        compare(name, lambda: index.query(equals, ranges, order, None, limit),
+                lambda result: ([tx["id"] for tx in result[0]], result[1]["has_more"]))
+    for name, group_by, equals, ranges in AGGREGATES:
+        compare(name, lambda: index.aggregate(group_by, equals, ranges))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not vectorized.available():
+        print("NumPy is not installed: timing the Python path only")
+    for count in args.sizes:
+        run_size(count, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
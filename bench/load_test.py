@@ -0,0 +1,263 @@
+"""
+Load generator for the API server (api/app.py).
+
+Runs --concurrency client threads for --duration seconds against a
+server, each sending a weighted mix of reads (list pages, lookups by id,
+filtered queries, /stats) and, with probability --write-ratio, writes
+(create, update, delete of transactions it created). Prints one JSON
+document with the throughput and the p50/p95/p99 latency overall and per
+operation.
+
+    python bench/load_test.py --serve 100000 [--duration 10] [--concurrency 8]
+    python bench/load_test.py --url http://localhost:8000 --user admin --password password
+
+--serve N starts a server of its own on a free port, over N synthetic
+transactions in a temporary data file (bench/synthetic_sms.py), and
+stops it afterwards. Without it, writes go to the data of the server at
+--url; use --write-ratio 0 to leave it untouched. --server-processes
+runs that server in pre-fork mode (app.py --processes), to compare the
+throughput for 1, 2, 4, ... reader processes.
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synthetic_sms import iter_sms  # noqa: E402
+from transform_transactions import transform_sms_compiled  # noqa: E402
+
+PARTIES = ["You", "Jane Smith", "Samuel Carter", "Alex Doe", "Robert Brown", "Linda Green"]
+GROUPS = ["sender", "receiver", "transaction_type", "month", "day"]
+
+
+class Client:
+    """One client thread's view of the server: a request method and known ids."""
+
+    def __init__(self, url, user, password, rnd, max_id):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        token = base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
+        self.rnd = rnd
+        self.max_id = max_id
+        self.created = []
+        self.cursor = None
+        self.body = b""
+
+    def request(self, method, path, body=None):
+        """Send one request and read the whole response. Returns the status code."""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            connection.request(method, path, payload, self.headers)
+            response = connection.getresponse()
+            self.body = response.read()
+            if method == "POST" and response.status == 201:
+                self.created.append(json.loads(self.body)["data"]["id"])
+            return response.status
+        finally:
+            connection.close()
+
+    def page(self):
+        """Read the next page of the full list, starting over after the last one."""
+        path = "/transactions?limit=50" + (f"&cursor={self.cursor}" if self.cursor else "")
+        status = self.request("GET", path)
+        self.cursor = json.loads(self.body).get("next_cursor") if status == 200 else None
+        return status
+
+    def some_id(self):
+        return self.rnd.randint(1, self.max_id)
+
+    def transaction(self):
+        return {
+            "transaction_type": "payment_to_person",
+            "amount": self.rnd.randint(100, 50000),
+            "currency": "RWF",
+            "sender": "You",
+            "receiver": self.rnd.choice(PARTIES[1:]),
+            "timestamp": f"2024-{self.rnd.randint(1, 12):02d}-{self.rnd.randint(1, 28):02d}T12:00:00",
+            "description": "load test",
+        }
+
+
+# (name, weight, request): the read and the write mix
+READS = [
+    ("list page", 35, lambda c: c.page()),
+    ("get by id", 25, lambda c: c.request("GET", f"/transactions/{c.some_id()}")),
+    ("filtered query", 25, lambda c: c.request(
+        "GET", f"/transactions?sender={c.rnd.choice(PARTIES).replace(' ', '+')}"
+               f"&min_amount={c.rnd.randint(100, 20000)}&limit=100")),
+    ("stats", 15, lambda c: c.request("GET", f"/stats?group_by={c.rnd.choice(GROUPS)}")),
+]
+WRITES = [
+    ("create", 60, lambda c: c.request("POST", "/transactions", c.transaction())),
+    ("update", 30, lambda c: c.request("PUT", f"/transactions/{c.some_id()}",
+                                       {"amount": c.rnd.randint(100, 50000)})),
+    ("delete", 10, lambda c: c.request("DELETE", f"/transactions/{c.created.pop()}")
+     if c.created else c.request("POST", "/transactions", c.transaction())),
+]
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+
+
+def run_load(url, user, password, duration, concurrency, write_ratio, max_id, seed=7):
+    """Drive the server and return the report (see summarize) overall and per operation."""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        client = Client(url, user, password, random.Random(seed + number), max_id)
+        mine = defaultdict(list)
+        failed = defaultdict(int)
+        while time.perf_counter() < deadline:
+            mix = WRITES if client.rnd.random() < write_ratio else READS
+            name, _, request = client.rnd.choices(mix, [weight for _, weight, _ in mix])[0]
+            start = time.perf_counter()
+            try:
+                status = request(client)
+            except (OSError, http.client.HTTPException):
+                status = None
+            mine[name].append(time.perf_counter() - start)
+            # 404s are expected: ids are picked at random and may be deleted
+            if status is None or status >= 500 or status in (400, 401):
+                failed[name] += 1
+        with lock:
+            for name, values in mine.items():
+                latencies[name].extend(values)
+            for name, count in failed.items():
+                errors[name] += count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    every = [latency for values in latencies.values() for latency in values]
+    return {
+        "overall": summarize(every, sum(errors.values()), elapsed),
+        "operations": {name: summarize(values, errors[name], elapsed)
+                       for name, values in sorted(latencies.items())},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(count, directory, workers, processes=0):
+    """Start api/app.py over `count` synthetic messages. Returns (process, url, transactions)."""
+    transactions = transform_sms_compiled(iter_sms(count))
+    data_file = os.path.join(directory, "transactions.json")
+    with open(data_file, "w", encoding="utf-8") as f:
+        json.dump(transactions, f)
+
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "app.py", "--port", str(port), "--db", data_file, "--workers", str(workers),
+         "--processes", str(processes)],
+        cwd=ROOT / "api", stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}", len(transactions)
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    sys.exit("the server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--serve", type=int, metavar="N", help="start a server over N synthetic messages")
+    parser.add_argument("--server-workers", type=int, default=8, help="--workers of a --serve server")
+    parser.add_argument("--server-processes", type=int, default=0,
+                        help="--processes of a --serve server (0: one process)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="fraction of requests that write")
+    parser.add_argument("--max-id", type=int, default=1000, help="highest id read or updated (--url only)")
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        url, max_id = args.url, args.max_id
+        if args.serve:
+            process, url, _ = start_server(args.serve, directory, args.server_workers, args.server_processes)
+            # transform_sms_compiled numbers transactions by message position
+            max_id = args.serve
+        try:
+            report = run_load(url, args.user, args.password, args.duration,
+                              args.concurrency, args.write_ratio, max_id)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "benchmark": "load",
+        "config": {
+            "url": url if not args.serve else None,
+            "serve": args.serve,
+            "server_processes": args.server_processes if args.serve else None,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "write_ratio": args.write_ratio,
+        },
+        **report,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
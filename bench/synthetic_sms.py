@@ -0,0 +1,162 @@
+"""
+Synthetic MoMo SMS backups in the layout of modified_sms_v2.xml.
+
+Every message follows one of the real templates, so each type that
+detect_transaction_type recognizes (and the "other" messages it rejects)
+shows up, in roughly the proportions of the bundled backup. Amounts,
+parties, timestamps, transaction ids and the running balance are random
+but consistent, and the output is the same for the same seed.
+
+    python bench/synthetic_sms.py --count 100000 --output synthetic_sms.xml [--seed 7]
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+START = datetime(2024, 5, 10, 16, 30, 51)
+PEOPLE = ["Jane Smith", "Samuel Carter", "Alex Doe", "Robert Brown", "Linda Green", "Abebe Chala"]
+AGENTS = ["Agent Sophia", "Agent Emmanuel", "Agent Grace"]
+MERCHANTS = ["ESICIA LTD KPAY", "INFORMATION TECHNOLOGY  ENGINEERING CONSTRUCTION   ITEC Ltd", "KIGALI SHOP LTD"]
+PROMO = ("Kanda*182*16# wiyandikishe muri poromosiyo ya BivaMoMotima, "
+         "ugire amahirwe yo gutsindira ibihembo bishimishije.")
+
+# detect_transaction_type result -> weight, close to the bundled backup
+WEIGHTS = {
+    "payment_to_person": 660,
+    "money_transfer": 585,
+    "bank_deposit": 250,
+    "money_received": 65,
+    "other": 45,
+    "merchant_payment": 35,
+    "data_bundle": 25,
+    "airtime_purchase": 15,
+    "cash_power": 10,
+    "service_deduction": 5,
+    "cash_withdrawal": 5,
+}
+
+
+def _digits(rnd, count):
+    return "".join(rnd.choice("0123456789") for _ in range(count))
+
+
+def _body(rnd, kind, amount, balance, at):
+    """Message text of one kind, as the MoMo service words it."""
+    stamp = at.strftime("%Y-%m-%d %H:%M:%S")
+    person = rnd.choice(PEOPLE)
+    if kind == "money_received":
+        return (f"You have received {amount} RWF from {person} (*********{_digits(rnd, 3)}) on your mobile "
+                f"money account at {stamp}. Message from sender: . Your new balance:{balance} RWF. "
+                f"Financial Transaction Id: {_digits(rnd, 11)}.")
+    if kind == "bank_deposit":
+        return (f"*113*R*A bank deposit of {amount} RWF has been added to your mobile money account at {stamp}. "
+                f"Your NEW BALANCE :{balance} RWF. Cash Deposit::CASH::::0::250795963036."
+                f"Thank you for using MTN MobileMoney.*EN#")
+    if kind == "cash_withdrawal":
+        return (f"You Abebe Chala CHEBUDIE (*********036) have via agent: {rnd.choice(AGENTS)} "
+                f"(2507{_digits(rnd, 8)}), withdrawn {amount} RWF from your mobile money account: 36521838 "
+                f"at {stamp} and you can now collect your money in cash. Your new balance: {balance} RWF. "
+                f"Fee paid: {rnd.choice([350, 700, 1100])} RWF. Message from agent: 1. "
+                f"Financial Transaction Id: {_digits(rnd, 11)}.")
+    if kind == "money_transfer":
+        return (f"*165*S*{amount} RWF transferred to {person} (2507{_digits(rnd, 8)}) from 36521838 at {stamp} . "
+                f"Fee was: {rnd.choice([20, 100, 250])} RWF. New balance: {balance} RWF. "
+                f"Kugura ama inite cg interineti kuri MoMo, Kanda *182*2*1# .*EN#")
+    if kind == "payment_to_person":
+        body = (f"TxId: {_digits(rnd, 11)}. Your payment of {amount:,} RWF to {person} "
+                f"{_digits(rnd, 5)} has been completed at {stamp}. "
+                f"Your new balance: {balance:,} RWF. Fee was 0 RWF.")
+        # the older messages carried a promotion
+        return body + PROMO if rnd.random() < 0.35 else body
+    if kind in ("airtime_purchase", "cash_power", "data_bundle"):
+        payee, token = {
+            "airtime_purchase": ("Airtime", ""),
+            "cash_power": ("MTN Cash Power", "-".join(_digits(rnd, 5) for _ in range(4))),
+            "data_bundle": ("Bundles and Packs", ""),
+        }[kind]
+        return (f"*162*TxId:{_digits(rnd, 11)}*S*Your payment of {amount} RWF to {payee} with token {token} "
+                f"has been completed at {stamp}. Fee was 0 RWF. Your new balance: {balance} RWF . "
+                f"Message: - -. *EN#")
+    if kind == "merchant_payment":
+        return (f"*164*S*Y'ello,A transaction of {amount} RWF by {rnd.choice(MERCHANTS)} on your MOMO account "
+                f"was successfully completed at {stamp}. Message from debit receiver: . "
+                f"Your new balance:{balance} RWF. Fee was 0 RWF. Financial Transaction Id: {_digits(rnd, 11)}. "
+                f"External Transaction Id: {_digits(rnd, 8)}.*EN#")
+    if kind == "service_deduction":
+        return (f"A transaction of {amount} RWF by DIRECT PAYMENT LTD on your MOMO account was successfully "
+                f"completed at {stamp}. Your new balance:{balance} RWF. Fee was 0 RWF. "
+                f"Financial Transaction Id: {_digits(rnd, 11)}.")
+    return (f"<#> Dear Customer, your MTN MoMo application one-time password is :{_digits(rnd, 4)}."
+            f"MTN MoMo does not recommend that you share or expose your one-time password with anyone. "
+            f"Be Vigilant. RdbS6eMOXvx N/RywfrtIZL>.")
+
+
+def _readable(at):
+    """readable_date in the backup's layout: "10 May 2024 4:30:58 PM"."""
+    hour = at.hour % 12 or 12
+    return f"{at.day} {at.strftime('%b %Y')} {hour}:{at:%M:%S} {at:%p}"
+
+
+def iter_sms(count, seed=7):
+    """Yield `count` <sms> attribute dicts in time order."""
+    rnd = random.Random(seed)
+    kinds = list(WEIGHTS)
+    weights = list(WEIGHTS.values())
+    at = START
+    balance = 5000
+    for _ in range(count):
+        at += timedelta(seconds=rnd.randint(30, 6 * 3600))
+        kind = rnd.choices(kinds, weights)[0]
+        amount = rnd.choice([100, 200, 500, 1000, 1500, 2000, 5000, 10000, 25000]) * rnd.randint(1, 4)
+        if kind in ("money_received", "bank_deposit"):
+            balance += amount
+        elif kind != "other":
+            balance = max(balance - amount, 0)
+        received = at + timedelta(seconds=rnd.randint(1, 10))
+        yield {
+            "protocol": "0",
+            "address": "M-Money",
+            "date": str(int(received.timestamp() * 1000)),
+            "transaction_type": "1",
+            "subject": "null",
+            "body": _body(rnd, kind, amount, balance, at),
+            "toa": "null",
+            "sc_toa": "null",
+            "service_center": "+250788110381",
+            "read": "1",
+            "status": "-1",
+            "locked": "0",
+            "date_sent": str(int(at.timestamp() * 1000)),
+            "sub_id": "6",
+            "readable_date": _readable(received),
+            "contact_name": "(Unknown)",
+        }
+
+
+def write_sms_xml(path, count, seed=7):
+    """Write a synthetic backup of `count` messages to path, streaming. Returns the count."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{count}" backup_set="synthetic" backup_date="0" transaction_type="full">\n')
+        for sms in iter_sms(count, seed):
+            attributes = " ".join(f"{name}={quoteattr(value)}" for name, value in sms.items())
+            f.write(f"  <sms {attributes} />\n")
+        f.write("</smses>\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--output", default="synthetic_sms.xml")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    write_sms_xml(args.output, args.count, args.seed)
+    print(f"{args.count} messages written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
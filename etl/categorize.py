@@ -0,0 +1,32 @@
+"""
+Categorize stage: map each transaction_type onto a category of the
+CATEGORIES table in Database/database_setup.sql.
+"""
+
+from typing import Any, Dict, List
+
+CATEGORIES = {
+    "money_transfer": "Transfer",
+    "money_received": "Transfer",
+    "payment_to_person": "Payment",
+    "merchant_payment": "Payment",
+    "service_deduction": "Payment",
+    "cash_withdrawal": "Withdrawal",
+    "bank_deposit": "Deposit",
+    "cash_power": "Utility Bill",
+    "airtime_purchase": "Airtime",
+    "data_bundle": "Airtime",
+}
+
+DEFAULT_CATEGORY = "Payment"
+
+
+def categorize(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """Set the transaction's category, in place."""
+    transaction["category"] = CATEGORIES.get(transaction.get("transaction_type"), DEFAULT_CATEGORY)
+    return transaction
+
+
+def categorize_chunk(transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """categorize over a chunk of transactions."""
+    return [categorize(transaction) for transaction in transactions]
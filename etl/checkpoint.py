@@ -0,0 +1,156 @@
+"""
+Checkpoint of incremental ETL runs (`python -m etl.run --incremental`).
+
+A phone backup only grows: each day's export repeats every message of
+the day before. The checkpoint remembers, per source, the high-water
+mark of the SMS "date" attribute (milliseconds), so a re-run only passes
+messages from that mark on to the transform and load stages. It also
+maps each transaction's stable key (transform_transactions.transaction_key:
+the TxId, or the date and body of messages without one) to the id it
+was given. A transaction seen again, in an overlapping backup or another
+source, gets the same id and is upserted instead of appended.
+
+The state lives in a small SQLite database next to the output
+(<output>.checkpoint). Ids are looked up per chunk, so a run costs
+O(new messages) lookups however many transactions were loaded before.
+Everything a run changes is one SQLite transaction, committed only once
+the output has been written. After a failed run, the next one assigns
+the same ids again.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from etl.parse_xml import iter_sms
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS SOURCES (
+        Source TEXT PRIMARY KEY,
+        High_water INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS TRANSACTION_KEYS (
+        Key TEXT PRIMARY KEY,
+        Transaction_id INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS COUNTERS (
+        Name TEXT PRIMARY KEY,
+        Value INTEGER NOT NULL
+    );
+"""
+# SQLite's default limit of bound parameters is 999 in older versions
+LOOKUP_BATCH = 500
+
+
+def default_path(output: str) -> Path:
+    """Where the checkpoint of an output lives: <output>.checkpoint."""
+    path = Path(output)
+    return path.with_name(path.name + ".checkpoint")
+
+
+def sms_date(sms: Dict[str, Any]) -> Optional[int]:
+    """The "date" attribute of a record (ms since the epoch), or None if missing or invalid."""
+    try:
+        return int(sms.get("date"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Checkpoint:
+    """
+    High-water marks and the key -> id map of one output.
+
+    resumed is False for a checkpoint created by this run (a first, full
+    run). Counters of the current run: skipped (messages below a mark),
+    new (transactions given a new id), known (transactions whose key had
+    an id already).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.resumed = self.path.exists()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(SCHEMA)
+        row = self._conn.execute("SELECT Value FROM COUNTERS WHERE Name = 'next_id'").fetchone()
+        self.next_id = row[0] if row else 1
+        self._marks = dict(self._conn.execute("SELECT Source, High_water FROM SOURCES"))
+        self._seen: Dict[str, int] = {}
+        self.skipped = 0
+        self.new = 0
+        self.known = 0
+
+    def high_water(self, source: str) -> Optional[int]:
+        """Latest SMS date of a source loaded by a previous run (None: never loaded)."""
+        return self._marks.get(source)
+
+    def new_messages(self, paths: Iterable[str], source: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Records of the backups from their source's high-water mark on.
+
+        The source of a backup is `source`, or else its file name.
+        Messages dated exactly at the mark are passed on again: a later
+        message may share its millisecond, and their keys deduplicate
+        them. Records without a date are always passed on.
+        """
+        for path in paths:
+            name = source or Path(path).name
+            mark = self.high_water(name)
+            latest = self._seen.get(name, mark)
+            for sms in iter_sms(path):
+                date = sms_date(sms)
+                if date is not None:
+                    if mark is not None and date < mark:
+                        self.skipped += 1
+                        continue
+                    if latest is None or date > latest:
+                        latest = date
+                yield sms
+            if latest is not None:
+                self._seen[name] = latest
+
+    def reserve(self, max_id: int) -> None:
+        """Make new ids start above max_id (ids already taken in the output)."""
+        self.next_id = max(self.next_id, max_id + 1)
+
+    def assign_ids(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Replace each transaction's "key" (see transaction_key) by its id:
+        the one its key was given before, or the next free one. In place.
+        """
+        keys = list({tx["key"] for tx in transactions})
+        ids = {}
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            ids.update(self._conn.execute(
+                f"SELECT Key, Transaction_id FROM TRANSACTION_KEYS WHERE Key IN ({','.join('?' * len(batch))})",
+                batch))
+        added = []
+        for tx in transactions:
+            key = tx.pop("key")
+            tx_id = ids.get(key)
+            if tx_id is None:
+                tx_id = ids[key] = self.next_id
+                self.next_id += 1
+                added.append((key, tx_id))
+            else:
+                self.known += 1
+            tx["id"] = str(tx_id)
+        self._conn.executemany("INSERT INTO TRANSACTION_KEYS (Key, Transaction_id) VALUES (?, ?)", added)
+        self.new += len(added)
+        return transactions
+
+    def commit(self) -> None:
+        """Record the run's marks and ids (call once the output has been written)."""
+        self._conn.executemany(
+            "INSERT INTO SOURCES (Source, High_water) VALUES (?, ?) "
+            "ON CONFLICT (Source) DO UPDATE SET High_water = MAX(High_water, excluded.High_water)",
+            list(self._seen.items()))
+        self._conn.execute(
+            "INSERT INTO COUNTERS (Name, Value) VALUES ('next_id', ?) "
+            "ON CONFLICT (Name) DO UPDATE SET Value = excluded.Value", (self.next_id,))
+        self._conn.commit()
+        self._marks.update(self._seen)
+
+    def close(self) -> None:
+        """Close the database; uncommitted changes are rolled back."""
+        self._conn.close()
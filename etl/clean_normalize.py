@@ -0,0 +1,24 @@
+"""
+Clean stage: make raw SMS records safe for the extractor.
+
+Backups from some phones omit attributes (no body on MMS stubs, no
+readable_date on older exports); those come through as None and would
+break the string handling downstream.
+"""
+
+from typing import Any, Dict, List
+
+TEXT_FIELDS = ("body", "readable_date")
+
+
+def clean_sms(sms: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace missing text fields by an empty string, in place."""
+    for field in TEXT_FIELDS:
+        if sms.get(field) is None:
+            sms[field] = ""
+    return sms
+
+
+def clean_chunk(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """clean_sms over a chunk of records."""
+    return [clean_sms(sms) for sms in records]
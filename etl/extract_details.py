@@ -0,0 +1,132 @@
+"""
+Compiled, data-driven classifier/extractor for MoMo SMS bodies.
+
+The rules live in sms_rules.json, so a new message template is a data
+change, not a code change:
+
+- skip: groups of keywords; a body containing every keyword of a group
+  is not a transaction (OTPs, promotions, ...)
+- types: ordered rules, the first one whose keywords are all present
+  gives the transaction_type
+- ignore_types: types that are recognised but not transactions
+- parties: per type, a literal sender/receiver or a regex capturing it
+- fields: regexes for amount, TxId, balance, ... A "required" field that
+  is missing (or zero) drops the message; "lowercase" fields are matched
+  against the lowercased body so the pattern needs no IGNORECASE.
+
+Everything is prepared once: the skip and type rules become one ordered
+table of lowercased keyword tuples, and the field and party regexes are
+precompiled. Each body is lowercased once, each field regex runs at most
+once, and extraction stops as soon as a message is known not to be a
+transaction.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+RULES_FILE = Path(__file__).resolve().parent / "sms_rules.json"
+
+_CONVERTERS = {
+    "int": lambda text: int(text.replace(",", "")),
+    "float": lambda text: float(text.replace(",", "")),
+    "str": lambda text: text,
+}
+
+
+def load_rules(path: Path = RULES_FILE) -> Dict[str, Any]:
+    """Read a rules file (see sms_rules.json for the format)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SmsExtractor:
+    """
+    Classifies an SMS body and extracts its details in a single pass.
+
+        extractor = SmsExtractor()
+        extractor.extract(body)
+        # {"transaction_type": "money_transfer", "amount": 10000, "txid": None,
+        #  "balance": 28300, "sender": "You", "receiver": "Samuel Carter"}
+
+    Keywords are tested with plain substring searches, which run in C.
+    For rule sets of this size that measured faster than a combined regex
+    alternation, which would also need lookaheads to report overlapping
+    keywords such as "to " and "to airtime".
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        rules = load_rules() if rules is None else rules
+
+        # (keywords, result) in the order they are tried: skip groups (None), then types
+        skip = [(group, None) for group in rules.get("skip", [])]
+        types = [(rule["all"], rule["type"]) for rule in rules["types"]]
+        self._rules = tuple((tuple(keyword.lower() for keyword in keywords), result)
+                            for keywords, result in skip + types)
+        self._ignore_types = frozenset(rules.get("ignore_types", []))
+        self._parties = {
+            tx_type: (self._compile_party(spec.get("sender")), self._compile_party(spec.get("receiver")))
+            for tx_type, spec in rules.get("parties", {}).items()
+        }
+        self._fields = [
+            (name, re.compile(spec["pattern"]), _CONVERTERS[spec.get("type", "str")],
+             spec.get("lowercase", False), spec.get("required", False))
+            for name, spec in rules.get("fields", {}).items()
+        ]
+
+    @staticmethod
+    def _compile_party(spec: Any):
+        """A party is a literal string, or {"pattern": ..., "suffix": ...}."""
+        if spec is None or isinstance(spec, str):
+            return spec
+        return (re.compile(spec["pattern"], re.IGNORECASE), spec.get("suffix", ""))
+
+    def _classify_lower(self, body: str) -> Optional[str]:
+        """classify() of an already lowercased body: the first rule whose keywords all occur."""
+        for keywords, result in self._rules:
+            for keyword in keywords:
+                if keyword not in body:
+                    break
+            else:
+                return result
+        return "other"
+
+    def classify(self, body: str) -> Optional[str]:
+        """transaction_type of a body, or None if a skip rule matches."""
+        return self._classify_lower(body.lower())
+
+    @staticmethod
+    def _resolve_party(party: Any, body: str) -> Optional[str]:
+        if party is None or isinstance(party, str):
+            return party
+        pattern, suffix = party
+        match = pattern.search(body)
+        return match.group(1).strip() + suffix if match else None
+
+    def extract(self, body: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify a body and extract its fields.
+
+        Returns None for messages that are not transactions (skip rules,
+        ignored types, missing required fields), otherwise a dict with
+        transaction_type, one key per configured field (None when absent),
+        sender and receiver.
+        """
+        body_lower = body.lower()
+        tx_type = self._classify_lower(body_lower)
+        if tx_type is None or tx_type in self._ignore_types:
+            return None
+
+        details: Dict[str, Any] = {"transaction_type": tx_type}
+        for name, pattern, convert, lowercase, required in self._fields:
+            match = pattern.search(body_lower if lowercase else body)
+            value = convert(match.group(1)) if match else None
+            if required and not value:
+                return None
+            details[name] = value
+
+        sender, receiver = self._parties.get(tx_type, (None, None))
+        details["sender"] = self._resolve_party(sender, body)
+        details["receiver"] = self._resolve_party(receiver, body)
+        return details
@@ -0,0 +1,173 @@
+"""
+Load stage: write transformed transactions to the output.
+
+    .db / .sqlite  upserted into a SQLite database (Database/sqlite_schema.sql),
+                   the store behind `api/app.py --backend sqlite`
+    .ndjson        one transaction per line
+    other          a JSON array, one transaction per line
+
+Incremental runs (etl.checkpoint) upsert into the output instead
+(upsert_transactions), in O(rows of the run): a SQLite output is upserted
+in place, and an NDJSON output is appended to, a transaction loaded
+before being appended again under its id (the last line of an id wins).
+A JSON array would have to be rewritten whole, so it cannot be upserted.
+
+Files are streamed chunk by chunk into a temporary file next to the
+target, which is only moved into place (atomically) once everything has
+been written, so readers never see a half-written file and a failed run
+leaves the previous output untouched. A database load is a single SQLite
+transaction with one executemany per chunk, with the same effect.
+
+Also usable on its own to import an existing JSON array:
+
+    python -m etl.load_db api_ready_transactions.json transactions.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+# shared with the API's SqliteTransactionStore and journal
+from api.journal import truncate_torn_line
+from api.sqlite_schema import SCHEMA_FILE, UPSERT_TRANSACTION_SQL, UPSERT_USER_SQL, transaction_row
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def load_sqlite(chunks: Iterable[List[Dict[str, Any]]], db_path: str) -> int:
+    """Upsert chunks of transactions into a SQLite database. Returns the count."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+
+        def insert(rows):
+            names = {name for row in rows for name in row[1:3] if name is not None}
+            conn.executemany(UPSERT_USER_SQL, [(name,) for name in names])
+            conn.executemany(UPSERT_TRANSACTION_SQL, rows)
+
+        count = 0
+        # records without an id get the next free one, but only once every
+        # explicit id is in, so they cannot take (and be overwritten by) one
+        without_id = []
+        with conn:
+            for chunk in chunks:
+                rows = [transaction_row(tx) for tx in chunk]
+                without_id.extend(row for row in rows if not isinstance(row[0], int))
+                insert([row for row in rows if isinstance(row[0], int)])
+                count += len(rows)
+            insert([(None,) + row[1:] for row in without_id])
+        return count
+    finally:
+        conn.close()
+
+
+def max_transaction_id(db_path: str) -> int:
+    """Highest Transaction_id in a SQLite database (0 if it has none or does not exist yet)."""
+    if not Path(db_path).exists():
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT MAX(Transaction_id) FROM TRANSACTIONS").fetchone()[0] or 0
+    except sqlite3.OperationalError:  # no TRANSACTIONS table yet
+        return 0
+    finally:
+        conn.close()
+
+
+def upsert_transactions(chunks: Iterable[List[Dict[str, Any]]], output_path: str) -> int:
+    """
+    Write chunks of transactions into an existing output, a transaction
+    replacing the one with the same id, in O(transactions written): SQLite
+    outputs are upserted (load_sqlite), NDJSON outputs appended to
+    (append_transactions). Raises ValueError for any other output.
+    Returns the number of transactions in the chunks.
+    """
+    suffix = Path(output_path).suffix
+    if suffix in SQLITE_SUFFIXES:
+        return load_sqlite(chunks, output_path)
+    if suffix == ".ndjson":
+        return append_transactions(chunks, output_path)
+    raise ValueError(f"cannot upsert into {output_path}: only .db/.sqlite and .ndjson outputs can be")
+
+
+def append_transactions(chunks: Iterable[List[Dict[str, Any]]], output_path: str) -> int:
+    """
+    Append chunks of transactions to an NDJSON output. Readers keep the
+    last line of an id, so a transaction appended again replaces the
+    earlier one. A line torn by a killed run is cut off first, and a
+    failed run truncates the file back to where it started.
+    Returns the count.
+    """
+    path = Path(output_path)
+    truncate_torn_line(path)
+    count = 0
+    with open(path, "ab") as f:
+        start = f.tell()
+        try:
+            for chunk in chunks:
+                f.write("".join(json.dumps(transaction, ensure_ascii=False) + "\n"
+                                for transaction in chunk).encode("utf-8"))
+                count += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(start)
+            raise
+    return count
+
+
+def write_transactions(chunks: Iterable[List[Dict[str, Any]]], output_path: str) -> int:
+    """Write chunks of transactions to output_path (format by suffix). Returns the count."""
+    path = Path(output_path)
+    if path.suffix in SQLITE_SUFFIXES:
+        return load_sqlite(chunks, output_path)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    as_array = path.suffix != ".ndjson"
+
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if as_array:
+                f.write("[")
+            for chunk in chunks:
+                for transaction in chunk:
+                    if as_array:
+                        f.write(",\n" if count else "\n")
+                    f.write(json.dumps(transaction, ensure_ascii=False))
+                    if not as_array:
+                        f.write("\n")
+                    count += 1
+            if as_array:
+                f.write("\n]\n" if count else "]\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a JSON array of transactions into an output.")
+    parser.add_argument("input", help="JSON array, e.g. api_ready_transactions.json")
+    parser.add_argument("output", help="output (.db/.sqlite, .ndjson or .json)")
+    args = parser.parse_args()
+
+    if os.path.realpath(args.input) == os.path.realpath(args.output):
+        raise SystemExit(f" output {args.output} is also the input")
+    with open(args.input, "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+
+    count = write_transactions([transactions], args.output)
+    print(f" Loaded {count} transactions into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Parse stage: stream SMS records out of one or more backups.
+
+XML backups are read with iter_sms_xml (iterparse, constant memory) and
+NDJSON files written by parse_sms.py with read_ndjson. Records are handed
+on in fixed-size chunks so later stages can be fanned out to workers.
+"""
+
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from parse_sms import iter_sms_xml, read_ndjson
+
+
+def iter_sms(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of one backup, XML or NDJSON (by extension)."""
+    if str(path).endswith(".ndjson"):
+        return read_ndjson(path)
+    return iter_sms_xml(path)
+
+
+def iter_sms_many(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Records of several backups, one after the other."""
+    return chain.from_iterable(iter_sms(path) for path in paths)
+
+
+def iter_chunks(records: Iterable[Dict[str, Any]], size: int, start: int = 1) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Split a record stream into (position, chunk) pairs of at most `size`
+    records; position is the 1-based index of the chunk's first record in
+    the whole stream.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
@@ -0,0 +1,177 @@
+"""
+ETL pipeline runner: parse -> clean -> extract/transform -> categorize -> load.
+
+    python -m etl.run [backup.xml ...] [--output etl_transactions.json]
+                      [--workers N] [--chunk-size N]
+                      [--incremental [--source NAME] [--checkpoint PATH]]
+
+Records are streamed out of the backups (etl.parse_xml) in chunks. The
+CPU-bound stages run on a process pool, one chunk per task; at most a few
+chunks per worker are in flight, so memory stays bounded however large the
+input is. Results are collected in submission order, so the output is
+identical for any number of workers. The output goes to its own file
+(etl.load_db) and is never one of the inputs.
+
+With --incremental, a re-run only processes the messages of each source
+(--source, default the backup's file name) that are not older than the
+last run's, and transactions keep a stable id derived from their TxId:
+they are upserted into the output rather than appended (etl.checkpoint).
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from etl.categorize import categorize_chunk
+from etl.checkpoint import Checkpoint, default_path
+from etl.clean_normalize import clean_chunk
+from etl.extract_details import SmsExtractor
+from etl.load_db import SQLITE_SUFFIXES, max_transaction_id, upsert_transactions, write_transactions
+from etl.parse_xml import iter_chunks, iter_sms_many
+from transform_transactions import transform_sms_compiled
+
+DEFAULT_INPUT = "modified_sms_v2.xml"
+DEFAULT_OUTPUT = "etl_transactions.json"
+DEFAULT_CHUNK_SIZE = 1000
+IN_FLIGHT_PER_WORKER = 2
+
+_extractor: Optional[SmsExtractor] = None
+
+
+def transform_chunk(task: Tuple[int, List[Dict[str, Any]]], with_keys: bool = False) -> List[Dict[str, Any]]:
+    """
+    Clean, transform and categorize one (position, records) chunk. With
+    `with_keys`, transactions carry their stable "key" (see transaction_key).
+    """
+    global _extractor
+    if _extractor is None:
+        # Compiled once per worker process
+        _extractor = SmsExtractor()
+
+    start, records = task
+    transactions = transform_sms_compiled(clean_chunk(records), _extractor, start, with_keys)
+    return categorize_chunk(transactions)
+
+
+def run_chunks(tasks: Iterable[Tuple[int, List[Dict[str, Any]]]], workers: int,
+               transform: Callable[..., List[Dict[str, Any]]] = transform_chunk) -> Iterator[List[Dict[str, Any]]]:
+    """
+    transform (transform_chunk) over tasks, in order. With more than one worker, chunks
+    are fanned out to a process pool with a bounded number in flight
+    (Executor.map would read the whole input up front).
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield transform(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(transform, task))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _check_output(inputs: List[str], output: str) -> None:
+    output_path = os.path.realpath(output)
+    if any(os.path.realpath(path) == output_path for path in inputs):
+        raise ValueError(f"output {output} is also an input")
+
+
+def run_pipeline(inputs: List[str], output: str, workers: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Run the whole pipeline. Returns the number of transactions written.
+    Ids are the messages' positions in the inputs; run_incremental gives
+    stable ones.
+    """
+    _check_output(inputs, output)
+    workers = workers or os.cpu_count() or 1
+    tasks = iter_chunks(iter_sms_many(inputs), chunk_size)
+    return write_transactions(run_chunks(tasks, workers), output)
+
+
+def run_incremental(inputs: List[str], output: str, workers: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    source: Optional[str] = None, checkpoint: Optional[str] = None) -> Checkpoint:
+    """
+    Run the pipeline over the messages not loaded yet (see etl.checkpoint)
+    and upsert their transactions into the output, a SQLite database or
+    an NDJSON file. Transform and load cost O(new messages); the backups
+    are still read and parsed whole (iterparse) to find the messages at
+    or above each source's mark. Returns the (closed) checkpoint, whose
+    counters describe the run. Raises ValueError for a JSON array output,
+    which every run would have to rewrite whole.
+
+    A first run, without a checkpoint yet, replaces an NDJSON output: ids
+    written without a checkpoint cannot be matched to transactions. New
+    ids always start above the largest one in a database, so rows added
+    to it by the API are never overwritten.
+    """
+    _check_output(inputs, output)
+    database = Path(output).suffix in SQLITE_SUFFIXES
+    if not database and Path(output).suffix != ".ndjson":
+        raise ValueError(f"--incremental needs a .db/.sqlite or .ndjson output, not {output}: "
+                         "a JSON array would be rewritten whole by every run")
+    workers = workers or os.cpu_count() or 1
+    state = Checkpoint(checkpoint or default_path(output))
+    try:
+        if database:
+            state.reserve(max_transaction_id(output))
+
+        tasks = iter_chunks(state.new_messages(inputs, source), chunk_size)
+        chunks = run_chunks(tasks, workers, partial(transform_chunk, with_keys=True))
+        chunks = (state.assign_ids(chunk) for chunk in chunks)
+        if database or state.resumed:
+            upsert_transactions(chunks, output)
+        else:
+            write_transactions(chunks, output)
+        state.commit()
+    finally:
+        state.close()
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the SMS ETL pipeline.")
+    parser.add_argument("inputs", nargs="*", default=[DEFAULT_INPUT],
+                        help="SMS backups (.xml, or .ndjson from parse_sms.py)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="output file (.json array, .ndjson or .db; --incremental: .ndjson or .db)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="records per task")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process messages newer than the last run's and upsert by TxId")
+    parser.add_argument("--source", default=None,
+                        help="name of the phone the backups come from (default: each backup's file name)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="checkpoint of --incremental runs (default: <output>.checkpoint)")
+    args = parser.parse_args()
+
+    try:
+        if args.incremental:
+            state = run_incremental(args.inputs, args.output, args.workers, args.chunk_size,
+                                    args.source, args.checkpoint)
+        else:
+            count = run_pipeline(args.inputs, args.output, args.workers, args.chunk_size)
+    except ValueError as e:
+        sys.exit(f" {e}")
+
+    if args.incremental:
+        print(f" Upserted {state.new + state.known} transactions into {args.output} "
+              f"({state.new} new, {state.known} already loaded; "
+              f"{state.skipped} messages skipped below the high-water mark)")
+    else:
+        print(f" Wrote {count} transactions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
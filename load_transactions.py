@@ -4,9 +4,15 @@ def load_transactions(json_file):
     with open(json_file, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    # Add ID to each transaction
-    for i, tx in enumerate(data, start=1):
-        tx["id"] = str(i)
+    # Keep the stable IDs assigned by the ETL (etl/checkpoint.py); number
+    # transactions that have none after the largest, so a new ID never
+    # collides with a stable one
+    taken = [int(tx["id"]) for tx in data if str(tx.get("id", "")).isdigit()]
+    next_id = max(taken, default=0) + 1
+    for tx in data:
+        if "id" not in tx:
+            tx["id"] = str(next_id)
+            next_id += 1
 
     return data
 
@@ -3,13 +3,24 @@ import xml.etree.ElementTree as ET
 import json
 
 
-def parse_sms_xml(xml_file):
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-    transactions = []
-    
-    for i, sms in enumerate(root.findall("sms")):
-        transaction = {
+def iter_sms_xml(xml_file):
+    """
+    Yield one record per <sms> element of an SMS backup, streaming.
+
+    Uses iterparse instead of building the whole DOM: every <sms> element
+    is turned into a dict as soon as it has been read and then cleared
+    (and detached from the root), so memory stays constant no matter how
+    large the backup is.
+    """
+    context = ET.iterparse(xml_file, events=("start", "end"))
+    _, root = next(context)  # the <smses> root element
+
+    i = 0
+    for event, sms in context:
+        if event != "end" or sms.tag != "sms":
+            continue
+
+        yield {
             "id": i,
             "protocol": sms.attrib.get("protocol"),
             "address": sms.attrib.get("address"),
@@ -23,18 +34,42 @@ def parse_sms_xml(xml_file):
             "read": sms.attrib.get("read"),
             "status": sms.attrib.get("status")
         }
-        
-        transactions.append(transaction)
-    
-    return transactions
+        i += 1
+
+        # Free the element and drop the root's reference to it
+        sms.clear()
+        root.clear()
+
+
+def parse_sms_xml(xml_file):
+    """Parse a whole SMS backup into a list (see iter_sms_xml for the streaming form)."""
+    return list(iter_sms_xml(xml_file))
+
+
+def write_ndjson(records, output_file):
+    """Write records as newline-delimited JSON, one at a time. Returns the count."""
+    count = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_ndjson(input_file):
+    """Yield the records of a newline-delimited JSON file."""
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
 
 if __name__ == "__main__":
     xml_path = "modified_sms_v2.xml"
-    data = parse_sms_xml(xml_path)
-    
-    with open("api_ready_transactions.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f" XML successfully converted to JSON")
-    print(f" Total SMS messages parsed: {len(data)}")
\ No newline at end of file
+    output_path = "raw_sms.ndjson"
+
+    count = write_ndjson(iter_sms_xml(xml_path), output_path)
+
+    print(f" XML successfully converted to NDJSON ({output_path})")
+    print(f" Total SMS messages parsed: {count}")
@@ -0,0 +1,7 @@
+#!/usr/bin/env bash
+# Run the ETL pipeline (parse -> clean -> transform -> categorize -> load)
+# on every core. Extra arguments are passed to etl/run.py, e.g.
+#   scripts/run_etl.sh backups/*.xml --output etl_transactions.json
+set -euo pipefail
+cd "$(dirname "$0")/.."
+python3 -m etl.run "$@"
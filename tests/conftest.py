@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# the etl package and the scripts it uses import from the repository root,
+# the api modules each other by bare name (run as `python app.py` from api/)
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "api"))
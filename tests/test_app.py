@@ -0,0 +1,171 @@
+import base64
+import http.client
+import json
+import threading
+
+import pytest
+
+import app
+from db import TransactionStore
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"admin:password").decode()}
+
+
+def record(**fields):
+    tx = {"sender": "Jane Smith", "receiver": "Samuel Carter", "transaction_type": "transfer",
+          "amount": 100, "timestamp": "2024-05-10 16:30:51"}
+    tx.update(fields)
+    return tx
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = tmp_path / "transactions.json"
+    path.write_text("[]")
+    store = TransactionStore(path, snapshot=False)
+    store.load()
+    handler = type("Handler", (app.resourceHandler,), {"store": store, "cache": app.ResponseCache()})
+    httpd = app.PooledHTTPServer(("127.0.0.1", 0), handler, workers=2)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    store.close()
+
+
+def exchange(httpd, method, path, body=None, headers=None):
+    """(status, headers, raw body) of one request."""
+    connection = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=10)
+    payload = body if body is None or isinstance(body, bytes) else json.dumps(body).encode()
+    connection.request(method, path, payload, {**AUTH, **(headers or {})})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, response.headers, data
+
+
+def request(httpd, method, path, body=None, headers=None):
+    status, _, data = exchange(httpd, method, path, body, headers)
+    return status, json.loads(data) if data else None
+
+
+def ids(httpd):
+    return [tx["id"] for tx in request(httpd, "GET", "/transactions")[1]["data"]]
+
+
+@pytest.mark.parametrize("fields", [
+    {"sender": ["Jane"]}, {"receiver": {"name": "Sam"}}, {"transaction_type": [1]},
+    {"timestamp": {}}, {"amount": "100"}, {"amount": True}, {"amount": float("nan")},
+    {"amount": float("inf")},
+])
+def test_post_rejects_mistyped_fields(server, fields):
+    status, body = request(server, "POST", "/transactions", record(**fields))
+    assert status == 400
+    assert body["status"] == "error"
+    assert ids(server) == []
+
+
+def test_put_rejects_mistyped_fields_and_keeps_the_record(server):
+    created = request(server, "POST", "/transactions", record())[1]["data"]
+    path = f"/transactions/{created['id']}"
+    assert request(server, "PUT", path, {"sender": ["Jane"]})[0] == 400
+    assert request(server, "PUT", path, [1, 2])[0] == 400
+    assert request(server, "GET", path)[1]["data"] == created
+    assert request(server, "DELETE", path)[0] == 200
+
+
+def test_batch_reports_each_invalid_item_and_creates_the_rest(server):
+    items = [record(amount=1), record(sender=["Jane"]), {"amount": 3}, record(amount=float("nan")),
+             record(amount=5)]
+    status, body = request(server, "POST", "/transactions/batch", items)
+    assert status == 207
+    results = body["data"]
+    assert [result["status"] for result in results] == [201, 400, 400, 400, 201]
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert "missing field(s)" in results[2]["error"]
+    created = [result["id"] for result in results if result["status"] == 201]
+    assert ids(server) == created
+    assert [request(server, "GET", f"/transactions/{tx_id}")[1]["data"]["amount"] for tx_id in created] == [1, 5]
+
+
+def test_batch_ndjson_with_a_broken_line(server):
+    body = b"\n".join([json.dumps(record()).encode(), b"{not json", json.dumps(record(amount=2)).encode()])
+    status, response = request(server, "POST", "/transactions/batch", body,
+                                {"Content-Type": "application/x-ndjson"})
+    assert status == 207
+    assert [result["status"] for result in response["data"]] == [201, 400, 201]
+
+
+def test_batch_without_a_valid_item_creates_nothing(server):
+    status, body = request(server, "POST", "/transactions/batch", [record(sender=[]), {}])
+    assert status == 400
+    assert ids(server) == []
+
+
+@pytest.mark.parametrize("query", ["min_amount=nan", "max_amount=inf", "min_amount=abc", "from=nan"])
+def test_non_finite_query_bounds_are_rejected(server, query):
+    assert request(server, "GET", "/transactions?" + query)[0] == 400
+
+
+@pytest.mark.parametrize("path", ["/transactions", "/transactions?sender=Jane%20Smith", "/stats?group_by=sender"])
+def test_a_write_invalidates_cached_responses_and_etags(server, path):
+    status, headers, first = exchange(server, "GET", path)
+    etag = headers["ETag"]
+    assert status == 200 and etag
+    assert exchange(server, "GET", path, headers={"If-None-Match": etag})[0] == 304
+
+    created = request(server, "POST", "/transactions", record(amount=7))[1]["data"]
+    status, headers, second = exchange(server, "GET", path, headers={"If-None-Match": etag})
+    assert status == 200
+    assert headers["ETag"] != etag
+    assert second != first
+
+    etag = headers["ETag"]
+    assert request(server, "PUT", f"/transactions/{created['id']}", {"amount": 8})[0] == 200
+    status, headers, third = exchange(server, "GET", path, headers={"If-None-Match": etag})
+    assert status == 200
+    assert headers["ETag"] != etag
+    assert third != second
+
+
+def test_a_record_is_not_served_from_the_cache_after_it_changes(server):
+    created = request(server, "POST", "/transactions", record())[1]["data"]
+    path = f"/transactions/{created['id']}"
+    status, headers, _ = exchange(server, "GET", path)
+    etag = headers["ETag"]
+    assert request(server, "PUT", path, {"amount": 9})[0] == 200
+    status, headers, body = exchange(server, "GET", path, headers={"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert json.loads(body)["data"]["amount"] == 9
+    assert request(server, "DELETE", path)[0] == 200
+    assert exchange(server, "GET", path, headers={"If-None-Match": headers["ETag"]})[0] == 404
+
+
+def test_timestamp_order_lists_records_without_a_time_last(server):
+    created = [request(server, "POST", "/transactions", record(timestamp=timestamp))[1]["data"]["id"]
+               for timestamp in ["unknown", "2024-05-11 10:00:00", "", "2024-05-10 10:00:00"]]
+    seen = []
+    path = "/transactions?order=timestamp&limit=1"
+    while path:
+        body = request(server, "GET", path)[1]
+        seen.extend(tx["id"] for tx in body["data"])
+        cursor = body.get("next_cursor")
+        path = f"/transactions?order=timestamp&limit=1&cursor={cursor}" if cursor else None
+    assert seen == [created[3], created[1], created[0], created[2]]
+
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-1", 400), ("2048", 413)])
+def test_a_bad_or_oversized_content_length_is_answered(server, monkeypatch, length, status):
+    monkeypatch.setattr(server.RequestHandlerClass, "max_body_bytes", 1024)
+    for method, path in [("POST", "/transactions"), ("PUT", "/transactions/0")]:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+        connection.putrequest(method, path)
+        for name, value in {**AUTH, "Content-Length": length}.items():
+            connection.putheader(name, value)
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == status
+        assert response.headers["Connection"] == "close"
+        connection.close()
+    assert request(server, "POST", "/transactions", record(description="x" * 700))[0] == 201
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from etl.extract_details import SmsExtractor
+from etl.parse_xml import iter_sms
+from etl.run import run_incremental
+from transform_transactions import extract_amount, extract_balance, extract_fee
+
+BACKUP = Path(__file__).resolve().parent.parent / "modified_sms_v2.xml"
+
+
+def write_backup(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def read_ndjson_output(path):
+    """Transactions by id, the last line of an id winning."""
+    latest = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        tx = json.loads(line)
+        latest[tx["id"]] = tx
+    return latest
+
+
+@pytest.fixture(scope="module")
+def records():
+    return sorted(iter_sms(str(BACKUP)), key=lambda sms: int(sms["date"]))
+
+
+def test_incremental_ndjson_appends_and_matches_a_full_run(tmp_path, records):
+    half = len(records) // 2
+    day1 = write_backup(tmp_path / "day1.ndjson", records[:half])
+    day2 = write_backup(tmp_path / "day2.ndjson", records)
+    output = tmp_path / "out.ndjson"
+    run_incremental([day1], str(output), workers=1, source="phone")
+    first = output.read_bytes()
+    state = run_incremental([day2], str(output), workers=1, source="phone")
+    # the second run only appended, and skipped what the first loaded
+    assert output.read_bytes().startswith(first)
+    assert state.skipped > 0
+    # a third run over the same backup adds nothing new
+    assert run_incremental([day2], str(output), workers=1, source="phone").new == 0
+
+    full = tmp_path / "full.ndjson"
+    run_incremental([day2], str(full), workers=1, source="phone")
+    assert read_ndjson_output(output) == read_ndjson_output(full)
+
+
+def test_incremental_database_matches_ndjson(tmp_path, records):
+    backup = write_backup(tmp_path / "backup.ndjson", records)
+    database = tmp_path / "out.db"
+    run_incremental([backup], str(database), workers=1, source="phone")
+    run_incremental([backup], str(database), workers=1, source="phone")
+    ndjson = tmp_path / "out.ndjson"
+    run_incremental([backup], str(ndjson), workers=1, source="phone")
+    rows = sqlite3.connect(database).execute("SELECT Transaction_id, Payload FROM TRANSACTIONS").fetchall()
+    assert {str(tx_id): json.loads(payload)["amount"] for tx_id, payload in rows} == \
+        {tx_id: tx["amount"] for tx_id, tx in read_ndjson_output(ndjson).items()}
+
+
+def test_a_torn_line_from_a_killed_run_is_cut_before_appending(tmp_path, records):
+    day1 = write_backup(tmp_path / "day1.ndjson", records[:10])
+    output = tmp_path / "out.ndjson"
+    run_incremental([day1], str(output), workers=1, source="phone")
+    with open(output, "ab") as f:
+        f.write(b'{"id": "99", "amo')
+    run_incremental([write_backup(tmp_path / "day2.ndjson", records[:20])], str(output), workers=1,
+                    source="phone")
+    assert len(read_ndjson_output(output)) > 0
+
+
+def test_incremental_refuses_a_json_array_output(tmp_path, records):
+    backup = write_backup(tmp_path / "backup.ndjson", records[:10])
+    with pytest.raises(ValueError):
+        run_incremental([backup], str(tmp_path / "out.json"), workers=1)
+    assert not (tmp_path / "out.json.checkpoint").exists()
+
+
+@pytest.mark.parametrize("body, amount", [
+    ("*165*S*1700 RWF transferred to Samuel Carter (250788999999) from 36521838 at 2024-05-12 19:23:50 . "
+     "Fee was: 100 RWF. New balance: 3080 RWF.", 1700),
+    ("*165*S*10000 RWF transferred to Samuel Carter (250791666666) from 36521838 at 2024-05-11 20:34:47 . "
+     "Fee was: 100 RWF. New balance: 28300 RWF.", 10000),
+    ("You have received 2,000 RWF from Jane Smith (*********013) at 2024-05-10 16:30:51. "
+     "Your new balance:2,000 RWF.", 2000),
+])
+def test_amounts_are_not_read_from_inside_a_number(body, amount):
+    assert extract_amount(body) == amount
+    assert SmsExtractor().extract(body)["amount"] == amount
+    if "Fee" in body:
+        assert extract_fee(body) == 100
+    assert extract_balance(body) == SmsExtractor().extract(body)["balance"]
@@ -0,0 +1,38 @@
+import pytest
+
+from indexer import TransactionIndex, to_epoch
+
+
+def record(tx_id, **fields):
+    tx = {"id": tx_id, "sender": "Jane Smith", "receiver": "Samuel Carter",
+          "transaction_type": "transfer", "amount": 100, "timestamp": "2024-05-10 16:30:51"}
+    tx.update(fields)
+    return tx
+
+
+def state(index):
+    return (list(index.ids), {tx["id"]: tx for tx in index.data.values()},
+            index.totals(), index.stats("sender"), index.balance())
+
+
+@pytest.mark.parametrize("field", ["sender", "receiver", "transaction_type"])
+def test_unindexable_records_leave_no_trace(field):
+    index = TransactionIndex([record(0), record(1, amount=50)])
+    before = state(index)
+    with pytest.raises(TypeError):
+        index.add(record(2, **{field: ["Jane"]}))
+    with pytest.raises(TypeError):
+        index.add_many([record(3), record(4, **{field: {"name": "Jane"}})])
+    with pytest.raises(TypeError):
+        index.update(1, {field: ["Jane"]})
+    assert state(index) == before
+    assert index.remove(1)["amount"] == 50
+    assert list(index.ids) == [0]
+
+
+def test_non_finite_timestamps_have_no_time_key():
+    assert to_epoch(float("inf")) is None
+    assert to_epoch("nan") is None
+    assert to_epoch(["2024-05-10"]) is None
+    index = TransactionIndex([record(0, timestamp="inf")])
+    assert index.timestamp_range_ids(None, None) == []
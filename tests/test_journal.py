@@ -0,0 +1,88 @@
+import errno
+import json
+
+import pytest
+
+from db import TransactionStore
+from journal import TransactionJournal
+
+
+def record(amount):
+    return {"sender": "Jane Smith", "receiver": "Samuel Carter", "transaction_type": "transfer",
+            "amount": amount, "timestamp": "2024-05-10 16:30:51"}
+
+
+def open_store(path):
+    store = TransactionStore(path, snapshot=False)
+    store.load()
+    return store
+
+
+def test_replay_skips_a_torn_line_and_keeps_later_entries(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(b'{"op":"create","id":0,"data":{"id":0}}\n{"op":"crea\n'
+                     b'{"op":"delete","id":0}\n')
+    entries = list(TransactionJournal(path, read_only=True).replay())
+    assert entries == [{"op": "create", "id": 0, "data": {"id": 0}}, {"op": "delete", "id": 0}]
+
+
+def test_opening_cuts_the_torn_tail_before_appending(tmp_path):
+    path = tmp_path / "journal"
+    path.write_bytes(b'{"op":"create","id":0,"data":{"id":0}}\n{"op":"create","id":1,"da')
+    journal = TransactionJournal(path)
+    assert journal.repaired
+    journal.append("create", 1, {"id": 1})
+    journal.close()
+    assert [entry["id"] for entry in TransactionJournal(path, read_only=True).replay()] == [0, 1]
+
+
+def test_writes_after_a_crash_mid_append_survive_restart(tmp_path):
+    path = tmp_path / "transactions.json"
+    path.write_text("[]")
+    store = open_store(path)
+    first = store.create(record(100))["id"]
+    store.journal.close()
+    # crash in the middle of the next append
+    with open(store.journal_path, "ab") as file:
+        file.write(b'{"op":"create","id":1,"data":{"sen')
+
+    store = open_store(path)
+    second = store.create(record(200))["id"]
+    assert second != first
+    store.journal.close()
+
+    store = open_store(path)
+    assert sorted(tx["id"] for tx in store.transactions) == [first, second]
+    assert store.get(second)["amount"] == 200
+    # the next id is not handed out twice
+    assert store.create(record(300))["id"] not in (first, second)
+    store.close()
+    assert {tx["id"] for tx in json.loads(path.read_text())} == {first, second, second + 1}
+
+
+def test_a_failed_journal_write_changes_nothing(tmp_path, monkeypatch):
+    path = tmp_path / "transactions.json"
+    path.write_text("[]")
+    store = open_store(path)
+    kept = store.create(record(100))["id"]
+    before = (store.transactions, store.next_id, store.version, store.index.totals())
+
+    def disk_full(*args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(store.journal, "append", disk_full)
+    monkeypatch.setattr(store.journal, "append_many", disk_full)
+    with pytest.raises(OSError):
+        store.create(record(200))
+    with pytest.raises(OSError):
+        store.create_many([record(300), record(400)])
+    with pytest.raises(OSError):
+        store.update(kept, {"amount": 500})
+    with pytest.raises(OSError):
+        store.delete(kept)
+    assert (store.transactions, store.next_id, store.version, store.index.totals()) == before
+
+    monkeypatch.undo()
+    assert store.create(record(600))["id"] == kept + 1
+    store.close()
+    assert [tx["amount"] for tx in json.loads(path.read_text())] == [100, 600]
@@ -0,0 +1,53 @@
+import re
+
+from db import TransactionStore
+from metrics import Metrics, MetricsExchange, Profiler
+
+
+def sample(text, name, **labels):
+    pattern = re.escape(name) + r"\{([^}]*)\} (\S+)$" if labels else re.escape(name) + r" (\S+)$"
+    for line in text.splitlines():
+        match = re.match(pattern, line)
+        if match and all(f'{key}="{value}"' in match.group(1) for key, value in labels.items()):
+            return float(match.groups()[-1])
+    return None
+
+
+def exchange(directory, name):
+    # a long interval keeps the background thread out of the way: the test publishes itself
+    process = MetricsExchange(directory, name, interval=3600)
+    process.start(Metrics(), None, Profiler())
+    return process
+
+
+def test_metrics_are_added_up_across_processes(tmp_path):
+    first, second = exchange(tmp_path, "reader-1"), exchange(tmp_path, "reader-2")
+    for _ in range(3):
+        first.metrics.observe("GET", "/transactions", 200, 0.01, {"index": 0.002})
+    second.metrics.observe("GET", "/transactions", 200, 0.02, {"index": 0.001})
+    second.metrics.observe("GET", "/transactions", 404, 0.02, {})
+    second.publish()
+
+    text = first.metrics.render(profiler=first.profiler, others=first.others())
+    assert sample(text, "metrics_processes") == 2
+    assert sample(text, "http_request_duration_seconds_count", method="GET", endpoint="/transactions") == 5
+    assert sample(text, "http_responses_total", method="GET", endpoint="/transactions", code="200") == 4
+    assert sample(text, "http_responses_total", method="GET", endpoint="/transactions", code="404") == 1
+
+
+def test_profiler_settings_reach_the_other_processes(tmp_path):
+    first, second = exchange(tmp_path, "reader-1"), exchange(tmp_path, "reader-2")
+    first.configure_profiler(1)
+    assert first.profiler.every == 1 and second.profiler.every == 0
+    second.poll_settings()
+    assert second.profiler.every == 1
+
+
+def test_one_load_is_one_rebuild(tmp_path):
+    path = tmp_path / "transactions.json"
+    path.write_text('[{"id": 1, "sender": "You", "amount": 5}]')
+    store = TransactionStore(path, snapshot=False)
+    store.load()
+    text = Metrics().render(store)
+    assert sample(text, "transaction_index_rebuilds_total") == 1
+    store.close()
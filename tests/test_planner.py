@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from indexer import TransactionIndex, to_epoch
+from textindex import tokenize
+
+SENDERS = ["Jane Smith", "Samuel Carter", "Alex Doe", "Linda Green"]
+TYPES = ["transfer", "payment", "deposit", "withdrawal"]
+CURRENCIES = ["RWF", "USD"]
+WORDS = ["airtime", "bundle", "cashpower", "payment", "received", "txid", "momo"]
+
+
+def records(count, seed=7):
+    rng = random.Random(seed)
+    txs = []
+    for tx_id in range(count):
+        tx = {"id": tx_id, "sender": rng.choice(SENDERS), "receiver": rng.choice(SENDERS),
+              "transaction_type": rng.choice(TYPES), "currency": rng.choice(CURRENCIES),
+              "fee": rng.choice([0, 50, 100]), "amount": rng.randrange(0, 5000),
+              "timestamp": f"2024-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T{rng.randint(10, 23)}:00:00",
+              "description": " ".join(rng.sample(WORDS, 3)) + f" {rng.randrange(100000, 999999)}"}
+        if rng.random() < 0.05:
+            tx["timestamp"] = "unknown"
+        if rng.random() < 0.05:
+            tx["amount"] = None
+        txs.append(tx)
+    return txs
+
+
+def scan(txs, equals, ranges, text):
+    """Ids of the records matching every predicate, by brute force."""
+    matches = []
+    for tx in txs:
+        if any(tx.get(field) != value and str(tx.get(field)) != value for field, value in equals.items()):
+            continue
+        keys = {"amount": tx["amount"], "timestamp": to_epoch(tx["timestamp"])}
+        if any(keys[field] is None or (low is not None and keys[field] < low)
+               or (high is not None and keys[field] > high)
+               for field, (low, high) in ranges.items()):
+            continue
+        if text is not None:
+            terms = tokenize(tx["description"])
+            if not all(any(term.startswith(word) or (len(word) > 2 and word in term) for term in terms)
+                       for word in tokenize(text)):
+                continue
+        matches.append(tx)
+    return matches
+
+
+def random_query(rng):
+    equals = {}
+    if rng.random() < 0.6:
+        equals["sender"] = rng.choice(SENDERS)
+    if rng.random() < 0.3:
+        equals["transaction_type"] = rng.choice(TYPES)
+    if rng.random() < 0.3:
+        equals["currency"] = rng.choice(CURRENCIES)
+    if rng.random() < 0.2:
+        # non-indexed field compared as query-string text
+        equals["fee"] = rng.choice(["0", "50", "100"])
+    ranges = {}
+    if rng.random() < 0.5:
+        low = rng.randrange(0, 4000)
+        ranges["amount"] = (low if rng.random() < 0.8 else None, low + rng.randrange(0, 3000))
+    if rng.random() < 0.5:
+        month = rng.randint(1, 8)
+        ranges["timestamp"] = (to_epoch(f"2024-0{month}-01T00:00:00"),
+                               to_epoch(f"2024-0{month + 1}-15T00:00:00") if rng.random() < 0.8 else None)
+    text = None
+    if rng.random() < 0.3:
+        text = " ".join(rng.sample(["air", "bundle", "cash", "pay", "rec", "mo"], rng.randint(1, 2)))
+    return equals, ranges, text
+
+
+def pages(index, equals, ranges, text, order, limit):
+    ids = []
+    after = None
+    while True:
+        results, plan = index.query(equals, ranges, order=order, after=after, limit=limit, text=text)
+        ids.extend(tx["id"] for tx in results)
+        if not plan["has_more"]:
+            return ids
+        assert len(results) == limit
+        after = plan["next_after"]
+
+
+@pytest.mark.parametrize("vectorize", [False, True])
+def test_planner_matches_a_linear_scan(vectorize):
+    txs = records(3000)
+    index = TransactionIndex(txs)
+    index.vectorize = vectorize and index.vectorize
+    rng = random.Random(11)
+    for _ in range(150):
+        equals, ranges, text = random_query(rng)
+        expected = scan(txs, equals, ranges, text)
+        by_id = [tx["id"] for tx in expected]
+        # records without a time come last, by id
+        epochs = {tx["id"]: to_epoch(tx["timestamp"]) for tx in expected}
+        by_time = sorted(epochs, key=lambda tx_id: (epochs[tx_id] is None, epochs[tx_id] or 0, tx_id))
+        query = (equals, ranges, text)
+
+        assert [tx["id"] for tx in index.query(*query[:2], text=text)[0]] == by_id, query
+        assert pages(index, *query, "id", 37) == by_id, query
+        assert pages(index, *query, "timestamp", 53) == by_time, query
+        if text is not None:
+            ranked = pages(index, *query, "relevance", 41)
+            assert sorted(ranked) == by_id, query
+
+
+def test_planner_follows_writes():
+    txs = records(500, seed=3)
+    index = TransactionIndex(txs)
+    rng = random.Random(5)
+    for tx in rng.sample(txs, 100):
+        index.remove(tx["id"])
+        txs.remove(tx)
+    for tx in rng.sample(txs, 100):
+        changes = {"sender": rng.choice(SENDERS), "amount": rng.randrange(0, 5000)}
+        index.update(tx["id"], changes)
+        tx.update(changes)
+    added = records(600, seed=4)[500:]
+    index.add_many(added)
+    txs.extend(added)
+    for _ in range(100):
+        equals, ranges, text = random_query(rng)
+        expected = [tx["id"] for tx in scan(txs, equals, ranges, text)]
+        assert pages(index, equals, ranges, text, "id", 29) == expected, (equals, ranges, text)
+        assert sorted(pages(index, equals, ranges, text, "timestamp", 29)) == expected, (equals, ranges, text)
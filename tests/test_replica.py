@@ -0,0 +1,88 @@
+import json
+import random
+
+import pytest
+
+from db import ReplicaTransactionStore, SharedVersion, TransactionStore
+
+
+def record(amount, **fields):
+    tx = {"sender": "You", "receiver": "Jane Smith", "transaction_type": "money_transfer",
+          "amount": amount, "fee": 20, "timestamp": f"2024-05-{10 + amount % 18}T16:30:51",
+          "description": f"transfer {amount}"}
+    tx.update(fields)
+    return tx
+
+
+def state(store):
+    return store.transactions, store.index.totals(), store.index.balance(), store.version
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = tmp_path / "transactions.json"
+    path.write_text(json.dumps([dict(record(amount), id=amount) for amount in range(200)]))
+    shared = SharedVersion()
+    writer = TransactionStore(path)
+    writer.shared = shared
+    writer.load()
+    replica = ReplicaTransactionStore(path, shared)
+    replica.load()
+    yield writer, replica
+    replica.close()
+    writer.close()
+
+
+def test_a_replica_follows_writes_rotations_and_compactions(stores):
+    writer, replica = stores
+    assert state(replica) == state(writer)
+    rng = random.Random(3)
+    for step in range(300):
+        ids = [tx["id"] for tx in writer.transactions]
+        action = rng.random()
+        if action < 0.3:
+            writer.create(record(step))
+        elif action < 0.5:
+            writer.update(rng.choice(ids), {"amount": step, "receiver": "You"})
+        elif action < 0.6:
+            writer.delete(rng.choice(ids))
+        elif action < 0.7:
+            writer.create_many([record(step + i, receiver="You") for i in range(3)])
+        elif action < 0.8:
+            # rotates the journal, folds it into the data file and drops it
+            writer.compact()
+        if rng.random() < 0.3:
+            replica.refresh()
+            assert state(replica) == state(writer), step
+    replica.refresh()
+    assert state(replica) == state(writer)
+
+
+def test_a_replica_that_missed_whole_journal_files_loads_again(stores):
+    writer, replica = stores
+    writer.create(record(1))
+    writer.compact()
+    writer.create(record(2))
+    writer.compact()
+    writer.update(5, {"amount": 3})
+    assert replica.refresh()
+    assert state(replica) == state(writer)
+    assert not replica.refresh()
+
+
+def test_a_replica_reloads_a_data_file_changed_by_someone_else(stores):
+    writer, replica = stores
+    writer.create(record(1))
+    writer.compact()
+    data = json.loads(writer.path.read_text())[:50]
+    writer.path.write_text(json.dumps(data))
+    assert writer.refresh()
+    assert replica.refresh()
+    assert state(replica) == state(writer)
+    assert len(replica.transactions) == 50
+
+
+def test_a_replica_is_read_only(stores):
+    _, replica = stores
+    with pytest.raises(PermissionError):
+        replica.create(record(1))
@@ -0,0 +1,110 @@
+import json
+import random
+
+import pytest
+
+from db import TransactionStore
+from indexer import to_epoch
+
+PARTIES = ["You", "Jane Smith", "Samuel Carter", "Alex Doe"]
+TYPES = ["money_transfer", "money_received", "airtime_purchase", "bank_deposit"]
+WORDS = ["airtime", "bundle", "cashpower", "payment", "received", "momo"]
+
+
+def records(count, seed=1):
+    rng = random.Random(seed)
+    txs = []
+    for tx_id in range(count):
+        sender = rng.choice(PARTIES)
+        txs.append({"id": tx_id, "sender": sender,
+                    "receiver": "You" if sender != "You" else rng.choice(PARTIES[1:]),
+                    "transaction_type": rng.choice(TYPES), "amount": rng.randrange(100, 50000),
+                    "fee": rng.choice([0, 20, 100]), "balance": rng.randrange(0, 100000),
+                    "timestamp": f"2024-0{rng.randint(1, 9)}-{rng.randint(10, 28)}T{rng.randint(10, 23)}:00:00",
+                    "description": " ".join(rng.sample(WORDS, 2)) + f" {rng.randrange(100000, 999999)}"})
+    return txs
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "transactions.json"
+    path.write_text(json.dumps(records(1500)))
+    return path
+
+
+def open_store(path):
+    store = TransactionStore(path)
+    store.load()
+    return store
+
+
+def answers(store):
+    """What the endpoints read from the index, for a few representative requests."""
+    march, june = to_epoch("2024-03-01T00:00:00"), to_epoch("2024-06-30T00:00:00")
+    queries = [
+        ({"sender": "You"}, {}, None),
+        ({"transaction_type": "money_received"}, {"amount": (1000, 20000)}, None),
+        ({}, {"timestamp": (march, june)}, None),
+        ({}, {}, "airtime"),
+        ({"receiver": "You"}, {"timestamp": (march, None)}, "pay bundle"),
+    ]
+    return {
+        "transactions": store.transactions,
+        "queries": [[tx["id"] for tx in store.query(equals, ranges, order, text=text)[0]]
+                    for equals, ranges, text in queries for order in ("id", "timestamp")],
+        "stats": [store.stats(group_by) for group_by in ("sender", "transaction_type")],
+        "filtered_stats": store.stats("sender", {"transaction_type": "money_transfer"}),
+        "balance": [store.balance(), store.balance(march, june)],
+        "next_id": store.next_id,
+    }
+
+
+def test_an_index_opened_from_the_snapshot_answers_like_a_parsed_one(data_file):
+    parsed = open_store(data_file)
+    assert parsed.index.snapshot_loads == 0
+    assert parsed.save_snapshot()
+    loaded = open_store(data_file)
+    assert loaded.index.snapshot_loads == 1
+    assert answers(loaded) == answers(parsed)
+
+    # and both keep answering alike after the same writes
+    for store in (parsed, loaded):
+        store.create({"sender": "You", "receiver": "Jane Smith", "transaction_type": "money_transfer",
+                      "amount": 700, "timestamp": "2024-05-12T19:23:50", "description": "airtime payment"})
+        store.update(3, {"amount": 1})
+        store.delete(4)
+    assert answers(loaded) == answers(parsed)
+    parsed.close()
+    loaded.close()
+
+
+def test_a_snapshot_of_an_older_data_file_is_not_used(data_file):
+    store = open_store(data_file)
+    assert store.save_snapshot()
+    store.close()
+    changed = records(1400, seed=2)
+    data_file.write_text(json.dumps(changed))
+
+    store = open_store(data_file)
+    assert store.index.snapshot_loads == 0
+    assert store.transactions == changed
+
+
+@pytest.mark.parametrize("damage", ["flip", "truncate", "empty"])
+def test_a_damaged_snapshot_falls_back_to_the_data_file(data_file, damage):
+    store = open_store(data_file)
+    assert store.save_snapshot()
+    expected = answers(store)
+    store.close()
+    snapshot = bytearray(store.snapshot_path.read_bytes())
+    if damage == "flip":
+        snapshot[len(snapshot) // 2] ^= 0xFF
+    elif damage == "truncate":
+        del snapshot[len(snapshot) // 2:]
+    else:
+        snapshot.clear()
+    store.snapshot_path.write_bytes(bytes(snapshot))
+
+    store = open_store(data_file)
+    assert store.index.snapshot_loads == 0
+    assert answers(store) == expected
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from db import SqliteTransactionStore
+from etl.load_db import load_sqlite
+
+
+def record(amount, **fields):
+    tx = {"sender": "You", "receiver": "Jane Smith", "transaction_type": "money_transfer",
+          "amount": amount, "timestamp": "2024-05-10T16:30:51", "description": f"transfer {amount}"}
+    tx.update(fields)
+    return tx
+
+
+@pytest.fixture
+def database(tmp_path):
+    return tmp_path / "transactions.db"
+
+
+def open_store(path):
+    store = SqliteTransactionStore(path)
+    store.load()
+    return store
+
+
+def rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT Transaction_id, Amount, Transaction_transaction_type FROM TRANSACTIONS "
+                            "ORDER BY Transaction_id").fetchall()
+
+
+def test_writes_are_stored_and_reloaded(database):
+    store = open_store(database)
+    assert store.transactions == []
+    first = store.create(record(100))["id"]
+    batch = [tx["id"] for tx in store.create_many([record(200), record(300, receiver="You")])]
+    assert store.update(batch[0], {"amount": 250})["amount"] == 250
+    assert store.delete(first)["amount"] == 100
+    assert store.update(first, {"amount": 1}) is None
+    expected = sorted(store.transactions, key=lambda tx: tx["id"])
+    store.close()
+
+    assert rows(database) == [(batch[0], 250, "2024-05-10T16:30:51"), (batch[1], 300, "2024-05-10T16:30:51")]
+    store = open_store(database)
+    assert store.transactions == expected
+    assert store.query({"receiver": "You"})[0][0]["id"] == batch[1]
+    # ids are not handed out twice after a restart
+    assert store.create(record(400))["id"] > batch[1]
+    store.close()
+
+
+def test_commits_of_another_connection_are_picked_up(database):
+    store = open_store(database)
+    store.create(record(100))
+    # the store's own commits do not make it reload
+    assert not store.refresh()
+
+    load_sqlite([[dict(record(500), id=10), dict(record(600), id="11"), record(700)]], str(database))
+    assert store.refresh()
+    assert [(tx["id"], tx["amount"]) for tx in store.transactions] == [(0, 100), (10, 500), (11, 600), (12, 700)]
+    assert not store.refresh()
+    assert store.create(record(800))["id"] == 13
+
+    # loading the same ids again replaces the rows rather than adding to them
+    load_sqlite([[dict(record(550), id=10)]], str(database))
+    assert store.refresh()
+    assert store.get(10)["amount"] == 550
+    assert len(store.transactions) == 5
+    store.close()
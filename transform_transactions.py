@@ -1,19 +1,38 @@
 # transform_transactions.py
+import hashlib
 import json
 import re
+from collections import Counter
 from datetime import datetime
 
+from etl.checkpoint import Checkpoint, default_path
+from etl.extract_details import SmsExtractor
+from parse_sms import read_ndjson
+
+
+# Amounts like "1,000 RWF" or "2000 RWF"; the lookbehind keeps a match
+# from starting inside a number ("*165*S*1700 RWF" is 1700, not 700)
+_AMOUNT = re.compile(r'(?<![\d,])(\d{1,3}(?:,\d{3})+|\d+)\s*RWF')
+_BALANCE = re.compile(r'new balance\s*:?\s*(\d[\d,]*)\s*RWF', re.IGNORECASE)
+_FEE = re.compile(r'fee (?:was|paid)\s*:?\s*(\d[\d,]*)\s*RWF', re.IGNORECASE)
+
 
 def extract_amount(body):
     """Extract amount in RWF from SMS body"""
-    # Pattern for amounts like "1,000 RWF" or "2000 RWF"
-    match = re.search(r'(\d{1,3}(?:,\d{3})*)\s*RWF', body)
-    if match:
-        return int(match.group(1).replace(',', ''))
-    
-    # Fallback pattern for amounts without commas
-    match = re.search(r'(\d+)\s*RWF', body)
-    return int(match.group(1)) if match else None
+    match = _AMOUNT.search(body)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def extract_balance(body):
+    """Extract the account balance after the transaction ("Your new balance: X RWF")"""
+    match = _BALANCE.search(body)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def extract_fee(body):
+    """Extract the fee charged ("Fee was: X RWF", "Fee paid: X RWF")"""
+    match = _FEE.search(body)
+    return int(match.group(1).replace(',', '')) if match else None
 
 
 def extract_parties(body, transaction_type):
@@ -165,6 +184,8 @@ def transform_sms_to_api_format(raw_sms):
             "id": str(index),
             "transaction_type": transaction_type,
             "amount": amount,
+            "fee": extract_fee(body),
+            "balance": extract_balance(body),
             "currency": "RWF",
             "sender": sender,
             "receiver": receiver,
@@ -178,6 +199,87 @@ def transform_sms_to_api_format(raw_sms):
     return api_ready_transactions
 
 
+_MONTHS = {
+    name: number for number, name in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1
+    )
+}
+
+
+def parse_timestamp_fast(readable_date):
+    """
+    parse_timestamp for the usual "10 May 2024 4:30:58 PM" layout without
+    strptime, which dominates the cost of a transform. Anything else falls
+    back to parse_timestamp, so the result is always the same.
+    """
+    try:
+        day, month, year, clock, meridiem = readable_date.split(" ")
+        hour, minute, second = clock.split(":")
+        hour = int(hour)
+        if not 1 <= hour <= 12 or meridiem not in ("AM", "PM"):
+            raise ValueError(readable_date)
+        hour = hour % 12 + (12 if meridiem == "PM" else 0)
+        return datetime(int(year), _MONTHS[month], int(day), hour, int(minute), int(second)).isoformat()
+    except (AttributeError, KeyError, ValueError):
+        return parse_timestamp(readable_date)
+
+
+def transaction_key(sms, txid):
+    """
+    Stable identity of the transaction an SMS reports, whatever its
+    position in a backup: "txid:<id>" from the TxId / Financial
+    Transaction Id in the body, or for messages without one (transfers,
+    deposits) "sms:<date>:<digest of the body>".
+    """
+    if txid:
+        return f"txid:{txid}"
+    digest = hashlib.blake2b(sms.get("body", "").encode("utf-8"), digest_size=8).hexdigest()
+    return f"sms:{sms.get('date')}:{digest}"
+
+
+def transform_sms_compiled(raw_sms, extractor=None, start=1, with_keys=False):
+    """
+    Transform SMS data to API-required format using the compiled rule engine.
+
+    Same output as transform_sms_to_api_format, but each body is lowercased
+    and scanned once and every pattern is precompiled (see
+    etl/extract_details.py and etl/sms_rules.json). `start` is the position
+    of the first message, so a chunk of a larger backup keeps its ids.
+    With `with_keys`, each transaction also gets its transaction_key as
+    "key", for the incremental ETL (etl/checkpoint.py) to assign ids by.
+    """
+    extractor = extractor or SmsExtractor()
+    api_ready_transactions = []
+
+    for index, sms in enumerate(raw_sms, start=start):
+        body = sms.get("body", "")
+
+        # None for non-financial messages, "other" types and bodies without an amount
+        details = extractor.extract(body)
+        if details is None:
+            continue
+
+        transaction = {
+            "id": str(index),
+            "transaction_type": details["transaction_type"],
+            "amount": details["amount"],
+            "fee": details["fee"],
+            "balance": details["balance"],
+            "currency": "RWF",
+            "sender": details["sender"],
+            "receiver": details["receiver"],
+            "timestamp": parse_timestamp_fast(sms.get("readable_date", "")),
+            "description": body[:150] + "..." if len(body) > 150 else body,
+            "original_sms_date": sms.get("readable_date")
+        }
+        if with_keys:
+            transaction["key"] = transaction_key(sms, details.get("txid"))
+
+        api_ready_transactions.append(transaction)
+
+    return api_ready_transactions
+
+
 def analyze_transactions(transactions):
     """Print analysis of the transformed transactions"""
     print("\n📊 Transaction Analysis:")
@@ -187,10 +289,7 @@ def analyze_transactions(transactions):
     print(f"Total transactions: {total_count}")
     
     # Count by type
-    type_counts = {}
-    for t in transactions:
-        t_type = t["transaction_type"]
-        type_counts[t_type] = type_counts.get(t_type, 0) + 1
+    type_counts = Counter(t["transaction_type"] for t in transactions)
     
     print("\nTransaction Types:")
     for t_type, count in sorted(type_counts.items()):
@@ -214,18 +313,27 @@ if __name__ == "__main__":
     print(" Transforming SMS data to API format...")
     
     try:
-        # Read raw SMS data created by parse_sms.py
-        with open("api_ready_transactions.json", "r", encoding="utf-8") as f:
-            raw_sms = json.load(f)
+        # Read raw SMS records written by parse_sms.py (NDJSON)
+        raw_sms = list(read_ndjson("raw_sms.ndjson"))
         
         print(f" Loaded {len(raw_sms)} raw SMS messages")
         
-        # Transform to API format
-        api_data = transform_sms_to_api_format(raw_sms)
+        # Transform to API format (compiled single-pass rule engine)
+        api_data = transform_sms_compiled(raw_sms, with_keys=True)
         
-        # Save API-ready data
-        with open("api_ready_transactions.json", "w", encoding="utf-8") as f:
-            json.dump(api_data, f, indent=2, ensure_ascii=False)
+        # Stable ids: a transaction keeps the id an earlier run gave its
+        # TxId (or date and body), so a re-run never reshuffles them and a
+        # message repeated in the backup is kept once (etl/checkpoint.py)
+        checkpoint = Checkpoint(default_path("api_ready_transactions.json"))
+        try:
+            api_data = list({tx["id"]: tx for tx in checkpoint.assign_ids(api_data)}.values())
+            
+            # Save API-ready data
+            with open("api_ready_transactions.json", "w", encoding="utf-8") as f:
+                json.dump(api_data, f, indent=2, ensure_ascii=False)
+            checkpoint.commit()
+        finally:
+            checkpoint.close()
         
         print(f" Created api_ready_transactions.json with {len(api_data)} transactions")
         
@@ -239,9 +347,9 @@ if __name__ == "__main__":
             print(json.dumps(api_data[0], indent=2))
         
     except FileNotFoundError:
-        print(" Error: api_ready_transactions.json not found!")
+        print(" Error: raw_sms.ndjson not found!")
         print("   Please run parse_sms.py first to create the file.")
     except json.JSONDecodeError:
-        print(" Error: api_ready_transactions.json contains invalid JSON!")
+        print(" Error: raw_sms.ndjson contains invalid JSON!")
     except Exception as e:
         print(f" Unexpected error: {str(e)}")
\ No newline at end of file